@@ -0,0 +1,76 @@
+# api/accounts.py
+"""
+Closing an account.
+
+Shares, balance rows and rollups point at their user with RESTRICT: a
+share that silently disappeared would leave its expense short and the
+group's balances no longer summing to zero. So an account is closed in
+one of three ways:
+
+- with money still owed either way, it can't be closed until settled;
+- with no expense history in groups it doesn't own, it is deleted (its
+  own groups go with it, as before);
+- otherwise it is retired: the login and personal data are wiped and it
+  leaves its groups, but the row stays so other members' ledgers still
+  add up. It shows up as "deleted-<id>" on old expenses.
+"""
+from django.db import transaction
+from django.db.models import F, RestrictedError
+
+from .avatars import delete_variant_files
+from .models import Group, GroupBalance, Profile
+
+
+class OpenBalance(Exception):
+    """The user still owes or is owed money in `groups`."""
+
+    def __init__(self, groups):
+        super().__init__("Settle up before deleting the account.")
+        self.groups = groups
+
+
+def open_balance_groups(user):
+    return list(
+        Group.objects.filter(
+            pk__in=GroupBalance.objects.filter(user=user).exclude(paid=F('owed')).values('group_id'),
+        ).order_by('name').values_list('name', flat=True)
+    )
+
+
+def delete_account(user):
+    """Delete or retire `user`; raises OpenBalance if they aren't settled up."""
+    groups = open_balance_groups(user)
+    if groups:
+        raise OpenBalance(groups)
+    try:
+        with transaction.atomic():
+            user.delete()
+        return 'deleted'
+    except RestrictedError:
+        retire_account(user)
+        return 'retired'
+
+
+@transaction.atomic
+def retire_account(user):
+    Group.objects.filter(owner=user).delete()
+    for group in user.circld_groups.all():
+        group.members.remove(user)
+
+    profile = Profile.objects.filter(user=user).first()
+    if profile is not None:
+        old_hash = profile.avatar_hash
+        if profile.avatar:
+            profile.avatar.delete(save=False)
+        profile.email_token = profile.pending_email = profile.avatar_hash = ''
+        profile.avatar_variants = {}
+        profile.save()
+        if old_hash:
+            transaction.on_commit(lambda: delete_variant_files(old_hash))
+
+    user.username   = f"deleted-{user.pk}"
+    user.email      = ''
+    user.first_name = user.last_name = ''
+    user.is_active  = user.is_staff = user.is_superuser = False
+    user.set_unusable_password()
+    user.save()
@@ -1,10 +1,14 @@
 # circld_backend/api/admin.py
 
+from django import forms
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as DjangoUserAdmin
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
-from .models import User, Group, Expense, Message
+from .balances import record_expense, remove_expense
+from .models import User, Group, Expense, ExpenseRollup, ExpenseShare, GroupBalance, Message, MessageArchive, OutboxEmail
+from .search import text_match, uses_fts
 
 # Customize the admin site titles:
 admin.site.site_header = "Circld Administration"
@@ -59,12 +63,58 @@ class GroupAdmin(admin.ModelAdmin):
 #
 # 3) Registering Expense
 #
+class ExpenseShareInline(admin.TabularInline):
+    model = ExpenseShare
+    extra = 0
+    can_delete = False
+    readonly_fields = ('user', 'amount')
+
+    def has_add_permission(self, request, obj=None):
+        # shares are derived from the expense; edit the expense instead
+        return False
+
+
+class ExpenseAdminForm(forms.ModelForm):
+    class Meta:
+        model = Expense
+        fields = '__all__'
+
+    def clean(self):
+        data  = super().clean()
+        group = data.get('group') or getattr(self.instance, 'group', None)
+        payer = data.get('paid_by')
+        if group is not None and payer is not None and not group.members.filter(pk=payer.pk).exists():
+            self.add_error('paid_by', "Not a member of this group.")
+        return data
+
+
 @admin.register(Expense)
 class ExpenseAdmin(admin.ModelAdmin):
-    list_display = ('id', 'group', 'paid_by', 'amount', 'created')
-    list_filter = ('group', 'paid_by', 'created')
+    form = ExpenseAdminForm
+    list_display = ('id', 'group', 'paid_by', 'amount', 'category', 'created')
+    list_filter = ('group', 'paid_by', 'category', 'created')
     search_fields = ('note', 'paid_by__username', 'group__name')
     readonly_fields = ('created',)
+    inlines = (ExpenseShareInline,)
+
+    def get_readonly_fields(self, request, obj=None):
+        # the shares and balances belong to the group's members; an
+        # expense can't move to another group
+        if obj is not None:
+            return self.readonly_fields + ('group',)
+        return self.readonly_fields
+
+    # Route writes through the balance helpers so the running
+    # GroupBalance rows move in the same transaction as the expense.
+    def save_model(self, request, obj, form, change):
+        record_expense(obj)
+
+    def delete_model(self, request, obj):
+        remove_expense(obj)
+
+    def delete_queryset(self, request, queryset):
+        for expense in queryset:
+            remove_expense(expense)
 
     # If you want to show “paid_by_username” instead of paid_by’s __str__:
     def paid_by_username(self, obj):
@@ -72,7 +122,35 @@ class ExpenseAdmin(admin.ModelAdmin):
     paid_by_username.short_description = 'Paid By'
 
 #
-# 4) Registering Message
+# 4) Registering GroupBalance (read-only; rebuilt with `manage.py rebuild_balances`)
+#
+@admin.register(GroupBalance)
+class GroupBalanceAdmin(admin.ModelAdmin):
+    list_display = ('group', 'user', 'paid', 'owed', 'balance')
+    list_filter = ('group',)
+    search_fields = ('user__username', 'group__name')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(ExpenseRollup)
+class ExpenseRollupAdmin(admin.ModelAdmin):
+    list_display = ('group', 'month', 'category', 'payer', 'total', 'count')
+    list_filter = ('group', 'month', 'category')
+    search_fields = ('payer__username', 'group__name')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+#
+# 5) Registering Message
 #
 @admin.register(Message)
 class MessageAdmin(admin.ModelAdmin):
@@ -81,7 +159,52 @@ class MessageAdmin(admin.ModelAdmin):
     search_fields = ('text', 'sender__username', 'group__name')
     readonly_fields = ('ts',)
 
+    def get_search_fields(self, request):
+        # text goes through the full-text index instead of a LIKE scan
+        if uses_fts():
+            return ('sender__username', 'group__name')
+        return self.search_fields
+
+    def get_search_results(self, request, queryset, search_term):
+        results, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        match = text_match(search_term) if uses_fts() else None
+        if match is not None:
+            results = results | queryset.filter(match)
+        return results, may_have_duplicates
+
     def snippet(self, obj):
         return (obj.text[:50] + '…') if len(obj.text) > 50 else obj.text
     snippet.short_description = 'Message Snippet'
 
+
+@admin.register(MessageArchive)
+class MessageArchiveAdmin(admin.ModelAdmin):
+    list_display = ('group', 'month', 'count', 'first_ts', 'last_ts', 'updated')
+    list_filter = ('month',)
+    search_fields = ('group__name',)
+    exclude = ('data',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+#
+# 6) Registering the email outbox
+#
+@admin.register(OutboxEmail)
+class OutboxEmailAdmin(admin.ModelAdmin):
+    list_display = ('id', 'subject', 'recipients', 'status', 'attempts', 'next_attempt_at', 'sent_at')
+    list_filter = ('status',)
+    search_fields = ('subject', 'recipients')
+    readonly_fields = ('created', 'sent_at', 'last_error')
+    actions = ['retry_now']
+
+    @admin.action(description='Retry selected emails now')
+    def retry_now(self, request, queryset):
+        queryset.exclude(status=OutboxEmail.SENT).update(
+            status=OutboxEmail.PENDING,
+            next_attempt_at=timezone.now(),
+        )
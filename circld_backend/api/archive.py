@@ -0,0 +1,169 @@
+# api/archive.py
+"""
+Cold storage for old chat messages.
+
+archive_messages() moves messages older than a cutoff out of api_message
+into MessageArchive rows, one per group and month, each holding that
+month's messages as zlib-compressed JSON. The hot table, its indexes and
+the search index (whose triggers see the deletes) then only cover recent
+chat.
+
+archived_page() reads them back for the message history pages (see
+MessageCursorPagination) and the plain full-history list as unsaved
+Message instances, so the usual serializer renders them.
+"""
+import datetime
+import json
+import zlib
+
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import Message, MessageArchive, touch_groups
+
+TS_FORMAT = '%Y-%m-%dT%H:%M:%S.%fZ'
+# ids per DELETE statement, well under SQLite's bound-parameter limit
+DELETE_BATCH = 500
+
+
+def month_start(when):
+    """Midnight on the first of `when`'s month in the site's timezone."""
+    local = timezone.localtime(when)
+    return local.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def next_month(start):
+    following = (start.replace(tzinfo=None) + datetime.timedelta(days=32)).replace(day=1)
+    return timezone.make_aware(following)
+
+
+def pack(rows):
+    """[[id, sender_id, text, ts], …] → compressed bytes."""
+    return zlib.compress(json.dumps(rows, separators=(',', ':')).encode(), 9)
+
+
+def unpack(data):
+    return json.loads(zlib.decompress(bytes(data)))
+
+
+def _row(message_id, sender_id, text, ts):
+    return [message_id, sender_id, text, ts.astimezone(datetime.timezone.utc).strftime(TS_FORMAT)]
+
+
+def _message(group_id, row):
+    message_id, sender_id, text, ts = row
+    ts = datetime.datetime.strptime(ts, TS_FORMAT).replace(tzinfo=datetime.timezone.utc)
+    return Message(id=message_id, group_id=group_id, sender_id=sender_id, text=text, ts=ts)
+
+
+def archive_messages(before, group_ids=None, dry_run=False):
+    """
+    Move every message older than `before` (all groups, or just
+    `group_ids`) into the archive, one group-month per transaction.
+    Returns (messages moved, archive chunks written).
+    """
+    old = Message.objects.filter(ts__lt=before)
+    if group_ids is not None:
+        old = old.filter(group_id__in=group_ids)
+    groups = sorted(set(old.values_list('group_id', flat=True).order_by()))
+
+    moved = chunks = 0
+    for group_id in groups:
+        pending = old.filter(group_id=group_id)
+        group_moved = 0
+        while True:
+            oldest = pending.order_by('ts', 'id').values_list('ts', flat=True).first()
+            if oldest is None:
+                break
+            start = month_start(oldest)
+            rows = [
+                _row(*values)
+                for values in pending.filter(ts__gte=start, ts__lt=next_month(start))
+                                     .order_by('ts', 'id')
+                                     .values_list('id', 'sender_id', 'text', 'ts')
+            ]
+            group_moved += len(rows)
+            chunks      += 1
+            if dry_run:
+                pending = pending.filter(ts__gte=next_month(start))
+                continue
+            _store_month(group_id, start.date(), rows)
+        moved += group_moved
+        if group_moved and not dry_run:
+            # cached history pages and ETags must not outlive the move
+            touch_groups(pk=group_id)
+    return moved, chunks
+
+
+def _store_month(group_id, month, rows):
+    with transaction.atomic():
+        archive = (
+            MessageArchive.objects
+                          .select_for_update()
+                          .filter(group_id=group_id, month=month)
+                          .first()
+        )
+        if archive is None:
+            archive = MessageArchive(group_id=group_id, month=month)
+            merged = rows
+        else:
+            # a later run adding the rest of a month it had only partly archived
+            seen = {row[0] for row in rows}
+            merged = [row for row in unpack(archive.data) if row[0] not in seen] + rows
+            merged.sort(key=lambda row: (row[3], row[0]))
+        archive.data     = pack(merged)
+        archive.count    = len(merged)
+        archive.first_ts = _message(group_id, merged[0]).ts
+        archive.last_ts  = _message(group_id, merged[-1]).ts
+        archive.save()
+
+        # straight DELETEs: Message's post_delete receivers would fire per row
+        ids = [row[0] for row in rows]
+        table = Message._meta.db_table
+        with connection.cursor() as cursor:
+            for i in range(0, len(ids), DELETE_BATCH):
+                batch = ids[i:i + DELETE_BATCH]
+                cursor.execute(
+                    f"DELETE FROM {table} WHERE id IN ({', '.join(['%s'] * len(batch))})",
+                    batch,
+                )
+
+
+def archived_page(group_id, position, descending, limit):
+    """
+    Up to `limit` (None: all) archived messages of the group strictly
+    after the keyset `position` ((ts, id), or None for the very start) in
+    the given direction, nearest first, with sender and profile attached.
+    """
+    chunks = MessageArchive.objects.filter(group_id=group_id)
+    if position is not None:
+        chunks = chunks.filter(**{'first_ts__lte' if descending else 'last_ts__gte': position[0]})
+    chunk_ids = chunks.order_by('-month' if descending else 'month').values_list('pk', flat=True)
+
+    found = []
+    for chunk_id in chunk_ids:
+        data = MessageArchive.objects.filter(pk=chunk_id).values_list('data', flat=True).first()
+        messages = [_message(group_id, row) for row in unpack(data)]
+        if position is not None:
+            key = tuple(position)
+            messages = [
+                m for m in messages
+                if ((m.ts, m.id) < key if descending else (m.ts, m.id) > key)
+            ]
+        messages.sort(key=lambda m: (m.ts, m.id), reverse=descending)
+        found.extend(messages)
+        # months don't overlap, so a full page can't improve with more chunks
+        if limit is not None and len(found) >= limit:
+            break
+    found = found[:limit]
+
+    senders = (
+        get_user_model().objects
+                        .select_related('profile')
+                        .in_bulk({m.sender_id for m in found if m.sender_id})
+    )
+    for message in found:
+        # a deleted sender shows as unknown, as SET_NULL does for hot rows
+        message.sender = senders.get(message.sender_id)
+    return found
@@ -1,6 +1,9 @@
 # login auth
 from django.contrib.auth.backends import ModelBackend
 from django.contrib.auth import get_user_model
+from django.db.models import Case, Q, Value, When
+
+from .models import lookup_key
 
 User = get_user_model()
 
@@ -12,16 +15,163 @@ class EmailOrUsernameBackend(ModelBackend):
     def authenticate(self, request, username=None, password=None, **kwargs):
         if username is None:
             username = kwargs.get(User.USERNAME_FIELD)
-        # Try to fetch by username
-        try:
-            user = User.objects.get(username__iexact=username)
-        except User.DoesNotExist:
-            # Fallback: try to fetch by email
-            try:
-                user = User.objects.get(email__iexact=username)
-            except User.DoesNotExist:
-                return None
+        if username is None or password is None:
+            return None
+
+        user = self.get_user_by_identifier(username)
+        if user is None:
+            # Run the hasher anyway so unknown logins take as long as bad passwords
+            User().set_password(password)
+            return None
         # Check password & that the user is active
         if user.check_password(password) and self.user_can_authenticate(user):
             return user
-        return None
\ No newline at end of file
+        return None
+
+    def get_user_by_identifier(self, identifier):
+        return self.identifier_lookup(identifier).first()
+
+    def identifier_lookup(self, identifier):
+        """
+        One query against the username_key / email_key indexes; a
+        username match wins over someone else's email.
+        """
+        ident = lookup_key(identifier)
+        return (
+            User.objects
+                .filter(Q(username_key=ident) | Q(email_key=ident))
+                .order_by(
+                    Case(When(username_key=ident, then=Value(0)), default=Value(1)),
+                    'id',
+                )
+        )
+
+
+# cached JWT auth
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, transaction
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from django.core.cache import cache
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+TOKEN_VERSION_CLAIM = 'ver'
+
+
+def user_cache_key(user_id, version):
+    return f"auth-user:{user_id}:{version}"
+
+
+def forget_cached_user(user):
+    # called from the User signals in models.py; also drop the previous
+    # version's entry in case token_version was just bumped. Again on
+    # commit, as forget_memberships does, so a request that reloads the
+    # user before the change commits can't leave the old row cached.
+    versions = {user.token_version, max(user.token_version - 1, 0)}
+    keys = [user_cache_key(user.pk, v) for v in versions]
+
+    def forget():
+        try:
+            cache.delete_many(keys)
+        except Exception:
+            pass
+
+    forget()
+    transaction.on_commit(forget)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that keeps the authenticated User in the shared cache
+    for AUTH_USER_CACHE_TIMEOUT seconds, keyed by user id and the token's
+    version claim, so steady-state polling costs no user query.
+
+    Tokens whose version no longer matches the user's token_version (e.g.
+    issued before a password reset) are rejected. Cache misses read the
+    user from the primary: a lagging replica could still hold the row
+    from before a reset or deactivation, which would then stay cached.
+    """
+
+    def get_user(self, validated_token):
+        user_id = validated_token.get(jwt_settings.USER_ID_CLAIM)
+        if user_id is None:
+            return super().get_user(validated_token)
+
+        version = validated_token.get(TOKEN_VERSION_CLAIM, 0)
+        key = user_cache_key(user_id, version)
+        try:
+            user = cache.get(key)
+        except Exception:
+            # a cache outage must not take authentication down with it
+            user = None
+        if user is not None:
+            return user
+
+        user = self.load_user(user_id, validated_token)
+        if user.token_version != version:
+            raise AuthenticationFailed("Token has been revoked.", code='token_revoked')
+        try:
+            cache.set(key, user, getattr(settings, 'AUTH_USER_CACHE_TIMEOUT', 60))
+        except Exception:
+            pass
+        return user
+
+    def load_user(self, user_id, validated_token):
+        # JWTAuthentication.get_user, but pinned to the primary
+        try:
+            user = self.user_model.objects.using(DEFAULT_DB_ALIAS).get(**{jwt_settings.USER_ID_FIELD: user_id})
+        except self.user_model.DoesNotExist:
+            raise AuthenticationFailed("User not found", code='user_not_found')
+        if jwt_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed("User is inactive", code='user_inactive')
+        if jwt_settings.CHECK_REVOKE_TOKEN and (
+            validated_token.get(jwt_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password)
+        ):
+            raise AuthenticationFailed("The user's password has been changed.", code='password_changed')
+        return user
+
+
+# websocket auth
+from urllib.parse import parse_qs
+
+from channels.db import database_sync_to_async
+from channels.middleware import BaseMiddleware
+from django.contrib.auth.models import AnonymousUser
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+
+
+@database_sync_to_async
+def get_user_for_token(raw_token):
+    auth = CachedJWTAuthentication()
+    try:
+        validated = auth.get_validated_token(raw_token)
+        return auth.get_user(validated)
+    except (InvalidToken, TokenError, AuthenticationFailed):
+        return AnonymousUser()
+
+
+class JWTAuthMiddleware(BaseMiddleware):
+    """
+    Populate scope["user"] for websocket connections from a simplejwt access
+    token, passed either as `?token=<access>` or as an
+    `Authorization: Bearer <access>` header.
+    """
+
+    async def __call__(self, scope, receive, send):
+        scope = dict(scope)
+        token = self.get_raw_token(scope)
+        scope['user'] = await get_user_for_token(token) if token else AnonymousUser()
+        return await super().__call__(scope, receive, send)
+
+    @staticmethod
+    def get_raw_token(scope):
+        query = parse_qs(scope.get('query_string', b'').decode())
+        if query.get('token'):
+            return query['token'][0]
+        for name, value in scope.get('headers', []):
+            if name == b'authorization':
+                parts = value.decode().split()
+                if len(parts) == 2 and parts[0].lower() == 'bearer':
+                    return parts[1]
+        return None
@@ -0,0 +1,168 @@
+# api/avatars.py
+"""
+Avatar thumbnails.
+
+An upload is stored as-is under avatars/; right after the request commits,
+a background thread renders square sm/md/lg variants in WebP and JPEG.
+Variant names carry a hash of the source bytes, so a URL never changes
+meaning and can be cached forever. Until the variants exist (or if
+rendering fails) the serializers fall back to the original upload.
+"""
+import hashlib
+import io
+import logging
+import threading
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from PIL import Image, ImageOps
+
+from .models import Profile, touch_groups
+
+logger = logging.getLogger(__name__)
+
+# edge length in pixels; sm for chat bubbles, md for member lists, lg for profiles
+SIZES = {
+    'sm': 64,
+    'md': 160,
+    'lg': 512,
+}
+FORMATS = {
+    'webp': {'format': 'WEBP', 'quality': 80, 'method': 6},
+    'jpeg': {'format': 'JPEG', 'quality': 82, 'optimize': True, 'progressive': True},
+}
+DEFAULT_FORMAT = 'webp'
+VARIANT_DIR    = 'avatars/v'
+
+
+def content_hash(fileobj):
+    digest = hashlib.sha256()
+    fileobj.seek(0)
+    for chunk in iter(lambda: fileobj.read(64 * 1024), b''):
+        digest.update(chunk)
+    fileobj.seek(0)
+    return digest.hexdigest()[:20]
+
+
+def render_variants(fileobj):
+    """{size: {fmt: bytes}} for an uploaded image file."""
+    image = Image.open(fileobj)
+    # let the JPEG decoder downscale while decoding big camera photos
+    image.draft('RGB', (SIZES['lg'] * 2, SIZES['lg'] * 2))
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+
+    rendered = {}
+    for size, edge in SIZES.items():
+        square = ImageOps.fit(image, (edge, edge), Image.Resampling.LANCZOS)
+        rendered[size] = {}
+        for fmt, options in FORMATS.items():
+            frame = square
+            if fmt == 'jpeg' and frame.mode == 'RGBA':
+                # JPEG has no alpha: flatten onto white
+                background = Image.new('RGB', frame.size, (255, 255, 255))
+                background.paste(frame, mask=frame.getchannel('A'))
+                frame = background
+            out = io.BytesIO()
+            frame.save(out, **options)
+            rendered[size][fmt] = out.getvalue()
+    return rendered
+
+
+def build_variants(profile):
+    """
+    Render and store the variants of `profile.avatar` and record them on
+    the profile. Returns False if the avatar changed (or vanished) in the
+    meantime, in which case nothing is recorded.
+    """
+    name = profile.avatar.name if profile.avatar else ''
+    if not name:
+        return False
+
+    with profile.avatar.open('rb') as source:
+        digest = content_hash(source)
+        rendered = render_variants(source)
+
+    variants = {}
+    for size, formats in rendered.items():
+        variants[size] = {}
+        for fmt, data in formats.items():
+            path = f"{VARIANT_DIR}/{digest}-{size}.{fmt}"
+            # same content → same name, so an existing file is already right
+            if not default_storage.exists(path):
+                path = default_storage.save(path, ContentFile(data))
+            variants[size][fmt] = path
+
+    old_hash = profile.avatar_hash
+    updated = Profile.objects.filter(pk=profile.pk, avatar=name).update(
+        avatar_hash=digest,
+        avatar_variants=variants,
+    )
+    if not updated:
+        return False
+    profile.avatar_hash, profile.avatar_variants = digest, variants
+    if old_hash and old_hash != digest:
+        delete_variant_files(old_hash)
+    # member lists and chat payloads now carry different URLs
+    touch_groups(members=profile.user_id)
+    return True
+
+
+def delete_variant_files(digest):
+    # identical uploads share files; keep them while anyone still uses them
+    if Profile.objects.filter(avatar_hash=digest).exists():
+        return
+    for size in SIZES:
+        for fmt in FORMATS:
+            path = f"{VARIANT_DIR}/{digest}-{size}.{fmt}"
+            try:
+                default_storage.delete(path)
+            except Exception:
+                logger.warning("Could not delete avatar variant %s", path)
+
+
+def schedule_variants(profile):
+    """
+    Build the variants in a background thread once the upload commits.
+    The thread isn't a daemon, so a worker that is shutting down finishes
+    the variants it started instead of leaving half-written files; any
+    that still go missing are picked up by `manage.py build_avatar_variants`.
+    """
+    profile_id = profile.pk
+
+    def run():
+        try:
+            fresh = Profile.objects.filter(pk=profile_id).first()
+            if fresh is not None:
+                build_variants(fresh)
+        except Exception:
+            logger.exception("Could not build avatar variants for profile %s", profile_id)
+        finally:
+            # no request cycle closes this thread's connection for it
+            connection.close()
+
+    transaction.on_commit(
+        lambda: threading.Thread(target=run, name=f'avatar-variants-{profile_id}').start()
+    )
+
+
+def avatar_url(profile, size, request=None):
+    """
+    URL of the `size` variant in the format the client asked for
+    (`?avatar_format=jpeg|webp`, WebP by default), falling back to the
+    original upload while variants are pending.
+    """
+    if profile is None or not profile.avatar:
+        return None
+
+    fmt = DEFAULT_FORMAT
+    if request is not None:
+        asked = request.GET.get('avatar_format') if hasattr(request, 'GET') else None
+        if asked in FORMATS:
+            fmt = asked
+
+    path = (profile.avatar_variants or {}).get(size, {}).get(fmt)
+    url  = default_storage.url(path) if path else profile.avatar.url
+    return request.build_absolute_uri(url) if request else url
@@ -0,0 +1,418 @@
+# api/balances.py
+"""
+Who owes whom inside a group.
+
+An expense credits its payer with the full amount and debits every member
+it is split between with their share; a member's balance is
+paid - owed (positive → the group owes them).
+
+Every expense write also moves the (group, month, category, payer) spend
+rollups that the analytics endpoint reads.
+"""
+import heapq
+import operator
+from decimal import Decimal
+from functools import reduce
+
+from django.db import transaction
+from django.db.models import (
+    Case, Count, DateField, DecimalField, Exists, F, OuterRef, Q, Subquery, Sum, Value, When,
+)
+from django.db.models.functions import Coalesce, TruncMonth
+from django.utils import timezone
+
+from .models import Expense, ExpenseRollup, ExpenseShare, GroupBalance, User
+
+CENT = Decimal('0.01')
+ZERO = Decimal('0.00')
+# rows per UPDATE in _add_in_place; each costs a WHEN per moved column
+SHIFT_BATCH = 200
+
+
+def split_amount(amount, count):
+    """
+    Split `amount` into `count` parts that differ by at most one cent and
+    add back up to exactly `amount`; the leftover cents go to the first
+    parts, so callers should pass participants in a stable order.
+    """
+    if count <= 0:
+        raise ValueError("count must be positive")
+    cents = int(Decimal(amount).quantize(CENT) * 100)
+    base, extra = divmod(cents, count)
+    return [Decimal(base + (1 if i < extra else 0)) / 100 for i in range(count)]
+
+
+def allocate_shares(expense, users):
+    """
+    Replace the expense's shares with an even, cent-exact split between
+    `users` (user instances or ids).
+    """
+    user_ids = sorted({getattr(u, 'pk', u) for u in users})
+    with transaction.atomic():
+        ExpenseShare.objects.filter(expense=expense).delete()
+        ExpenseShare.objects.bulk_create([
+            ExpenseShare(expense=expense, user_id=uid, amount=part)
+            for uid, part in zip(user_ids, split_amount(expense.amount, len(user_ids)))
+        ])
+
+
+# --- running balances -------------------------------------------------------
+
+def record_expense(expense, split_between=None):
+    """
+    Save `expense`, (re)split it and move the group's running balances by
+    the difference, all in one transaction. `split_between=None` keeps the
+    people it was already split between (or every member for a new one).
+    """
+    with transaction.atomic():
+        before = _stored_row(expense.pk) if expense.pk else None
+        # read the old shares now, before allocate_shares replaces them
+        before_balances, before_rollups = _stored_effect(before), _rollup_effect(before)
+        if split_between is None and expense.pk:
+            split_between = list(expense.shares.values_list('user_id', flat=True))
+        expense.save()
+        if not split_between:
+            split_between = expense.group.members.values_list('id', flat=True)
+        allocate_shares(expense, split_between)
+        after = _stored_row(expense.pk)
+        _shift_balances(_diff(_stored_effect(after), before_balances))
+        _shift_rollups(_diff(_rollup_effect(after), before_rollups))
+    return expense
+
+
+def record_expenses_bulk(items, batch_size=500):
+    """
+    Insert many new expenses at once: `items` is a list of
+    (unsaved Expense, [user ids to split between]). One bulk insert for the
+    expenses, one for their shares and one balance update per member —
+    call inside a transaction.
+    """
+    if not items:
+        return []
+    expenses = Expense.objects.bulk_create([expense for expense, _ in items], batch_size=batch_size)
+
+    shares, deltas, rollups = [], {}, {}
+    for expense, user_ids in items:
+        user_ids = sorted(set(user_ids))
+        if expense.paid_by_id is not None:
+            paid, owed = deltas.get((expense.group_id, expense.paid_by_id), (ZERO, ZERO))
+            deltas[(expense.group_id, expense.paid_by_id)] = (paid + expense.amount, owed)
+        bucket = (expense.group_id, rollup_month(expense.created), expense.category, expense.paid_by_id)
+        total, count = rollups.get(bucket, (ZERO, 0))
+        rollups[bucket] = (total + expense.amount, count + 1)
+        for uid, part in zip(user_ids, split_amount(expense.amount, len(user_ids))):
+            shares.append(ExpenseShare(expense=expense, user_id=uid, amount=part))
+            paid, owed = deltas.get((expense.group_id, uid), (ZERO, ZERO))
+            deltas[(expense.group_id, uid)] = (paid, owed + part)
+    ExpenseShare.objects.bulk_create(shares, batch_size=batch_size)
+    _shift_balances(deltas)
+    _shift_rollups(rollups)
+    return expenses
+
+
+def remove_expense(expense):
+    """Delete `expense` and take it back out of the running balances."""
+    with transaction.atomic():
+        before = _stored_row(expense.pk)
+        balances, rollups = _stored_effect(before), _rollup_effect(before)
+        expense.delete()
+        _shift_balances(_diff({}, balances))
+        _shift_rollups(_diff({}, rollups))
+
+
+def rollup_month(when):
+    """First day of `when`'s month in the site's timezone."""
+    return timezone.localtime(when).date().replace(day=1)
+
+
+def _stored_row(expense_id):
+    return (
+        Expense.objects
+               .filter(pk=expense_id)
+               .values('id', 'group_id', 'paid_by_id', 'amount', 'category', 'created')
+               .first()
+    )
+
+
+def _stored_effect(row):
+    """
+    {(group_id, user_id): (paid, owed)} for the expense as it is currently
+    stored (`row` from _stored_row), i.e. what it contributes to the
+    running balances.
+    """
+    effect = {}
+    if row is None:
+        return effect
+    if row['paid_by_id'] is not None:
+        effect[(row['group_id'], row['paid_by_id'])] = (row['amount'], ZERO)
+    for uid, amount in ExpenseShare.objects.filter(expense_id=row['id']).values_list('user_id', 'amount'):
+        paid, _ = effect.get((row['group_id'], uid), (ZERO, ZERO))
+        effect[(row['group_id'], uid)] = (paid, amount)
+    return effect
+
+
+def _rollup_effect(row):
+    """
+    {(group_id, month, category, payer_id): (total, count)} for a stored
+    expense; payer_id is None for an expense nobody is recorded as paying.
+    """
+    if row is None:
+        return {}
+    bucket = (row['group_id'], rollup_month(row['created']), row['category'], row['paid_by_id'])
+    return {bucket: (row['amount'], 1)}
+
+
+def _diff(after, before):
+    deltas = {}
+    for key in after.keys() | before.keys():
+        paid_after, owed_after   = after.get(key, (ZERO, ZERO))
+        paid_before, owed_before = before.get(key, (ZERO, ZERO))
+        delta = (paid_after - paid_before, owed_after - owed_before)
+        if any(delta):
+            deltas[key] = delta
+    return deltas
+
+
+def _add_in_place(model, deltas, keys, columns):
+    """
+    Add `deltas` ({key values: column deltas}) onto existing `model` rows,
+    SHIFT_BATCH rows per UPDATE: column = column + CASE <row> THEN <delta>.
+    Like one F() update per row, concurrent writers add up instead of
+    overwriting each other, without a statement per row.
+    """
+    items = list(deltas.items())
+    for i in range(0, len(items), SHIFT_BATCH):
+        batch   = items[i:i + SHIFT_BATCH]
+        matches = [Q(**dict(zip(keys, key))) for key, _ in batch]
+        model.objects.filter(reduce(operator.or_, matches)).update(**{
+            column: F(column) + Case(
+                *[When(match, then=Value(values[n])) for match, (_, values) in zip(matches, batch)],
+                default=Value(0),
+                output_field=model._meta.get_field(column),
+            )
+            for n, column in enumerate(columns)
+        })
+
+
+def _shift_balances(deltas):
+    if not deltas:
+        return
+    # make sure every row exists, then move them all in place
+    GroupBalance.objects.bulk_create(
+        [GroupBalance(group_id=gid, user_id=uid) for gid, uid in deltas],
+        ignore_conflicts=True,
+    )
+    _add_in_place(GroupBalance, deltas, ('group_id', 'user_id'), ('paid', 'owed'))
+
+
+def _shift_rollups(deltas):
+    if not deltas:
+        return
+    ExpenseRollup.objects.bulk_create(
+        [
+            ExpenseRollup(group_id=gid, month=month, category=category, payer_id=payer)
+            for gid, month, category, payer in deltas
+        ],
+        ignore_conflicts=True,
+    )
+    _add_in_place(
+        ExpenseRollup,
+        {key: (total, int(count)) for key, (total, count) in deltas.items()},
+        ('group_id', 'month', 'category', 'payer_id'),
+        ('total', 'count'),
+    )
+    # buckets whose last expense went away (or moved to another bucket)
+    if any(count < 0 for _, count in deltas.values()):
+        ExpenseRollup.objects.filter(
+            group_id__in={gid for gid, *_ in deltas}, count__lte=0,
+        ).delete()
+
+
+def rebuild_group_balances(group_ids=None):
+    """
+    Recompute the running balances from scratch (all groups, or just
+    `group_ids`). Returns the number of balance rows written.
+    """
+    expenses = Expense.objects.filter(paid_by__isnull=False)
+    shares   = ExpenseShare.objects.all()
+    if group_ids is not None:
+        expenses = expenses.filter(group_id__in=group_ids)
+        shares   = shares.filter(expense__group_id__in=group_ids)
+
+    totals = {}
+    for row in expenses.values('group_id', 'paid_by_id').annotate(total=Sum('amount')):
+        totals[(row['group_id'], row['paid_by_id'])] = [row['total'], ZERO]
+    for row in shares.values('expense__group_id', 'user_id').annotate(total=Sum('amount')):
+        totals.setdefault((row['expense__group_id'], row['user_id']), [ZERO, ZERO])[1] = row['total']
+
+    with transaction.atomic():
+        stale = GroupBalance.objects.all()
+        if group_ids is not None:
+            stale = stale.filter(group_id__in=group_ids)
+        stale.delete()
+        GroupBalance.objects.bulk_create(
+            [
+                GroupBalance(group_id=gid, user_id=uid, paid=paid, owed=owed)
+                for (gid, uid), (paid, owed) in totals.items()
+            ],
+            batch_size=1000,
+        )
+    return len(totals)
+
+
+def rebuild_expense_rollups(group_ids=None):
+    """
+    Recompute the spend rollups from the expense table (all groups, or
+    just `group_ids`). Returns the number of buckets written.
+    """
+    expenses = Expense.objects.all()
+    if group_ids is not None:
+        expenses = expenses.filter(group_id__in=group_ids)
+    rows = (
+        expenses.annotate(month=TruncMonth('created', output_field=DateField()))
+                .values('group_id', 'month', 'category', 'paid_by_id')
+                .annotate(total=Sum('amount'), count=Count('id'))
+                .order_by()
+    )
+    with transaction.atomic():
+        stale = ExpenseRollup.objects.all()
+        if group_ids is not None:
+            stale = stale.filter(group_id__in=group_ids)
+        stale.delete()
+        created = ExpenseRollup.objects.bulk_create(
+            [
+                ExpenseRollup(
+                    group_id=row['group_id'],
+                    month=row['month'],
+                    category=row['category'],
+                    payer_id=row['paid_by_id'],
+                    total=row['total'],
+                    count=row['count'],
+                )
+                for row in rows.iterator()
+            ],
+            batch_size=1000,
+        )
+    return len(created)
+
+
+def group_balances(group):
+    """
+    Net balance of every member, plus anyone who left or was removed with
+    a balance still open, read from the running balance table in one
+    query. Without the departed, the balances wouldn't sum to zero and
+    settle-up couldn't see who still owes.
+    """
+    money   = DecimalField(max_digits=12, decimal_places=2)
+    running = GroupBalance.objects.filter(group=group, user=OuterRef('pk'))
+    members = group.members.through.objects.filter(group=group)
+    unsettled = GroupBalance.objects.filter(group=group).exclude(paid=F('owed'))
+    rows = (
+        User.objects
+             .filter(Q(pk__in=members.values('user_id')) | Q(pk__in=unsettled.values('user_id')))
+             .annotate(
+                 paid=Coalesce(Subquery(running.values('paid')[:1]), Value(ZERO), output_field=money),
+                 owed=Coalesce(Subquery(running.values('owed')[:1]), Value(ZERO), output_field=money),
+                 member=Exists(members.filter(user_id=OuterRef('pk'))),
+             )
+             .order_by('id')
+             .values('id', 'username', 'first_name', 'last_name', 'paid', 'owed', 'member')
+    )
+    return [
+        {
+            'user_id':  row['id'],
+            'username': row['username'],
+            'name':     f"{row['first_name']} {row['last_name']}".strip() or row['username'],
+            'member':   row['member'],
+            'paid':     Decimal(row['paid']).quantize(CENT),
+            'owed':     Decimal(row['owed']).quantize(CENT),
+            'balance':  (Decimal(row['paid']) - Decimal(row['owed'])).quantize(CENT),
+        }
+        for row in rows
+    ]
+
+
+# --- settling up -----------------------------------------------------------
+
+# exact minimization is O(2^n · n) in the number of non-zero balances
+EXACT_SETTLE_LIMIT = 12
+
+
+def settle_up(balances, exact=False):
+    """
+    Transfers `(debtor_id, creditor_id, amount)` that bring every balance
+    in `{user_id: balance}` to zero.
+
+    The greedy plan repeatedly pays the largest creditor from the largest
+    debtor, which needs at most n - 1 transfers and runs in O(n log n).
+    With `exact=True` (and at most EXACT_SETTLE_LIMIT people owing or
+    owed) the members are first partitioned into the largest possible
+    number of zero-sum circles, which gives the minimum number of
+    transfers; each circle is then settled greedily.
+    """
+    cents = {uid: int(Decimal(b).quantize(CENT) * 100) for uid, b in balances.items()}
+    cents = {uid: c for uid, c in cents.items() if c}
+    if exact and len(cents) <= EXACT_SETTLE_LIMIT:
+        circles = _zero_sum_circles(sorted(cents.items()))
+    else:
+        circles = [sorted(cents.items())]
+
+    plan = []
+    for circle in circles:
+        plan.extend(_greedy_transfers(circle))
+    return [(debtor, creditor, Decimal(amount) / 100) for debtor, creditor, amount in plan]
+
+
+def _greedy_transfers(items):
+    creditors = [(-c, uid) for uid, c in items if c > 0]
+    debtors   = [(c, uid) for uid, c in items if c < 0]
+    heapq.heapify(creditors)
+    heapq.heapify(debtors)
+
+    transfers = []
+    while creditors and debtors:
+        credit, creditor = heapq.heappop(creditors)
+        debt, debtor     = heapq.heappop(debtors)
+        amount = min(-credit, -debt)
+        transfers.append((debtor, creditor, amount))
+        if -credit > amount:
+            heapq.heappush(creditors, (credit + amount, creditor))
+        if -debt > amount:
+            heapq.heappush(debtors, (debt + amount, debtor))
+    return transfers
+
+
+def _zero_sum_circles(items):
+    """
+    Partition `items` into the maximum number of zero-sum subsets: a circle
+    of k people always settles in k - 1 transfers, so more circles means
+    fewer transfers overall.
+    """
+    n = len(items)
+    full = (1 << n) - 1
+    total = [0] * (1 << n)
+    best  = [0] * (1 << n)
+    for mask in range(1, full + 1):
+        low = mask & -mask
+        i = low.bit_length() - 1
+        total[mask] = total[mask ^ low] + items[i][1]
+        best[mask] = max(best[mask ^ (1 << j)] for j in range(n) if mask >> j & 1)
+        if total[mask] == 0:
+            best[mask] += 1
+
+    # walk back from the full set; every zero-sum prefix closes a circle
+    circles, current, mask = [], [], full
+    while mask:
+        for j in range(n):
+            if mask >> j & 1:
+                rest = mask ^ (1 << j)
+                if best[rest] + (total[mask] == 0) == best[mask]:
+                    break
+        if total[mask] == 0 and current:
+            circles.append(current)
+            current = []
+        current.append(items[j])
+        mask = rest
+    if current:
+        circles.append(current)
+    return circles
@@ -0,0 +1,45 @@
+# api/conditional.py
+import hashlib
+import time
+
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+
+def make_etag(*parts):
+    digest = hashlib.sha1(repr(parts).encode()).hexdigest()[:32]
+    return f'W/"{digest}"'
+
+
+class ConditionalGetMixin:
+    """
+    Answer polled GETs with `304 Not Modified` when the client's
+    If-None-Match / If-Modified-Since still matches, before any
+    serialization happens. Views compute the validators from
+    Group.updated, which the model signals keep current.
+    """
+
+    def conditional_response(self, request, etag, last_modified, build):
+        """
+        `build` is only called when the client's copy is stale.
+        `last_modified` is a datetime (or None).
+
+        HTTP dates only have whole seconds, so a write later in the same
+        second as `last_modified` would still look unmodified. Last-Modified
+        is therefore only sent (and If-Modified-Since only honoured) once
+        that second is over; until then the ETag alone decides. Django
+        already ignores If-Modified-Since when If-None-Match is present.
+        """
+        timestamp = int(last_modified.timestamp()) if last_modified else None
+        if timestamp is not None and timestamp + 1 > time.time():
+            timestamp = None
+        response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+        if response is None:
+            response = build()
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            if timestamp is not None:
+                response['Last-Modified'] = http_date(timestamp)
+            # always revalidate: the payload depends on who is asking
+            patch_cache_control(response, private=True, no_cache=True)
+        return response
@@ -0,0 +1,134 @@
+# api/consumers.py
+import logging
+
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+from channels.layers import get_channel_layer
+from django.db import transaction
+
+from .membership import group_ids_for
+from .models import Message
+from .serializers import MessageSerializer
+
+logger = logging.getLogger(__name__)
+
+
+def group_channel_name(group_id):
+    return f"chat_{group_id}"
+
+
+def broadcast_message(payload, group_id):
+    """
+    Fan a serialized message out to every socket in the group, once the
+    surrounding transaction commits. A missing/unreachable channel layer
+    must never fail the write that triggered it — pollers still see it.
+    """
+    def send():
+        layer = get_channel_layer()
+        if layer is None:
+            return
+        try:
+            async_to_sync(layer.group_send)(
+                group_channel_name(group_id),
+                {"type": "chat.message", "message": dict(payload)},
+            )
+        except Exception:
+            logger.exception("Could not broadcast message to group %s", group_id)
+
+    transaction.on_commit(send)
+
+
+class _ScopeRequest:
+    """
+    Just enough of a request for MessageSerializer to build absolute
+    avatar URLs from the websocket handshake's Host header.
+    """
+
+    def __init__(self, scope):
+        headers = dict(scope.get('headers', []))
+        self.host   = headers.get(b'host', b'').decode()
+        self.scheme = 'https' if scope.get('scheme') == 'wss' else 'http'
+
+    def build_absolute_uri(self, location):
+        if not self.host:
+            return location
+        return f"{self.scheme}://{self.host}{location}"
+
+
+class GroupChatConsumer(AsyncJsonWebsocketConsumer):
+    """
+    ws/groups/<group_id>/chat/?token=<access>
+
+    Pushes every new message in the group as the same JSON the REST
+    endpoint returns. Clients may also send `{"text": "..."}` to post.
+    """
+
+    channel_group = None
+
+    async def connect(self):
+        user = self.scope.get('user')
+        self.group_id = self.scope['url_route']['kwargs']['group_id']
+
+        if not user or not user.is_authenticated:
+            await self.close(code=4401)
+            return
+        if not await self.is_member(user):
+            await self.close(code=4403)
+            return
+
+        self.channel_group = group_channel_name(self.group_id)
+        await self.channel_layer.group_add(self.channel_group, self.channel_name)
+        await self.accept()
+
+    async def disconnect(self, code):
+        if self.channel_group:
+            await self.channel_layer.group_discard(self.channel_group, self.channel_name)
+
+    async def receive_json(self, content, **kwargs):
+        if not await self.still_member():
+            return
+        text = content.get('text') if isinstance(content, dict) else None
+        if not isinstance(text, str) or not text.strip():
+            await self.send_json({"error": {"text": ["This field is required."]}})
+            return
+        await self.create_message(text)
+
+    async def chat_message(self, event):
+        if not await self.still_member():
+            return
+        await self.send_json(event['message'])
+
+    async def still_member(self):
+        """
+        Whether the user is still in the group. Leaving or being removed
+        doesn't touch open sockets, so a socket whose user is gone stops
+        getting broadcasts and is closed instead of posting.
+        """
+        if await self.is_member(self.scope['user']):
+            return True
+        if self.channel_group:
+            await self.channel_layer.group_discard(self.channel_group, self.channel_name)
+            self.channel_group = None
+        await self.close(code=4403)
+        return False
+
+    @database_sync_to_async
+    def is_member(self, user):
+        # the cached set (see api/membership.py), so this is a cache read
+        # per message rather than a query
+        return self.group_id in group_ids_for(user)
+
+    @database_sync_to_async
+    def create_message(self, text):
+        with transaction.atomic():
+            message = Message.objects.create(
+                group_id=self.group_id,
+                sender=self.scope['user'],
+                text=text,
+            )
+            payload = MessageSerializer(
+                message,
+                context={'request': _ScopeRequest(self.scope)},
+            ).data
+            broadcast_message(payload, self.group_id)
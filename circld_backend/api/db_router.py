@@ -0,0 +1,101 @@
+# api/db_router.py
+"""
+Read/write splitting.
+
+Reads made while handling a request go to a random replica from
+settings.DATABASE_REPLICAS; writes always go to 'default'. So that people
+see their own writes:
+
+  - once a request writes, the rest of it reads from the primary
+    (unsafe methods read from the primary from the start);
+  - after a request that wrote, the same client (Authorization header or
+    session cookie) keeps reading from the primary for
+    REPLICA_PIN_SECONDS, long enough for the replicas to catch up. The pin
+    is kept in the shared cache (see CACHES), so it holds whichever worker
+    serves the next request.
+
+Outside a request (management commands, the mail worker, background
+threads) everything uses the primary.
+"""
+import hashlib
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# per-request routing state: {'primary': bool, 'wrote': bool}
+_state = ContextVar('db_routing_state', default=None)
+
+UNSAFE_METHODS = frozenset({'POST', 'PUT', 'PATCH', 'DELETE'})
+
+
+class PrimaryReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        state    = _state.get()
+        replicas = getattr(settings, 'DATABASE_REPLICAS', ())
+        if state is None or state['primary'] or not replicas:
+            return DEFAULT_DB_ALIAS
+        # a replica can't see what an open transaction on the primary did
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state['primary'] = state['wrote'] = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # replicas hold the same data, so objects from any of them may relate
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # replicas get their schema from the primary
+        return db not in getattr(settings, 'DATABASE_REPLICAS', ())
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Sets up the routing state for each request and remembers clients that
+    just wrote something, so their next reads skip the replicas.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        client = self.client_key(request)
+        pinned = request.method in UNSAFE_METHODS
+        if not pinned and client:
+            try:
+                pinned = bool(cache.get(client))
+            except Exception:
+                pinned = True
+
+        state = {'primary': pinned, 'wrote': False}
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+
+        if state['wrote'] and client:
+            try:
+                cache.set(client, 1, getattr(settings, 'REPLICA_PIN_SECONDS', 5))
+            except Exception:
+                pass
+        return response
+
+    @staticmethod
+    def client_key(request):
+        credential = (
+            request.META.get('HTTP_AUTHORIZATION')
+            or request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+        )
+        if not credential:
+            return None
+        return 'db-pin:' + hashlib.sha256(credential.encode()).hexdigest()[:32]
@@ -0,0 +1,299 @@
+# api/expense_io.py
+"""
+Bulk import and streaming export of a group's expenses, as CSV or JSON
+Lines (one JSON object per line).
+
+Columns / keys:
+    date           ISO date or datetime; blank → now
+    amount         positive, at most 2 decimal places
+    note           optional, up to 255 characters
+    category       optional, up to 40 characters; blank → General
+    paid_by        username, email or user id of a member; blank → importer
+    split_between  members separated by ';' (a list in JSON); blank → everyone
+
+Exports add `id` and `shares` (per-member amounts) and can be imported
+again as-is. CSV cells that a spreadsheet would run as a formula (leading
+=, +, -, @, tab or CR) are written with a leading ' and read back without it.
+"""
+import csv
+import io
+import itertools
+import json
+from decimal import Decimal, InvalidOperation
+
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .balances import record_expenses_bulk
+from .models import Expense, touch_groups
+
+FORMATS        = ('csv', 'jsonl')
+EXPORT_COLUMNS = ['id', 'date', 'amount', 'note', 'category', 'paid_by', 'split_between', 'shares']
+MAX_ROWS       = 50_000
+# stop collecting after this many bad rows; the rest are only counted
+MAX_REPORTED_ERRORS = 100
+CHUNK_SIZE     = 500
+# export lines fetched per hop to the sync thread when streaming over ASGI
+STREAM_CHUNK   = 500
+# spreadsheets treat a cell starting with one of these as a formula
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+class ImportFailed(Exception):
+    def __init__(self, errors, error_count):
+        super().__init__(f"{error_count} invalid rows")
+        self.errors      = errors
+        self.error_count = error_count
+
+
+def detect_format(name, requested=None):
+    if requested:
+        return requested if requested in FORMATS else None
+    name = (name or '').lower()
+    if name.endswith('.csv'):
+        return 'csv'
+    if name.endswith(('.jsonl', '.ndjson', '.json')):
+        return 'jsonl'
+    return None
+
+
+def read_rows(upload, fmt):
+    """Yield (row number, dict) from an uploaded file without loading it whole."""
+    text = io.TextIOWrapper(upload.file, encoding='utf-8-sig', newline='')
+    try:
+        if fmt == 'csv':
+            for number, row in enumerate(csv.DictReader(text), start=2):  # 1 is the header
+                yield number, {(k or '').strip().lower(): unescape_cell(v) for k, v in row.items()}
+        else:
+            for number, line in enumerate(text, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError as exc:
+                    yield number, exc
+                    continue
+                yield number, row if isinstance(row, dict) else ValueError("Expected a JSON object.")
+    finally:
+        text.detach()
+
+
+class MemberDirectory:
+    """Resolve usernames, emails and ids to the group's members."""
+
+    def __init__(self, group):
+        self.ids = []
+        self.by_key = {}
+        for uid, username, email in group.members.values_list('id', 'username', 'email'):
+            self.ids.append(uid)
+            self.by_key[str(uid)] = uid
+            self.by_key[username.lower()] = uid
+            if email:
+                self.by_key.setdefault(email.lower(), uid)
+
+    def resolve(self, value):
+        return self.by_key.get(str(value).strip().lower())
+
+
+def parse_row(row, members, default_payer_id):
+    """(Expense kwargs, split user ids) or raise ValueError({field: message})."""
+    errors = {}
+
+    raw_amount = str(row.get('amount') or '').strip()
+    try:
+        amount = Decimal(raw_amount)
+        if not amount.is_finite() or amount <= 0:
+            errors['amount'] = "Must be greater than zero."
+        elif amount.as_tuple().exponent < -2:
+            errors['amount'] = "At most 2 decimal places."
+        elif amount >= Decimal('1e8'):
+            errors['amount'] = "Too large."
+    except InvalidOperation:
+        errors['amount'] = "A valid number is required."
+
+    raw_date = str(row.get('date') or '').strip()
+    created = timezone.now()
+    if raw_date:
+        try:
+            # a bare date lands at noon so no timezone moves it to another day
+            if len(raw_date) == 10 and parse_date(raw_date):
+                raw_date += 'T12:00:00'
+            created = parse_datetime(raw_date)
+        except ValueError:
+            created = None
+        if created is None:
+            errors['date'] = "Use YYYY-MM-DD or an ISO 8601 datetime."
+        elif timezone.is_naive(created):
+            created = timezone.make_aware(created)
+
+    note = str(row.get('note') or '').strip()
+    if len(note) > 255:
+        errors['note'] = "At most 255 characters."
+
+    category = str(row.get('category') or '').strip() or 'General'
+    if len(category) > 40:
+        errors['category'] = "At most 40 characters."
+
+    payer_id = default_payer_id
+    raw_payer = row.get('paid_by')
+    if raw_payer not in (None, ''):
+        payer_id = members.resolve(raw_payer)
+        if payer_id is None:
+            errors['paid_by'] = f"Not a member of this group: {raw_payer}"
+    elif payer_id is None:
+        errors['paid_by'] = "This field is required."
+
+    raw_split = row.get('split_between')
+    if isinstance(raw_split, str):
+        raw_split = [part for part in raw_split.split(';') if part.strip()]
+    elif raw_split is not None and not isinstance(raw_split, list):
+        raw_split = [raw_split]
+    split = list(members.ids)
+    if raw_split:
+        split = [members.resolve(value) for value in raw_split]
+        outsiders = [value for value, uid in zip(raw_split, split) if uid is None]
+        if outsiders:
+            errors['split_between'] = f"Not members of this group: {outsiders}"
+    elif not split:
+        errors['split_between'] = "The group has no members."
+
+    if errors:
+        raise ValueError(errors)
+    return {
+        'amount':     amount,
+        'created':    created,
+        'note':       note,
+        'category':   category,
+        'paid_by_id': payer_id,
+    }, split
+
+
+def import_expenses(group, upload, fmt, importer):
+    """
+    Validate and insert every row of `upload` in one transaction. Rows are
+    written in chunks as they stream in; if any row is invalid, nothing is
+    kept and ImportFailed lists the problems by row number.
+    """
+    members = MemberDirectory(group)
+    payer   = importer.pk if importer.pk in members.ids else None
+    errors, error_count, imported, chunk = [], 0, 0, []
+
+    def fail(number, problem):
+        nonlocal error_count
+        error_count += 1
+        if len(errors) < MAX_REPORTED_ERRORS:
+            errors.append({'row': number, 'errors': problem})
+
+    with transaction.atomic():
+        for number, row in read_rows(upload, fmt):
+            if imported + error_count >= MAX_ROWS:
+                fail(number, {'file': f"At most {MAX_ROWS} rows per import."})
+                break
+            if isinstance(row, Exception):
+                fail(number, {'row': f"Invalid JSON: {row}"})
+                continue
+            try:
+                fields, split = parse_row(row, members, payer)
+            except ValueError as exc:
+                fail(number, exc.args[0])
+                continue
+            imported += 1
+            if error_count:
+                # it'll all be rolled back; keep validating, stop writing
+                continue
+            chunk.append((Expense(group=group, **fields), split))
+            if len(chunk) >= CHUNK_SIZE:
+                record_expenses_bulk(chunk)
+                chunk = []
+
+        if error_count:
+            # leaving the atomic block with an exception undoes the chunks
+            raise ImportFailed(errors, error_count)
+        record_expenses_bulk(chunk)
+        # bulk_create skips the post_save signal that normally does this
+        touch_groups(pk=group.pk)
+    return imported
+
+
+# --- export -----------------------------------------------------------------
+
+def export_rows(group):
+    """One dict per expense, oldest first, fetched in chunks."""
+    expenses = (
+        Expense.objects
+               .filter(group=group)
+               .select_related('paid_by')
+               .prefetch_related('shares__user')
+               .order_by('created', 'id')
+    )
+    for expense in expenses.iterator(chunk_size=1000):
+        shares = sorted(expense.shares.all(), key=lambda s: s.user_id)
+        yield {
+            'id':            expense.pk,
+            'date':          expense.created.isoformat(),
+            'amount':        str(expense.amount),
+            'note':          expense.note,
+            'category':      expense.category,
+            'paid_by':       expense.paid_by.username if expense.paid_by else '',
+            'split_between': [share.user.username for share in shares],
+            'shares':        {share.user.username: str(share.amount) for share in shares},
+        }
+
+
+class _Echo:
+    # csv.writer only needs something with write(); hand the line back
+    def write(self, value):
+        return value
+
+
+def escape_cell(value):
+    """Keep a spreadsheet from running `value` as a formula."""
+    value = str(value)
+    return "'" + value if value.startswith(FORMULA_PREFIXES) else value
+
+
+def unescape_cell(value):
+    if isinstance(value, str) and value.startswith("'") and value[1:].startswith(FORMULA_PREFIXES):
+        return value[1:]
+    return value
+
+
+def stream_csv(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(EXPORT_COLUMNS)
+    for row in rows:
+        yield writer.writerow([escape_cell(value) for value in (
+            row['id'],
+            row['date'],
+            row['amount'],
+            row['note'],
+            row['category'],
+            row['paid_by'],
+            ';'.join(row['split_between']),
+            ';'.join(f"{name}:{amount}" for name, amount in row['shares'].items()),
+        )])
+
+
+def stream_jsonl(rows):
+    for row in rows:
+        yield json.dumps(row) + '\n'
+
+
+async def stream_async(lines, chunk_size=None):
+    """
+    `lines` (a sync generator from stream_csv/stream_jsonl) as an async
+    iterator for ASGI. StreamingHttpResponse would otherwise collect a sync
+    iterator into one list before sending any of it. Each hop runs on the
+    request's sync thread (thread_sensitive), where the export query's
+    cursor lives, and sends a chunk of lines as one piece.
+    """
+    chunk_size = chunk_size or STREAM_CHUNK
+    take = sync_to_async(lambda: ''.join(itertools.islice(lines, chunk_size)), thread_sensitive=True)
+    try:
+        while piece := await take():
+            yield piece
+    finally:
+        # a client that hangs up mid-download leaves the query to close
+        await sync_to_async(lines.close, thread_sensitive=True)()
@@ -0,0 +1,142 @@
+# api/mail.py
+"""
+Outgoing email goes through the OutboxEmail table: views call
+queue_mail() and return straight away, and `manage.py send_queued_mail`
+delivers the queue in batches over a single SMTP connection.
+
+Bodies carry verification and reset codes, so a sent email keeps only its
+envelope, and purge_outbox() drops sent and failed rows after
+OUTBOX_RETENTION.
+"""
+import datetime
+import logging
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import OutboxEmail
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS   = 6
+RETRY_BASE     = datetime.timedelta(seconds=30)
+RETRY_MAX      = datetime.timedelta(hours=1)
+# how long a worker owns a claimed message before another may retry it
+CLAIM_LEASE    = datetime.timedelta(minutes=5)
+OUTBOX_RETENTION = datetime.timedelta(days=7)
+
+
+def queue_mail(subject, message, from_email, recipient_list):
+    """Drop-in for send_mail() that only records the email for the worker."""
+    return OutboxEmail.objects.create(
+        subject=subject,
+        body=message,
+        from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+        recipients=list(recipient_list),
+    )
+
+
+def retry_delay(attempts):
+    """30s, 1m, 2m, 4m, … capped at an hour."""
+    return min(RETRY_BASE * (2 ** max(attempts - 1, 0)), RETRY_MAX)
+
+
+def deliver_pending(batch_size=50, max_attempts=MAX_ATTEMPTS, connection=None):
+    """
+    Send up to `batch_size` due emails over one connection.
+    Returns (sent, failed) counts for this batch.
+    """
+    batch = claim_batch(batch_size)
+    if not batch:
+        return 0, 0
+
+    connection = connection or get_connection()
+    sent = failed = 0
+    handled = set()
+    try:
+        connection.open()
+        for email in batch:
+            handled.add(email.pk)
+            try:
+                EmailMessage(
+                    subject=email.subject,
+                    body=email.body,
+                    from_email=email.from_email,
+                    to=email.recipients,
+                    connection=connection,
+                ).send()
+            except Exception as exc:
+                failed += 1
+                mark_failed(email, exc, max_attempts)
+                # the connection may be unusable now; start a fresh one
+                connection.close()
+                connection.open()
+            else:
+                sent += 1
+                OutboxEmail.objects.filter(pk=email.pk).update(
+                    status=OutboxEmail.SENT,
+                    attempts=email.attempts + 1,
+                    sent_at=timezone.now(),
+                    last_error='',
+                    body='',
+                )
+    except Exception as exc:
+        # couldn't (re)connect: the rest of the batch backs off as well
+        logger.warning("Mail connection failed: %s", exc)
+        for email in batch:
+            if email.pk not in handled:
+                failed += 1
+                mark_failed(email, exc, max_attempts)
+    finally:
+        connection.close()
+    return sent, failed
+
+
+def claim_batch(batch_size):
+    """
+    Take ownership of due emails by pushing their next_attempt_at forward.
+    The update is conditional on the value we read, so two workers can
+    never both claim the same email, and a crashed worker's claims simply
+    expire.
+    """
+    now = timezone.now()
+    candidates = list(
+        OutboxEmail.objects
+                   .filter(status=OutboxEmail.PENDING, next_attempt_at__lte=now)
+                   .order_by('next_attempt_at', 'id')[:batch_size]
+    )
+    claimed = []
+    for email in candidates:
+        won = OutboxEmail.objects.filter(
+            pk=email.pk,
+            status=OutboxEmail.PENDING,
+            next_attempt_at=email.next_attempt_at,
+        ).update(next_attempt_at=now + CLAIM_LEASE)
+        if won:
+            claimed.append(email)
+    return claimed
+
+
+def mark_failed(email, exc, max_attempts):
+    attempts = email.attempts + 1
+    give_up  = attempts >= max_attempts
+    OutboxEmail.objects.filter(pk=email.pk).update(
+        attempts=attempts,
+        status=OutboxEmail.FAILED if give_up else OutboxEmail.PENDING,
+        next_attempt_at=timezone.now() + retry_delay(attempts),
+        last_error=f"{type(exc).__name__}: {exc}"[:2000],
+    )
+    log = logger.error if give_up else logger.warning
+    log("Email #%s to %s failed (attempt %s): %s", email.pk, email.recipients, attempts, exc)
+
+
+def purge_outbox(older_than=OUTBOX_RETENTION):
+    """Delete sent and given-up emails older than `older_than`; returns the count."""
+    cutoff = timezone.now() - older_than
+    deleted, _ = OutboxEmail.objects.filter(
+        Q(status=OutboxEmail.SENT, sent_at__lt=cutoff)
+        | Q(status=OutboxEmail.FAILED, created__lt=cutoff)
+    ).delete()
+    return deleted
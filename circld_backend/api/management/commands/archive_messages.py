@@ -0,0 +1,34 @@
+# api/management/commands/archive_messages.py
+import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from api.archive import archive_messages
+
+
+class Command(BaseCommand):
+    help = (
+        "Move chat messages older than --days (settings.MESSAGE_ARCHIVE_AFTER_DAYS) "
+        "into the compressed per-group, per-month archive. The message list and "
+        "its history pages keep serving them from there."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.MESSAGE_ARCHIVE_AFTER_DAYS,
+                            help="archive messages older than this many days")
+        parser.add_argument('--group', type=int, action='append', dest='groups',
+                            help="only archive this group (repeatable)")
+        parser.add_argument('--dry-run', action='store_true',
+                            help="count what would move without moving it")
+
+    def handle(self, *args, **opts):
+        if opts['days'] < 1:
+            raise CommandError("--days must be at least 1.")
+        before = timezone.now() - datetime.timedelta(days=opts['days'])
+        moved, chunks = archive_messages(before, opts['groups'], dry_run=opts['dry_run'])
+        verb = "Would archive" if opts['dry_run'] else "Archived"
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {moved} messages older than {before:%Y-%m-%d} into {chunks} group-months."
+        ))
@@ -0,0 +1,106 @@
+# api/management/commands/bench_login.py
+import random
+import time
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from api.authentication import EmailOrUsernameBackend
+from api.models import lookup_key
+
+User = get_user_model()
+
+PREFIX = 'benchlogin'
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed up to --users throwaway accounts (username 'benchlogin<n>') "
+        "and measure login lookups. Use a scratch database: seeding 1M rows "
+        "takes a while and they stay until --cleanup."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1_000_000)
+        parser.add_argument('--lookups', type=int, default=20_000,
+                            help="identifier lookups to time (mixed username/email, mixed case)")
+        parser.add_argument('--logins', type=int, default=20,
+                            help="full authenticate() calls to time (includes password hashing)")
+        parser.add_argument('--batch-size', type=int, default=10_000)
+        parser.add_argument('--cleanup', action='store_true',
+                            help="delete the seeded accounts afterwards")
+
+    def handle(self, *args, **opts):
+        total = opts['users']
+        self.seed(total, opts['batch_size'])
+
+        backend = EmailOrUsernameBackend()
+        rng = random.Random(7)
+
+        def identifier():
+            n = rng.randrange(total)
+            ident = f"{PREFIX}{n}" if rng.random() < 0.5 else f"{PREFIX}{n}@example.com"
+            return ident.upper() if rng.random() < 0.5 else ident
+
+        # the backend's own lookup; a SCAN of api_user here would mean the
+        # username_key / email_key indexes aren't used
+        sql, params = backend.identifier_lookup(f"{PREFIX}1")[:1].query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+            self.stdout.write("query plan:")
+            for row in cursor.fetchall():
+                self.stdout.write(f"  {row[-1]}")
+
+        started = time.perf_counter()
+        misses = 0
+        for _ in range(opts['lookups']):
+            if backend.get_user_by_identifier(identifier()) is None:
+                misses += 1
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f"lookups: {opts['lookups']} in {elapsed:.2f}s "
+            f"→ {opts['lookups'] / elapsed:,.0f}/s ({misses} misses)"
+        )
+
+        started = time.perf_counter()
+        for _ in range(opts['logins']):
+            assert backend.authenticate(None, username=identifier(), password='bench-password')
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f"full logins: {opts['logins']} in {elapsed:.2f}s "
+            f"→ {opts['logins'] / elapsed:,.1f}/s (dominated by the password hasher)"
+        )
+
+        if opts['cleanup']:
+            # seeded rows have no profiles, groups or other relations, so
+            # skip the ORM's per-row delete collector
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"DELETE FROM {User._meta.db_table} WHERE username LIKE %s",
+                    [f"{PREFIX}%"],
+                )
+                self.stdout.write(f"removed {cursor.rowcount} seeded users")
+
+    def seed(self, total, batch_size):
+        existing = User.objects.filter(username__startswith=PREFIX).count()
+        if existing >= total:
+            self.stdout.write(f"reusing {existing} seeded users")
+            return
+        # one hash for everyone: hashing a million passwords would take hours
+        password = make_password('bench-password')
+        started = time.perf_counter()
+        for start in range(existing, total, batch_size):
+            # bulk_create skips User.save(), which fills in the lookup keys
+            User.objects.bulk_create([
+                User(
+                    username=f"{PREFIX}{n}",
+                    username_key=lookup_key(f"{PREFIX}{n}"),
+                    email=f"{PREFIX}{n}@example.com",
+                    email_key=lookup_key(f"{PREFIX}{n}@example.com"),
+                    password=password,
+                )
+                for n in range(start, min(start + batch_size, total))
+            ])
+        self.stdout.write(f"seeded {total - existing} users in {time.perf_counter() - started:.1f}s")
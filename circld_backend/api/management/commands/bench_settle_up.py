@@ -0,0 +1,86 @@
+# api/management/commands/bench_settle_up.py
+import random
+import time
+from collections import defaultdict
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+
+from api.balances import EXACT_SETTLE_LIMIT, settle_up, split_amount
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the settle-up planner on synthetic groups. "
+        "Nothing is written to the database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--members', type=int, nargs='+', default=[10, 50, 100, 250, 500],
+                            help="group sizes to try")
+        parser.add_argument('--expenses', type=int, default=100_000,
+                            help="synthetic expenses per group")
+        parser.add_argument('--repeat', type=int, default=5,
+                            help="planner runs per group (best time is reported)")
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **opts):
+        rng = random.Random(opts['seed'])
+        self.stdout.write(
+            f"{'members':>8} {'expenses':>9} {'build s':>8} {'greedy ms':>10} "
+            f"{'transfers':>9} {'exact ms':>9} {'exact tx':>8}"
+        )
+        for size in opts['members']:
+            started = time.perf_counter()
+            balances = self.synthetic_balances(rng, size, opts['expenses'])
+            build = time.perf_counter() - started
+            assert sum(balances.values()) == 0
+
+            greedy_ms, plan = self.best_of(opts['repeat'], lambda: settle_up(balances))
+            self.verify(balances, plan)
+
+            exact_ms, exact_tx = '-', '-'
+            if sum(1 for b in balances.values() if b) <= EXACT_SETTLE_LIMIT:
+                ms, exact_plan = self.best_of(opts['repeat'], lambda: settle_up(balances, exact=True))
+                self.verify(balances, exact_plan)
+                exact_ms, exact_tx = f"{ms:.2f}", len(exact_plan)
+
+            self.stdout.write(
+                f"{size:>8} {opts['expenses']:>9} {build:>8.2f} {greedy_ms:>10.2f} "
+                f"{len(plan):>9} {exact_ms:>9} {exact_tx:>8}"
+            )
+
+    @staticmethod
+    def synthetic_balances(rng, size, expenses):
+        """
+        Trip-style traffic: a random member pays 5–500.00 for a random
+        subset of 2..size members, split the same way the API splits it.
+        """
+        members = list(range(1, size + 1))
+        balances = defaultdict(Decimal)
+        for _ in range(expenses):
+            payer = rng.choice(members)
+            amount = Decimal(rng.randint(500, 50_000)) / 100
+            split = sorted(rng.sample(members, rng.randint(2, min(size, 8))))
+            balances[payer] += amount
+            for uid, part in zip(split, split_amount(amount, len(split))):
+                balances[uid] -= part
+        return {uid: balances[uid] for uid in members}
+
+    @staticmethod
+    def best_of(repeat, fn):
+        best, result = None, None
+        for _ in range(max(1, repeat)):
+            started = time.perf_counter()
+            result = fn()
+            elapsed = (time.perf_counter() - started) * 1000
+            best = elapsed if best is None else min(best, elapsed)
+        return best, result
+
+    @staticmethod
+    def verify(balances, plan):
+        remaining = dict(balances)
+        for debtor, creditor, amount in plan:
+            remaining[debtor] += amount
+            remaining[creditor] -= amount
+        assert not any(remaining.values()), "plan does not settle every balance"
@@ -0,0 +1,141 @@
+# api/management/commands/bench_sqlite_concurrency.py
+import statistics
+import threading
+import time
+
+from channels.layers import DEFAULT_CHANNEL_LAYER, InMemoryChannelLayer, channel_layers
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, close_old_connections, connections
+from rest_framework.test import APIClient
+
+from api.models import Group, Message, User
+
+PREFIX = 'benchsqlite'
+
+STOCK_OPTIONS = {
+    # what the plain sqlite3 backend does, minus whatever WAL left behind
+    'init_command': 'PRAGMA journal_mode=DELETE',
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Hammer one group with concurrent chat posts and polls through the "
+        "API and report throughput, latency and lock errors. Compare "
+        "--profile production (settings.SQLITE_PRODUCTION_OPTIONS) with --profile stock. "
+        "Run against a scratch database (SQLITE_PATH=...): it writes messages."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profile', choices=['production', 'stock'], default='production')
+        parser.add_argument('--writers', type=int, default=4)
+        parser.add_argument('--readers', type=int, default=16)
+        parser.add_argument('--seconds', type=float, default=10.0)
+        parser.add_argument('--keep', action='store_true',
+                            help="keep the bench users, group and messages afterwards")
+
+    def handle(self, *args, **opts):
+        if connections['default'].vendor != 'sqlite':
+            raise CommandError("This benchmark is for the SQLite backend.")
+        self.configure(opts['profile'])
+
+        users, group = self.seed(opts['writers'] + opts['readers'])
+        stop     = threading.Event()
+        lock     = threading.Lock()
+        results  = {'post': [], 'poll': []}
+        errors   = {'post': 0, 'poll': 0, 'locked': 0}
+
+        def worker(kind, user):
+            # a host ALLOWED_HOSTS accepts outside the test runner
+            client = APIClient(SERVER_NAME='localhost')
+            client.force_authenticate(user)
+            last_id = 0
+            timings, failed, locked = [], 0, 0
+            try:
+                while not stop.is_set():
+                    started = time.perf_counter()
+                    try:
+                        if kind == 'post':
+                            r = client.post('/api/messages/', {'group': group.pk, 'text': 'bench'})
+                            ok = r.status_code == 201
+                        else:
+                            r = client.get(f'/api/messages/?group={group.pk}&after_id={last_id}')
+                            ok = r.status_code in (200, 304)
+                            if r.status_code == 200 and r.data:
+                                last_id = r.data[-1]['id']
+                    except OperationalError as exc:
+                        ok = False
+                        locked += 'locked' in str(exc)
+                    if ok:
+                        timings.append(time.perf_counter() - started)
+                    else:
+                        failed += 1
+            finally:
+                close_old_connections()
+                connections.close_all()
+                with lock:
+                    results[kind].extend(timings)
+                    errors[kind] += failed
+                    errors['locked'] += locked
+
+        threads = [
+            threading.Thread(target=worker, args=('post' if i < opts['writers'] else 'poll', user))
+            for i, user in enumerate(users)
+        ]
+        started = time.perf_counter()
+        for t in threads:
+            t.start()
+        time.sleep(opts['seconds'])
+        stop.set()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - started
+
+        mode = connections['default'].cursor().execute('PRAGMA journal_mode').fetchone()[0]
+        self.stdout.write(
+            f"profile={opts['profile']} journal_mode={mode} "
+            f"writers={opts['writers']} readers={opts['readers']} {elapsed:.1f}s"
+        )
+        self.stdout.write(f"{'op':>5} {'ok':>7} {'err':>5} {'ops/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8}")
+        for kind in ('post', 'poll'):
+            t = sorted(results[kind])
+            if t:
+                p50 = statistics.median(t) * 1000
+                p95 = t[min(len(t) - 1, int(len(t) * 0.95))] * 1000
+                mx  = t[-1] * 1000
+            else:
+                p50 = p95 = mx = 0.0
+            self.stdout.write(
+                f"{kind:>5} {len(t):>7} {errors[kind]:>5} {len(t) / elapsed:>8.1f} "
+                f"{p50:>8.2f} {p95:>8.2f} {mx:>8.2f}"
+            )
+        self.stdout.write(f"'database is locked' errors: {errors['locked']}")
+
+        if not opts['keep']:
+            Message.objects.filter(group=group).delete()
+            group.delete()
+            User.objects.filter(username__startswith=PREFIX).delete()
+
+    def configure(self, profile):
+        """Point every connection opened from now on at the chosen profile."""
+        db = connections.settings['default']
+        if profile == 'stock':
+            db['OPTIONS'] = dict(STOCK_OPTIONS)
+            db['CONN_MAX_AGE'] = 0
+        else:
+            db['OPTIONS'] = dict(settings.SQLITE_PRODUCTION_OPTIONS)
+        connections['default'].close()
+        # this thread's wrapper was built from the old settings
+        del connections['default']
+        # measure the database, not a (possibly absent) Redis behind the chat fan-out
+        channel_layers.set(DEFAULT_CHANNEL_LAYER, InMemoryChannelLayer())
+
+    def seed(self, count):
+        users = []
+        for n in range(count):
+            user, _ = User.objects.get_or_create(username=f"{PREFIX}{n}", defaults={'email': f"{PREFIX}{n}@example.com"})
+            users.append(user)
+        group = Group.objects.create(name=f"{PREFIX} group", owner=users[0])
+        group.members.add(*users)
+        return users, group
@@ -0,0 +1,31 @@
+# api/management/commands/build_avatar_variants.py
+from django.core.management.base import BaseCommand
+
+from api.avatars import SIZES, build_variants
+from api.models import Profile
+
+
+class Command(BaseCommand):
+    help = (
+        "Build the resized avatar variants for profiles that don't have them "
+        "yet (avatars uploaded before variants existed, or whose background "
+        "build failed)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help="rebuild every avatar, not just the missing ones")
+
+    def handle(self, *args, **opts):
+        profiles = Profile.objects.exclude(avatar='').exclude(avatar__isnull=True).order_by('pk')
+        built = failed = 0
+        for profile in profiles.iterator():
+            if not opts['all'] and set(profile.avatar_variants or {}) >= set(SIZES):
+                continue
+            try:
+                if build_variants(profile):
+                    built += 1
+            except Exception as exc:
+                failed += 1
+                self.stderr.write(f"profile {profile.pk} ({profile.avatar.name}): {exc}")
+        self.stdout.write(self.style.SUCCESS(f"Built variants for {built} avatars, {failed} failed."))
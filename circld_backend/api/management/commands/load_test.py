@@ -0,0 +1,220 @@
+# api/management/commands/load_test.py
+import json
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Stats:
+    """Per-endpoint latencies, failures and X-Query-Count values."""
+
+    def __init__(self):
+        self.lock    = threading.Lock()
+        self.timings = defaultdict(list)
+        self.queries = defaultdict(list)
+        self.errors  = defaultdict(int)
+
+    def record(self, label, elapsed, ok, queries):
+        with self.lock:
+            if ok:
+                self.timings[label].append(elapsed)
+            else:
+                self.errors[label] += 1
+            if queries is not None:
+                self.queries[label].append(queries)
+
+
+class Client:
+    """One app user: a token, a group and the last message id it has seen."""
+
+    def __init__(self, base_url, record):
+        self.base_url = base_url.rstrip('/')
+        self.record   = record
+        self.token    = None
+        self.group    = None
+        self.last_id  = 0
+
+    def call(self, label, method, path, body=None):
+        data = json.dumps(body).encode() if body is not None else None
+        request = urllib.request.Request(self.base_url + path, data=data, method=method)
+        request.add_header('Accept', 'application/json')
+        if data is not None:
+            request.add_header('Content-Type', 'application/json')
+        if self.token:
+            request.add_header('Authorization', f'Bearer {self.token}')
+
+        started = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=30) as response:
+                status, queries, payload = response.status, response.headers.get('X-Query-Count'), response.read()
+        except urllib.error.HTTPError as exc:
+            status, queries, payload = exc.code, exc.headers.get('X-Query-Count'), b''
+        except (urllib.error.URLError, OSError):
+            status, queries, payload = None, None, b''
+        elapsed = time.perf_counter() - started
+        ok = status is not None and status < 400
+        self.record(label, elapsed, ok, int(queries) if queries else None)
+        return json.loads(payload) if ok and payload else None
+
+    def sign_in(self, username, password):
+        tokens = self.call('POST /api/token/', 'POST', '/api/token/', {'username': username, 'password': password})
+        if not tokens:
+            return False
+        self.token = tokens['access']
+        groups = self.call('GET /api/groups/', 'GET', '/api/groups/') or []
+        if not groups:
+            return False
+        self.group = random.choice(groups)['id']
+        latest = self.call(
+            'GET /api/messages/?latest', 'GET', f'/api/messages/?group={self.group}&latest=50',
+        ) or []
+        if latest:
+            self.last_id = latest[-1]['id']
+        return True
+
+    def poll(self):
+        new = self.call(
+            'GET /api/messages/?after_id', 'GET', f'/api/messages/?group={self.group}&after_id={self.last_id}',
+        )
+        if new:
+            self.last_id = new[-1]['id']
+
+    def members(self):
+        self.call('GET /api/groups/{id}/members/', 'GET', f'/api/groups/{self.group}/members/')
+
+    def post_expense(self):
+        self.call('POST /api/expenses/', 'POST', '/api/expenses/', {
+            'group':  self.group,
+            'amount': f"{random.randint(100, 20_000) / 100:.2f}",
+            'note':   'load test',
+        })
+
+    def post_message(self):
+        self.call('POST /api/messages/', 'POST', '/api/messages/', {'group': self.group, 'text': 'load test'})
+
+
+class Command(BaseCommand):
+    help = (
+        "Simulate app clients against a running server: each signs in as a "
+        "seeded user (see seed_bench_data), then polls its group's chat every "
+        "--poll-interval seconds, now and then fetching the member list or "
+        "posting a message or an expense. Reports throughput, p50/p95/p99 "
+        "latency and SQL queries per endpoint (from X-Query-Count, which needs "
+        "QUERY_COUNT_HEADER on the server)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000')
+        parser.add_argument('--clients', type=int, default=50)
+        parser.add_argument('--seconds', type=float, default=60.0)
+        parser.add_argument('--poll-interval', type=float, default=3.0)
+        parser.add_argument('--members-every', type=int, default=10,
+                            help="fetch the member list every Nth poll")
+        parser.add_argument('--message-chance', type=float, default=0.05,
+                            help="chance per poll of also posting a message")
+        parser.add_argument('--expense-chance', type=float, default=0.01,
+                            help="chance per poll of also posting an expense")
+        parser.add_argument('--prefix', default='bench')
+        parser.add_argument('--users', type=int, default=1_000,
+                            help="how many <prefix>N users were seeded")
+        parser.add_argument('--password', default='bench-pass')
+        parser.add_argument('--seed', type=int, default=None)
+
+    def handle(self, *args, **opts):
+        if opts['clients'] < 1 or opts['users'] < 1:
+            raise CommandError("Need at least one client and one seeded user.")
+        if opts['seed'] is not None:
+            random.seed(opts['seed'])
+
+        warmup = Stats()
+        steady = Stats()
+        stop   = threading.Event()
+        # every client signs in before the clock starts, so the numbers
+        # describe the steady polling traffic rather than a login storm
+        ready  = threading.Barrier(opts['clients'] + 1)
+        active, active_lock = [], threading.Lock()
+        usernames = random.sample(range(opts['users']), min(opts['clients'], opts['users']))
+        usernames += [random.randrange(opts['users']) for _ in range(opts['clients'] - len(usernames))]
+
+        def run(n):
+            client = Client(opts['url'], warmup.record)
+            try:
+                signed_in = client.sign_in(f"{opts['prefix']}{n}", opts['password'])
+            finally:
+                ready.wait()
+            if not signed_in:
+                return
+            with active_lock:
+                active.append(n)
+            client.record = steady.record
+            interval = opts['poll_interval']
+            # spread the clients over the first interval instead of a thundering herd
+            next_tick = time.monotonic() + random.uniform(0, interval)
+            polls = 0
+            while not stop.wait(max(0.0, next_tick - time.monotonic())):
+                next_tick += interval
+                client.poll()
+                polls += 1
+                if polls % opts['members_every'] == 0:
+                    client.members()
+                if random.random() < opts['message_chance']:
+                    client.post_message()
+                if random.random() < opts['expense_chance']:
+                    client.post_expense()
+
+        threads = [threading.Thread(target=run, args=(n,), daemon=True) for n in usernames]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        ready.wait()
+        warmed = time.perf_counter()
+        try:
+            time.sleep(opts['seconds'])
+        except KeyboardInterrupt:
+            pass
+        stop.set()
+        for thread in threads:
+            thread.join()
+        finished = time.perf_counter()
+
+        self.stdout.write(f"sign-in: {opts['clients']} clients against {opts['url']} in {warmed - started:.1f}s")
+        self.report(warmup, warmed - started)
+        self.stdout.write(
+            f"\nsteady state: {len(active)} clients with a group, {finished - warmed:.1f}s, "
+            f"polling every {opts['poll_interval']}s"
+        )
+        self.report(steady, finished - warmed)
+
+    def report(self, stats, elapsed):
+        self.stdout.write(
+            f"{'endpoint':<32} {'ok':>7} {'err':>5} {'req/s':>7} "
+            f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8} {'sql avg':>8} {'sql max':>8}"
+        )
+        total_ok = total_err = 0
+        for label in sorted(stats.timings.keys() | stats.errors.keys()):
+            t = sorted(stats.timings[label])
+            q = stats.queries[label]
+            total_ok += len(t)
+            total_err += stats.errors[label]
+            sql_avg = f"{sum(q) / len(q):.1f}" if q else '-'
+            sql_max = str(max(q)) if q else '-'
+            self.stdout.write(
+                f"{label:<32} {len(t):>7} {stats.errors[label]:>5} {len(t) / elapsed:>7.1f} "
+                f"{self.percentile(t, 50):>8.1f} {self.percentile(t, 95):>8.1f} "
+                f"{self.percentile(t, 99):>8.1f} {(t[-1] * 1000 if t else 0):>8.1f} "
+                f"{sql_avg:>8} {sql_max:>8}"
+            )
+        self.stdout.write(f"total: {total_ok} ok, {total_err} failed, {total_ok / elapsed:.1f} req/s")
+
+    @staticmethod
+    def percentile(ordered, pct):
+        """Nearest-rank percentile of sorted seconds, in milliseconds."""
+        if not ordered:
+            return 0.0
+        rank = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+        return ordered[rank] * 1000
@@ -0,0 +1,16 @@
+# api/management/commands/rebuild_balances.py
+from django.core.management.base import BaseCommand
+
+from api.balances import rebuild_group_balances
+
+
+class Command(BaseCommand):
+    help = "Rebuild the running per-group balances from the expense and share tables."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--group', type=int, action='append', dest='groups',
+                            help="only rebuild this group (repeatable)")
+
+    def handle(self, *args, **opts):
+        rows = rebuild_group_balances(opts['groups'])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {rows} balance rows."))
@@ -0,0 +1,16 @@
+# api/management/commands/rebuild_rollups.py
+from django.core.management.base import BaseCommand
+
+from api.balances import rebuild_expense_rollups
+
+
+class Command(BaseCommand):
+    help = "Rebuild the monthly spend rollups behind the analytics endpoint from the expense table."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--group', type=int, action='append', dest='groups',
+                            help="only rebuild this group (repeatable)")
+
+    def handle(self, *args, **opts):
+        rows = rebuild_expense_rollups(opts['groups'])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {rows} rollup rows."))
@@ -0,0 +1,170 @@
+# api/management/commands/seed_bench_data.py
+import datetime
+import itertools
+import random
+import time
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from api.balances import record_expenses_bulk
+from api.models import Expense, Group, Message, Profile, User, lookup_key
+
+CATEGORIES = ['General', 'Food', 'Groceries', 'Rent', 'Travel', 'Utilities', 'Fun']
+WORDS = (
+    "hey ok sure thanks dinner lunch tonight tomorrow weekend rent bills trip "
+    "train tickets paid owe split receipt groceries coffee movie later sounds "
+    "good see you there running late who's in can someone send the link"
+).split()
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill the database with benchmark users, groups, memberships, expenses "
+        "and chat history using bulk inserts. Users are <prefix>N with password "
+        "--password, ready for the load_test command. Run against a scratch "
+        "database (SQLITE_PATH=...)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1_000)
+        parser.add_argument('--groups', type=int, default=200)
+        parser.add_argument('--members', type=int, default=8,
+                            help="average members per group (owner included)")
+        parser.add_argument('--expenses', type=int, default=50_000)
+        parser.add_argument('--messages', type=int, default=1_000_000)
+        parser.add_argument('--days', type=int, default=365,
+                            help="spread the history over this many days up to now")
+        parser.add_argument('--prefix', default='bench')
+        parser.add_argument('--password', default='bench-pass')
+        parser.add_argument('--batch-size', type=int, default=5_000)
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **opts):
+        if opts['users'] < 2 or opts['groups'] < 1 or opts['members'] < 2:
+            raise CommandError("Need at least 2 users, 1 group and 2 members per group.")
+        if User.objects.filter(username__startswith=opts['prefix']).exists():
+            raise CommandError(
+                f"Users named {opts['prefix']}… already exist; pick another --prefix "
+                "or seed a fresh database."
+            )
+        self.rng   = random.Random(opts['seed'])
+        self.batch = opts['batch_size']
+        self.end   = timezone.now()
+        self.start = self.end - datetime.timedelta(days=opts['days'])
+
+        users   = self.timed("users", lambda: self.seed_users(opts['users'], opts['prefix'], opts['password']))
+        members = self.timed("groups", lambda: self.seed_groups(users, opts['groups'], opts['members'], opts['prefix']))
+        self.timed("expenses", lambda: self.seed_expenses(members, opts['expenses']))
+        self.timed("messages", lambda: self.seed_messages(members, opts['messages']))
+
+    def timed(self, label, step):
+        started = time.perf_counter()
+        result = step()
+        self.stdout.write(f"{label:<9} {time.perf_counter() - started:8.1f}s")
+        return result
+
+    def seed_users(self, count, prefix, password):
+        # one hash for everybody: hashing is the slow part of creating users
+        hashed = make_password(password)
+        users = User.objects.bulk_create(
+            [
+                # bulk_create skips User.save(), which fills in the lookup keys
+                User(
+                    username=f"{prefix}{n}", username_key=lookup_key(f"{prefix}{n}"),
+                    email=f"{prefix}{n}@example.com", email_key=lookup_key(f"{prefix}{n}@example.com"),
+                    password=hashed,
+                )
+                for n in range(count)
+            ],
+            batch_size=self.batch,
+        )
+        # bulk_create skips the post_save receiver that adds these
+        Profile.objects.bulk_create([Profile(user=user) for user in users], batch_size=self.batch)
+        return [user.pk for user in users]
+
+    def seed_groups(self, user_ids, count, size, prefix):
+        """{group id: [member ids]}; sizes vary around `size`, owner first."""
+        rosters = []
+        for n in range(count):
+            k = max(2, min(len(user_ids), int(self.rng.gauss(size, size / 3))))
+            rosters.append(self.rng.sample(user_ids, k))
+        groups = Group.objects.bulk_create(
+            [Group(name=f"{prefix} group {n}", owner_id=roster[0]) for n, roster in enumerate(rosters)],
+            batch_size=self.batch,
+        )
+        Through = Group.members.through
+        Through.objects.bulk_create(
+            [
+                Through(group_id=group.pk, user_id=uid)
+                for group, roster in zip(groups, rosters)
+                for uid in roster
+            ],
+            batch_size=self.batch,
+        )
+        return {group.pk: roster for group, roster in zip(groups, rosters)}
+
+    def timestamps(self, count):
+        """`count` ascending datetimes between start and end, so ids follow time."""
+        span = (self.end - self.start).total_seconds()
+        return (
+            self.start + datetime.timedelta(seconds=offset)
+            for offset in sorted(self.rng.random() * span for _ in range(count))
+        )
+
+    def busy_groups(self, members):
+        """Group ids weighted so a few groups carry most of the traffic."""
+        ids = list(members)
+        self.rng.shuffle(ids)
+        # cumulative, so each pick is a bisect rather than a pass over every group
+        return ids, list(itertools.accumulate(1 / (rank + 1) for rank in range(len(ids))))
+
+    def seed_expenses(self, members, count):
+        ids, cum_weights = self.busy_groups(members)
+        chunk = []
+        for created in self.timestamps(count):
+            group_id = self.rng.choices(ids, cum_weights=cum_weights)[0]
+            roster = members[group_id]
+            split = roster if self.rng.random() < 0.6 else self.rng.sample(roster, self.rng.randint(2, len(roster)))
+            chunk.append((
+                Expense(
+                    group_id=group_id,
+                    paid_by_id=self.rng.choice(split),
+                    amount=Decimal(self.rng.randint(100, 30_000)) / 100,
+                    note=' '.join(self.rng.choices(WORDS, k=self.rng.randint(1, 4))),
+                    category=self.rng.choice(CATEGORIES),
+                    created=created,
+                ),
+                split,
+            ))
+            if len(chunk) >= self.batch:
+                self.record_expenses(chunk)
+                chunk = []
+        self.record_expenses(chunk)
+
+    def record_expenses(self, chunk):
+        # keeps the running balances and rollups in step, like an import
+        with transaction.atomic():
+            record_expenses_bulk(chunk, batch_size=self.batch)
+
+    def seed_messages(self, members, count):
+        ids, cum_weights = self.busy_groups(members)
+        chunk, written = [], 0
+        for ts in self.timestamps(count):
+            group_id = self.rng.choices(ids, cum_weights=cum_weights)[0]
+            chunk.append(Message(
+                group_id=group_id,
+                sender_id=self.rng.choice(members[group_id]),
+                text=' '.join(self.rng.choices(WORDS, k=self.rng.randint(1, 12))),
+                ts=ts,
+            ))
+            if len(chunk) >= self.batch:
+                Message.objects.bulk_create(chunk)
+                written += len(chunk)
+                chunk = []
+                if written % (self.batch * 20) == 0:
+                    self.stdout.write(f"  {written} messages")
+        Message.objects.bulk_create(chunk)
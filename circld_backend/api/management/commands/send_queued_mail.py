@@ -0,0 +1,50 @@
+# api/management/commands/send_queued_mail.py
+import datetime
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.mail import MAX_ATTEMPTS, OUTBOX_RETENTION, deliver_pending, purge_outbox
+
+# how often a --loop worker clears out old sent and failed emails
+PURGE_INTERVAL = 3600
+
+
+class Command(BaseCommand):
+    help = "Deliver emails from the outbox in batches over one SMTP connection."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50)
+        parser.add_argument('--max-attempts', type=int, default=MAX_ATTEMPTS,
+                            help="give up on an email after this many failures")
+        parser.add_argument('--loop', action='store_true',
+                            help="keep running, polling the outbox every --interval seconds")
+        parser.add_argument('--interval', type=float, default=2.0)
+        parser.add_argument('--keep-days', type=float, default=OUTBOX_RETENTION.days,
+                            help="delete sent and failed emails older than this")
+
+    def handle(self, *args, **opts):
+        total_sent = total_failed = 0
+        keep = datetime.timedelta(days=opts['keep_days'])
+        last_purge = None
+        while True:
+            if last_purge is None or time.monotonic() - last_purge >= PURGE_INTERVAL:
+                purged = purge_outbox(keep)
+                if purged:
+                    self.stdout.write(f"purged {purged} old emails")
+                last_purge = time.monotonic()
+            sent, failed = deliver_pending(opts['batch_size'], opts['max_attempts'])
+            total_sent += sent
+            total_failed += failed
+            if sent or failed:
+                self.stdout.write(f"sent {sent}, failed {failed}")
+            # a full batch probably means more is waiting; go again right away
+            if sent + failed >= opts['batch_size']:
+                continue
+            if not opts['loop']:
+                break
+            time.sleep(opts['interval'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Done: {total_sent} sent, {total_failed} failed."
+        ))
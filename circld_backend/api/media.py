@@ -0,0 +1,162 @@
+# api/media.py
+"""
+Serving MEDIA_ROOT.
+
+Every response carries a strong ETag, Last-Modified and a Cache-Control
+(immutable for the content-hashed avatar variants), answers conditional
+requests with 304 and single byte ranges with 206/416.
+
+With MEDIA_ACCEL set, the body itself is left to the front proxy:
+  'nginx'  → X-Accel-Redirect: MEDIA_ACCEL_PREFIX + path
+             (an `internal` location aliased to MEDIA_ROOT)
+  'apache' → X-Sendfile: <absolute path>  (mod_xsendfile)
+so Python never streams file bytes in production.
+"""
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, parse_http_date_safe
+from django.views.decorators.http import require_safe
+
+from .avatars import VARIANT_DIR
+
+# files whose name changes whenever their content does
+IMMUTABLE_PREFIXES = (f"{VARIANT_DIR}/",)
+IMMUTABLE_MAX_AGE  = 365 * 24 * 60 * 60
+# anything else (e.g. original uploads) may be replaced under the same name
+DEFAULT_MAX_AGE    = 60 * 60
+
+CHUNK_SIZE = 64 * 1024
+RANGE_RE   = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+@require_safe
+def serve_media(request, path):
+    """
+    GET/HEAD <MEDIA_URL><path>
+    """
+    try:
+        fullpath = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404("Not found.")
+    try:
+        stat = os.stat(fullpath)
+    except OSError:
+        raise Http404("Not found.")
+    if not os.path.isfile(fullpath):
+        raise Http404("Not found.")
+
+    size     = stat.st_size
+    mtime    = int(stat.st_mtime)
+    etag     = f'"{stat.st_mtime_ns:x}-{size:x}"'
+
+    response = get_conditional_response(request, etag=etag, last_modified=mtime)
+    if response is None:
+        byte_range = parse_range(request, size, etag, mtime)
+        if byte_range == 'unsatisfiable':
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+        else:
+            response = file_response(request, path, fullpath, size, byte_range)
+
+    content_type, encoding = mimetypes.guess_type(fullpath)
+    if response.status_code in (200, 206):
+        response['Content-Type'] = content_type or 'application/octet-stream'
+        if encoding:
+            response['Content-Encoding'] = encoding
+        response['X-Content-Type-Options'] = 'nosniff'
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(mtime)
+    patch_cache_control(response, **cache_control_for(path))
+    return response
+
+
+def cache_control_for(path):
+    if path.startswith(IMMUTABLE_PREFIXES):
+        return {'public': True, 'max_age': IMMUTABLE_MAX_AGE, 'immutable': True}
+    return {'public': True, 'max_age': DEFAULT_MAX_AGE}
+
+
+def parse_range(request, size, etag, mtime):
+    """
+    (start, end) inclusive for a satisfiable single range, None to send the
+    whole file, or 'unsatisfiable'. Multi-range requests get the whole file,
+    which RFC 9110 allows.
+    """
+    header = request.META.get('HTTP_RANGE', '').strip()
+    if not header:
+        return None
+
+    # If-Range: only honour the range if the client's copy is still current
+    if_range = request.META.get('HTTP_IF_RANGE', '').strip()
+    if if_range:
+        if if_range.startswith(('"', 'W/')):
+            if if_range != etag:
+                return None
+        elif parse_http_date_safe(if_range) != mtime:
+            return None
+
+    match = RANGE_RE.match(header.replace(' ', ''))
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+
+    if not first:
+        # suffix range: the last N bytes
+        length = int(last)
+        if length == 0 or size == 0:
+            return 'unsatisfiable'
+        return max(size - length, 0), size - 1
+
+    start = int(first)
+    end   = int(last) if last else size - 1
+    if last and end < start:
+        # syntactically invalid, so ignored
+        return None
+    if start >= size:
+        return 'unsatisfiable'
+    return start, min(end, size - 1)
+
+
+def file_response(request, path, fullpath, size, byte_range):
+    accel = getattr(settings, 'MEDIA_ACCEL', '')
+    if accel:
+        # the proxy sends the body and handles Range itself
+        response = HttpResponse()
+        if accel == 'nginx':
+            prefix = getattr(settings, 'MEDIA_ACCEL_PREFIX', '/protected-media/')
+            response['X-Accel-Redirect'] = prefix + quote(path)
+        else:
+            response['X-Sendfile'] = fullpath
+        return response
+
+    if byte_range is None:
+        return FileResponse(open(fullpath, 'rb'))
+
+    start, end = byte_range
+    length = end - start + 1
+    response = StreamingHttpResponse(read_range(fullpath, start, length), status=206)
+    response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    response['Content-Length'] = str(length)
+    return response
+
+
+def read_range(fullpath, start, length):
+    with open(fullpath, 'rb') as fh:
+        fh.seek(start)
+        while length > 0:
+            chunk = fh.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
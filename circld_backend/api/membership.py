@@ -0,0 +1,131 @@
+# api/membership.py
+"""
+Which groups a user may see, as a cached set of group ids.
+
+Group-scoped endpoints (expenses, messages, the chat socket) are polled
+constantly, so the membership check must not cost a join per request:
+the set is loaded once, kept in the cache for MEMBERSHIP_CACHE_TIMEOUT
+seconds and dropped by the signals in models.py whenever a membership,
+an owner or a whole group changes.
+
+The invalidation only works if every worker shares the cache (see
+CACHES in settings), and the set is always reloaded from the primary: a
+lagging replica would put a just-dropped membership back for a whole
+timeout.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+from rest_framework import permissions
+
+from .models import Group
+
+
+def membership_cache_key(user_id):
+    return f"group-ids:{user_id}"
+
+
+def group_ids_for(user):
+    """frozenset of ids of the groups `user` is a member or the owner of."""
+    key = membership_cache_key(user.pk)
+    try:
+        ids = cache.get(key)
+    except Exception:
+        ids = None
+    if ids is not None:
+        return ids
+
+    memberships = Group.members.through.objects.using(DEFAULT_DB_ALIAS)
+    member_of = memberships.filter(user=user).values_list('group_id', flat=True)
+    owner_of  = Group.objects.using(DEFAULT_DB_ALIAS).filter(owner=user).values_list('id', flat=True)
+    ids = frozenset(member_of.union(owner_of))
+    try:
+        cache.set(key, ids, getattr(settings, 'MEMBERSHIP_CACHE_TIMEOUT', 300))
+    except Exception:
+        pass
+    return ids
+
+
+def forget_memberships(user_ids):
+    """
+    Drop the cached sets of `user_ids`, now and again once the current
+    transaction commits, so a request that reloads the set in between
+    can't leave the pre-commit membership behind.
+    """
+    keys = [membership_cache_key(uid) for uid in set(user_ids) if uid is not None]
+    if not keys:
+        return
+
+    def forget():
+        try:
+            cache.delete_many(keys)
+        except Exception:
+            pass
+
+    forget()
+    transaction.on_commit(forget)
+
+
+def request_group_ids(request):
+    # memoized on the request so several checks share one cache read
+    ids = getattr(request, '_group_ids', None)
+    if ids is None:
+        ids = request._group_ids = group_ids_for(request.user)
+    return ids
+
+
+class IsGroupMember(permissions.BasePermission):
+    """
+    The group named by the request (see GroupScopedMixin.requested_group_ids)
+    and the group of the object being accessed must both be one of the
+    user's groups.
+    """
+    message = "You are not a member of this group."
+
+    def has_permission(self, request, view):
+        if not request.user or not request.user.is_authenticated:
+            return False
+        mine = request_group_ids(request)
+        return all(gid in mine for gid in view.requested_group_ids())
+
+    def has_object_permission(self, request, view, obj):
+        return obj.group_id in request_group_ids(request)
+
+
+class GroupScopedMixin:
+    """
+    For viewsets whose objects belong to a group and are selected with
+    `?group=<id>` (writes may name the group in the body instead).
+    Combine with IsGroupMember; `scope_to_group(qs)` narrows a queryset
+    to the requested group (lists without one are empty).
+    """
+
+    def group_param(self):
+        # int() rather than str.isdigit(), which also accepts digits like '²'
+        try:
+            return int(self.request.query_params.get('group'))
+        except (TypeError, ValueError):
+            return None
+
+    def requested_group_ids(self):
+        data = self.request.data
+        body = data.get('group') if hasattr(data, 'get') else None
+        ids = set()
+        for value in (self.request.query_params.get('group'), body):
+            if value in (None, ''):
+                continue
+            try:
+                ids.add(int(value))
+            except (TypeError, ValueError):
+                # malformed ids are the serializer's (or the empty queryset's) problem
+                continue
+        return ids
+
+    def scope_to_group(self, queryset):
+        group_id = self.group_param()
+        if group_id is not None:
+            return queryset.filter(group_id=group_id)
+        if self.action == 'list':
+            return queryset.none()
+        # detail routes work without ?group=, within the user's own groups
+        return queryset.filter(group_id__in=request_group_ids(self.request))
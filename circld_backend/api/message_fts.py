@@ -0,0 +1,96 @@
+# api/message_fts.py
+"""
+The SQLite FTS5 index over Message.text: a view, a virtual table reading
+from it, and triggers on api_message that keep the two in step. Created
+by migration 0021; api/search.py queries it.
+
+SQLite can only make most column changes by rebuilding the table (create
+new__api_message, copy, drop, rename), and the view and triggers don't
+survive that: the triggers go with the old table, and the view stops
+the rename with "error in view api_message_fts_source". A migration
+that alters api_message on the database wraps its operations so the index
+is dropped first and rebuilt afterwards:
+
+    operations = rebuilding_message_table(
+        migrations.AlterField(model_name='message', name='text', field=...),
+    )
+
+State-only changes (defaults, choices, help_text) don't touch the table;
+prefer SeparateDatabaseAndState for those, as 0024 does. Every statement
+here is a no-op on other databases.
+"""
+from django.db import migrations
+
+# The index reads its content from a view so each row also carries a
+# 'g<group id>' token: a group-scoped search is then an intersection of
+# two posting lists inside FTS5, not a scan of every match in the table.
+CREATE = [
+    """
+    CREATE VIEW api_message_fts_source AS
+    SELECT id, text, 'g' || group_id AS grp FROM api_message
+    """,
+    """
+    CREATE VIRTUAL TABLE api_message_fts USING fts5(
+        text,
+        grp,
+        content='api_message_fts_source',
+        content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER api_message_fts_insert AFTER INSERT ON api_message BEGIN
+        INSERT INTO api_message_fts (rowid, text, grp)
+        VALUES (new.id, new.text, 'g' || new.group_id);
+    END
+    """,
+    """
+    CREATE TRIGGER api_message_fts_delete AFTER DELETE ON api_message BEGIN
+        INSERT INTO api_message_fts (api_message_fts, rowid, text, grp)
+        VALUES ('delete', old.id, old.text, 'g' || old.group_id);
+    END
+    """,
+    """
+    CREATE TRIGGER api_message_fts_update AFTER UPDATE OF text, group_id ON api_message BEGIN
+        INSERT INTO api_message_fts (api_message_fts, rowid, text, grp)
+        VALUES ('delete', old.id, old.text, 'g' || old.group_id);
+        INSERT INTO api_message_fts (rowid, text, grp)
+        VALUES (new.id, new.text, 'g' || new.group_id);
+    END
+    """,
+    # index the existing history
+    "INSERT INTO api_message_fts (api_message_fts) VALUES ('rebuild')",
+]
+
+DROP = [
+    "DROP TRIGGER IF EXISTS api_message_fts_update",
+    "DROP TRIGGER IF EXISTS api_message_fts_delete",
+    "DROP TRIGGER IF EXISTS api_message_fts_insert",
+    "DROP TABLE IF EXISTS api_message_fts",
+    "DROP VIEW IF EXISTS api_message_fts_source",
+]
+
+
+def _run(statements):
+    def apply(apps, schema_editor):
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        for sql in statements:
+            schema_editor.execute(sql)
+    return apply
+
+
+create_index = _run(CREATE)
+drop_index   = _run(DROP)
+
+
+def rebuilding_message_table(*operations):
+    """
+    `operations` with the index dropped before and recreated (and refilled)
+    after, in both directions.
+    """
+    return [
+        migrations.RunPython(drop_index, create_index),
+        *operations,
+        migrations.RunPython(create_index, drop_index),
+    ]
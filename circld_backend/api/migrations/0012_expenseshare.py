@@ -0,0 +1,55 @@
+# Generated by Django 5.2.1 on 2026-10-17 20:00
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_shares(apps, schema_editor):
+    """
+    Expenses created before shares existed were meant to be split evenly,
+    so split each one across the group's current members.
+    """
+    Expense      = apps.get_model('api', 'Expense')
+    ExpenseShare = apps.get_model('api', 'ExpenseShare')
+    Group        = apps.get_model('api', 'Group')
+
+    members = {}
+    for group in Group.objects.prefetch_related('members'):
+        members[group.pk] = sorted(m.pk for m in group.members.all())
+
+    shares = []
+    for expense in Expense.objects.iterator():
+        user_ids = members.get(expense.group_id) or []
+        if not user_ids:
+            continue
+        cents = int(expense.amount * 100)
+        base, extra = divmod(cents, len(user_ids))
+        for i, uid in enumerate(user_ids):
+            part = base + (1 if i < extra else 0)
+            shares.append(ExpenseShare(expense=expense, user_id=uid, amount=Decimal(part) / 100))
+    ExpenseShare.objects.bulk_create(shares, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_message_expense_group_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExpenseShare',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('expense', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shares', to='api.expense')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='expense_shares', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('expense', 'user'), name='api_expenseshare_unique_user')],
+            },
+        ),
+        migrations.RunPython(backfill_shares, migrations.RunPython.noop),
+    ]
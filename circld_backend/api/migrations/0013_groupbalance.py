@@ -0,0 +1,51 @@
+# Generated by Django 5.2.1 on 2026-10-17 20:03
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def fill_balances(apps, schema_editor):
+    Expense      = apps.get_model('api', 'Expense')
+    ExpenseShare = apps.get_model('api', 'ExpenseShare')
+    GroupBalance = apps.get_model('api', 'GroupBalance')
+
+    totals = {}
+    paid = (Expense.objects.filter(paid_by__isnull=False)
+                           .values('group_id', 'paid_by_id')
+                           .annotate(total=Sum('amount')))
+    for row in paid:
+        totals[(row['group_id'], row['paid_by_id'])] = [row['total'], 0]
+    owed = ExpenseShare.objects.values('expense__group_id', 'user_id').annotate(total=Sum('amount'))
+    for row in owed:
+        totals.setdefault((row['expense__group_id'], row['user_id']), [0, 0])[1] = row['total']
+
+    GroupBalance.objects.bulk_create(
+        [GroupBalance(group_id=g, user_id=u, paid=p, owed=o) for (g, u), (p, o) in totals.items()],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_expenseshare'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GroupBalance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('paid', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('owed', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('group', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='balances', to='api.group')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='group_balances', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('group', 'user'), name='api_groupbalance_unique_user')],
+            },
+        ),
+        migrations.RunPython(fill_balances, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.1 on 2026-10-17 20:26
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0019_profile_avatar_variants'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='expense',
+            name='created',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+    ]
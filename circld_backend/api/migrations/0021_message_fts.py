@@ -0,0 +1,23 @@
+# Full-text index over Message.text (SQLite FTS5); a no-op on other databases.
+#
+# The index is a view plus triggers on api_message (see api/message_fts.py),
+# so from here on any migration that rebuilds api_message on SQLite -- most
+# AlterField/RemoveField/AddField on Message that touch the table -- must be
+# wrapped in message_fts.rebuilding_message_table(), or it fails on the view
+# and leaves search unsynced. State-only changes can skip the table entirely
+# with SeparateDatabaseAndState (as 0024 does).
+
+from django.db import migrations
+
+from api.message_fts import create_index, drop_index
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0020_expense_created_default'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 5.2.1 on 2026-10-17 20:31
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, DateField, Sum
+from django.db.models.functions import TruncMonth
+
+
+def fill_rollups(apps, schema_editor):
+    Expense       = apps.get_model('api', 'Expense')
+    ExpenseRollup = apps.get_model('api', 'ExpenseRollup')
+
+    rows = (
+        Expense.objects.filter(paid_by__isnull=False)
+                       .annotate(month=TruncMonth('created', output_field=DateField()))
+                       .values('group_id', 'month', 'category', 'paid_by_id')
+                       .annotate(total=Sum('amount'), count=Count('id'))
+                       .order_by()
+    )
+    ExpenseRollup.objects.bulk_create(
+        [
+            ExpenseRollup(group_id=r['group_id'], month=r['month'], category=r['category'],
+                          payer_id=r['paid_by_id'], total=r['total'], count=r['count'])
+            for r in rows
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0021_message_fts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='expense',
+            name='category',
+            field=models.CharField(default='General', max_length=40),
+        ),
+        migrations.CreateModel(
+            name='ExpenseRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('category', models.CharField(max_length=40)),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('count', models.IntegerField(default=0)),
+                ('group', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='api.group')),
+                ('payer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='expense_rollups', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('group', 'month', 'category', 'payer'), name='api_expenserollup_unique_bucket')],
+            },
+        ),
+        migrations.RunPython(fill_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.1 on 2026-10-17 20:37
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0022_expense_category_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MessageArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('count', models.IntegerField(default=0)),
+                ('first_ts', models.DateTimeField()),
+                ('last_ts', models.DateTimeField()),
+                ('data', models.BinaryField()),
+                ('updated', models.DateTimeField(auto_now=True)),
+                ('group', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='message_archives', to='api.group')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('group', 'month'), name='api_messagearchive_unique_month')],
+            },
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.1 on 2026-10-17 20:40
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0023_message_archive'),
+    ]
+
+    operations = [
+        # Python-side default only, so nothing changes in the schema; on SQLite
+        # a real AlterField would rebuild api_message underneath the full-text
+        # view and triggers from 0021.
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name='message',
+                    name='ts',
+                    field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+                ),
+            ],
+        ),
+    ]
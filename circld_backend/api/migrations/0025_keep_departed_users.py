@@ -0,0 +1,30 @@
+# Generated by Django 5.2.1 on 2026-10-17 21:08
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0024_message_ts_default'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='expenserollup',
+            name='payer',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.RESTRICT, related_name='expense_rollups', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='expenseshare',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.RESTRICT, related_name='expense_shares', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='groupbalance',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.RESTRICT, related_name='group_balances', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.2.1 on 2026-10-17 21:13
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, DateField, Sum
+from django.db.models.functions import TruncMonth
+
+
+def fill_unknown_payer_rollups(apps, schema_editor):
+    Expense       = apps.get_model('api', 'Expense')
+    ExpenseRollup = apps.get_model('api', 'ExpenseRollup')
+
+    rows = (
+        Expense.objects.filter(paid_by__isnull=True)
+                       .annotate(month=TruncMonth('created', output_field=DateField()))
+                       .values('group_id', 'month', 'category')
+                       .annotate(total=Sum('amount'), count=Count('id'))
+                       .order_by()
+    )
+    ExpenseRollup.objects.bulk_create(
+        [
+            ExpenseRollup(group_id=r['group_id'], month=r['month'], category=r['category'],
+                          payer_id=None, total=r['total'], count=r['count'])
+            for r in rows
+        ],
+        batch_size=1000,
+    )
+
+
+def drop_unknown_payer_rollups(apps, schema_editor):
+    apps.get_model('api', 'ExpenseRollup').objects.filter(payer__isnull=True).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0025_keep_departed_users'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='expenserollup',
+            name='api_expenserollup_unique_bucket',
+        ),
+        migrations.AlterField(
+            model_name='expenserollup',
+            name='payer',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.RESTRICT, related_name='expense_rollups', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddConstraint(
+            model_name='expenserollup',
+            constraint=models.UniqueConstraint(condition=models.Q(('payer__isnull', False)), fields=('group', 'month', 'category', 'payer'), name='api_expenserollup_unique_bucket'),
+        ),
+        migrations.AddConstraint(
+            model_name='expenserollup',
+            constraint=models.UniqueConstraint(condition=models.Q(('payer__isnull', True)), fields=('group', 'month', 'category'), name='api_expenserollup_unique_unknown_payer'),
+        ),
+        migrations.RunPython(fill_unknown_payer_rollups, drop_unknown_payer_rollups),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.1 on 2026-10-17 21:15
+
+from django.db import migrations, models
+
+
+def fill_lookup_keys(apps, schema_editor):
+    # same folding as api.models.lookup_key (historical models have no save())
+    User = apps.get_model('api', 'User')
+    users = list(User.objects.only('id', 'username', 'email'))
+    for user in users:
+        user.username_key = (user.username or '').strip().casefold()
+        user.email_key    = (user.email or '').strip().casefold()
+    User.objects.bulk_update(users, ['username_key', 'email_key'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0026_rollup_unknown_payer'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='user',
+            name='api_user_username_lower',
+        ),
+        migrations.RemoveIndex(
+            model_name='user',
+            name='api_user_email_lower',
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='email_key',
+            field=models.TextField(default='', editable=False),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='username_key',
+            field=models.TextField(default='', editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['username_key'], name='api_user_username_key'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['email_key'], name='api_user_email_key'),
+        ),
+        migrations.RunPython(fill_lookup_keys, migrations.RunPython.noop),
+    ]
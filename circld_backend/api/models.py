@@ -1,21 +1,51 @@
 # Create your models here.
 from django.contrib.auth.models import AbstractUser
 import uuid
-from django.db import models
+from django.db import DEFAULT_DB_ALIAS, models
 from django.conf import settings
 # TEMP
-from django.db.models.signals import post_save
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.utils import timezone
 from django.dispatch import receiver
 
+def lookup_key(value):
+    """Case-insensitive form of a username or email, for login lookups."""
+    return (value or '').strip().casefold()
+
+
 # User = get_user_model()
 class User(AbstractUser):
-    pass
+    # carried in every JWT ('ver' claim); bumping it revokes the user's tokens
+    token_version = models.PositiveIntegerField(default=0, editable=False)
+    # lookup_key() of username / email, kept in step by save(). Folded in
+    # Python because SQLite's LOWER() only folds ASCII ('Ölaf' stays 'Ölaf')
+    username_key = models.TextField(default='', editable=False)
+    email_key    = models.TextField(default='', editable=False)
+
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # case-insensitive login lookups (see EmailOrUsernameBackend)
+            models.Index(fields=['username_key'], name='api_user_username_key'),
+            models.Index(fields=['email_key'], name='api_user_email_key'),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.username_key = lookup_key(self.username)
+        self.email_key    = lookup_key(self.email)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'username', 'email'} & set(update_fields):
+            kwargs['update_fields'] = {*update_fields, 'username_key', 'email_key'}
+        super().save(*args, **kwargs)
 
 class Profile(models.Model):
     user        = models.OneToOneField(User, on_delete=models.CASCADE)
     email_token = models.CharField(max_length=64, blank=True)
     pending_email = models.EmailField(blank=True)
     avatar      = models.ImageField(upload_to='avatars/', blank=True, null=True)
+    # resized copies of `avatar`, filled in by api.avatars after upload:
+    # {"sm": {"webp": "avatars/v/<hash>-sm.webp", "jpeg": …}, "md": …, "lg": …}
+    avatar_hash     = models.CharField(max_length=40, blank=True, editable=False)
+    avatar_variants = models.JSONField(default=dict, blank=True, editable=False)
 
     def __str__(self):
         return f"{self.user.username} Profile"
@@ -51,6 +81,9 @@ class Group(models.Model):
         default=generate_invite_code,
         editable=False  # hide from admin form; generated automatically
     )
+    # bumped whenever anything a client renders for this group changes
+    # (see touch_groups); used as the ETag/Last-Modified validator
+    updated = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.name
@@ -65,12 +98,173 @@ class Expense(models.Model):
     )
     amount  = models.DecimalField(max_digits=10, decimal_places=2)
     note    = models.CharField(max_length=255, blank=True)
-    created = models.DateTimeField(auto_now_add=True)
+    category = models.CharField(max_length=40, default='General')
+    # not auto_now_add: imported expenses keep their original dates
+    created = models.DateTimeField(default=timezone.now, editable=False)
+
+    class Meta:
+        indexes = [
+            # backs the per-group, newest-first keyset pages
+            models.Index(fields=['group', 'created'], name='api_expense_group_created'),
+        ]
 
     def __str__(self):
         return f"{self.paid_by.username if self.paid_by else 'Unknown'}: ${self.amount} {self.note}"
 
 
+class ExpenseShare(models.Model):
+    """
+    One member's part of an expense. Shares of an expense always add up to
+    its amount to the cent (see balances.split_amount).
+    """
+    expense = models.ForeignKey('Expense', on_delete=models.CASCADE, related_name='shares')
+    # RESTRICT, not CASCADE: losing a share would leave the expense and the
+    # group's balances short (see accounts.delete_account); deleting the
+    # whole group still takes the shares with it
+    user    = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.RESTRICT,
+        related_name='expense_shares'
+    )
+    amount  = models.DecimalField(max_digits=10, decimal_places=2)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['expense', 'user'], name='api_expenseshare_unique_user'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} owes ${self.amount} of expense #{self.expense_id}"
+
+
+class OutboxEmail(models.Model):
+    """
+    An email waiting to be delivered by `manage.py send_queued_mail`, so
+    requests never block on (or fail because of) the SMTP server.
+    """
+    PENDING = 'pending'
+    SENT    = 'sent'
+    FAILED  = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (SENT,    'Sent'),
+        (FAILED,  'Failed'),
+    ]
+
+    subject         = models.CharField(max_length=255)
+    body            = models.TextField()
+    from_email      = models.CharField(max_length=255)
+    recipients      = models.JSONField(default=list)
+    status          = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts        = models.PositiveIntegerField(default=0)
+    # also used as a lease: a worker pushes it forward before sending
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error      = models.TextField(blank=True)
+    created         = models.DateTimeField(auto_now_add=True)
+    sent_at         = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='api_outbox_due'),
+        ]
+
+    def __str__(self):
+        return f"[{self.status}] {self.subject} → {', '.join(self.recipients)}"
+
+
+class ReadMarker(models.Model):
+    """
+    The newest message a user has read in a group; unread counts are the
+    group's messages above it (see GroupViewSet.unread).
+    """
+    group = models.ForeignKey('Group', on_delete=models.CASCADE, related_name='read_markers')
+    user  = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='read_markers'
+    )
+    last_read_message_id = models.BigIntegerField(default=0)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['group', 'user'], name='api_readmarker_unique_user'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} read {self.group.name} up to #{self.last_read_message_id}"
+
+
+class GroupBalance(models.Model):
+    """
+    Running totals of what a user paid and owes inside a group, kept in
+    step with every expense write by balances.record_expense /
+    remove_expense so balance reads never touch the expense table.
+    """
+    group = models.ForeignKey('Group', on_delete=models.CASCADE, related_name='balances')
+    user  = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.RESTRICT,
+        related_name='group_balances'
+    )
+    paid  = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    owed  = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['group', 'user'], name='api_groupbalance_unique_user'),
+        ]
+
+    @property
+    def balance(self):
+        return self.paid - self.owed
+
+    def __str__(self):
+        return f"{self.user.username} in {self.group.name}: {self.balance}"
+
+
+class ExpenseRollup(models.Model):
+    """
+    Spend per (group, month, category, payer), kept in step with every
+    expense write alongside GroupBalance, so analytics read O(buckets)
+    rows instead of summing the expense table. Expenses without a payer
+    are counted in a payer=NULL ("unknown payer") bucket.
+    """
+    group    = models.ForeignKey('Group', on_delete=models.CASCADE, related_name='rollups')
+    # first day of the month, in settings.TIME_ZONE
+    month    = models.DateField()
+    category = models.CharField(max_length=40)
+    payer    = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.RESTRICT,
+        null=True,
+        blank=True,
+        related_name='expense_rollups'
+    )
+    total    = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    count    = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['group', 'month', 'category', 'payer'],
+                condition=models.Q(payer__isnull=False),
+                name='api_expenserollup_unique_bucket',
+            ),
+            # NULLs never clash in a unique index, so the unknown-payer
+            # bucket needs its own
+            models.UniqueConstraint(
+                fields=['group', 'month', 'category'],
+                condition=models.Q(payer__isnull=True),
+                name='api_expenserollup_unique_unknown_payer',
+            ),
+        ]
+
+    def __str__(self):
+        payer = self.payer.username if self.payer_id else "unknown payer"
+        return f"{self.group.name} {self.month:%Y-%m} {self.category} by {payer}: {self.total}"
+
+
 class Message(models.Model):
     group  = models.ForeignKey('Group', on_delete=models.CASCADE, related_name='messages')
     sender = models.ForeignKey(
@@ -80,7 +274,133 @@ class Message(models.Model):
         related_name='sent_messages'
     )
     text = models.TextField()
-    ts   = models.DateTimeField(auto_now_add=True)
+    # not auto_now_add, so seeded and restored history keeps its timestamps
+    ts   = models.DateTimeField(default=timezone.now, editable=False)
+
+    class Meta:
+        indexes = [
+            # backs the per-group keyset pages and after_id polling
+            models.Index(fields=['group', 'ts'], name='api_message_group_ts'),
+        ]
 
     def __str__(self):
         return f"{self.sender.username if self.sender else 'Unknown'} @ {self.ts:%H:%M}: {self.text[:20]}"
+
+
+class MessageArchive(models.Model):
+    """
+    One group's archived messages for one month, moved out of api_message
+    by the archive_messages command and stored as a zlib-compressed JSON
+    list of [id, sender_id, text, ts] (see api/archive.py).
+    """
+    group    = models.ForeignKey('Group', on_delete=models.CASCADE, related_name='message_archives')
+    # first day of the month, in settings.TIME_ZONE
+    month    = models.DateField()
+    count    = models.IntegerField(default=0)
+    first_ts = models.DateTimeField()
+    last_ts  = models.DateTimeField()
+    data     = models.BinaryField()
+    updated  = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['group', 'month'], name='api_messagearchive_unique_month'),
+        ]
+
+    def __str__(self):
+        return f"{self.group.name} {self.month:%Y-%m}: {self.count} messages"
+
+
+
+# Keep Group.updated moving whenever a group's payloads change, so polled
+# endpoints can answer 304 without serializing anything.
+def touch_groups(**filters):
+    Group.objects.filter(**filters).update(updated=timezone.now())
+
+
+@receiver(m2m_changed, sender=Group.members.through)
+def touch_group_on_membership(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        touch_groups(pk=instance.pk)
+    elif pk_set:
+        # user.circld_groups.add(...) — the groups are in pk_set
+        touch_groups(pk__in=pk_set)
+    else:
+        touch_groups(members=instance)
+
+
+@receiver([post_save, post_delete], sender=Expense)
+@receiver([post_save, post_delete], sender=Message)
+def touch_group_on_activity(sender, instance, **kwargs):
+    # a cascade from deleting the group itself (or its owner) would touch
+    # a row that is about to go, once per message and expense
+    origin = kwargs.get('origin')
+    if 'origin' in kwargs and getattr(origin, 'model', type(origin)) is not sender:
+        return
+    # last-message previews and total spend in the group list
+    touch_groups(pk=instance.group_id)
+
+
+@receiver(post_save, sender=Profile)
+@receiver([post_save, pre_delete], sender=User)
+def touch_groups_on_user_change(sender, instance, **kwargs):
+    # names and avatars show up in member lists and chat bubbles; deleting
+    # a user drops their memberships without an m2m_changed signal
+    user_id = instance.user_id if sender is Profile else instance.pk
+    touch_groups(members=user_id)
+
+
+@receiver([post_save, post_delete], sender=User)
+def forget_cached_auth_user(sender, instance, **kwargs):
+    # email change, password reset, deactivation, account deletion, admin
+    # edits… must not be served from the auth cache afterwards
+    from .authentication import forget_cached_user
+    forget_cached_user(instance)
+
+
+# Cached membership sets (see api/membership.py). join, leave and
+# remove_member all go through group.members, so m2m_changed covers them.
+# Who to forget is read from the primary; a replica may not have the
+# latest membership yet.
+@receiver(m2m_changed, sender=Group.members.through)
+def forget_memberships_on_change(sender, instance, action, reverse, pk_set, **kwargs):
+    from .membership import forget_memberships
+    if reverse and action in ('post_add', 'post_remove', 'post_clear'):
+        forget_memberships([instance.pk])
+    elif action in ('post_add', 'post_remove'):
+        forget_memberships(pk_set or ())
+    elif action == 'pre_clear':
+        # afterwards there's no telling who was in the group
+        forget_memberships(instance.members.using(DEFAULT_DB_ALIAS).values_list('id', flat=True))
+
+
+@receiver(pre_save, sender=Group)
+def forget_memberships_on_owner_change(sender, instance, raw, **kwargs):
+    if raw or instance._state.adding:
+        return
+    from .membership import forget_memberships
+    old_owner = (
+        Group.objects.using(DEFAULT_DB_ALIAS)
+                     .filter(pk=instance.pk).values_list('owner_id', flat=True).first()
+    )
+    if old_owner != instance.owner_id:
+        forget_memberships([old_owner, instance.owner_id])
+
+
+@receiver(post_save, sender=Group)
+def forget_memberships_on_create(sender, instance, created, **kwargs):
+    if created:
+        from .membership import forget_memberships
+        forget_memberships([instance.owner_id])
+
+
+@receiver(pre_delete, sender=Group)
+def forget_memberships_on_delete(sender, instance, **kwargs):
+    # the cascade clears the through rows without an m2m_changed signal
+    from .membership import forget_memberships
+    forget_memberships([
+        instance.owner_id,
+        *instance.members.using(DEFAULT_DB_ALIAS).values_list('id', flat=True),
+    ])
@@ -0,0 +1,181 @@
+# api/pagination.py
+import base64
+import binascii
+import json
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetCursorPagination(BasePagination):
+    """
+    Opaque-cursor keyset pagination.
+
+    The cursor stores the ordering values of the last row on the page, so
+    every page is a `WHERE (a, id) < (x, y) ORDER BY a, id LIMIT n` range
+    scan on a composite index — no OFFSET, however deep the history goes.
+
+    `ordering` must end with a unique field (the primary key) so ties on
+    the leading field are still strictly ordered.
+
+    Pagination is opt-in: requests without `cursor` or `page_size` get the
+    plain list the app already expects.
+    """
+
+    ordering = ('-id',)
+    page_size = 50
+    max_page_size = 200
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        params = request.query_params
+        if self.cursor_query_param not in params and self.page_size_query_param not in params:
+            return None
+
+        self.request   = request
+        self.view      = view
+        self.base_url  = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.fields    = [queryset.model._meta.get_field(f.lstrip('-')) for f in self.ordering]
+
+        cursor = self.decode_cursor(request)
+        reverse = bool(cursor and cursor['r'])
+
+        rows = self.fetch(queryset, cursor['p'] if cursor else None, reverse)
+        has_more = len(rows) > self.page_size
+        page = rows[:self.page_size]
+        if reverse:
+            page.reverse()
+
+        # We only know for sure there's more in the direction we travelled;
+        # the other direction exists whenever we arrived via a cursor.
+        self.has_next     = has_more if not reverse else True
+        self.has_previous = has_more if reverse else cursor is not None
+        self.page = page
+        return page
+
+    def fetch(self, queryset, position, reverse):
+        """Up to page_size + 1 rows after `position`, in travel order."""
+        if position is not None:
+            queryset = queryset.filter(self.keyset_filter(position, reverse))
+        ordering = [self.flip(f) for f in self.ordering] if reverse else list(self.ordering)
+        return list(queryset.order_by(*ordering)[:self.page_size + 1])
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next':     self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results':  data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next':     {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results':  schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            # walked off the end: drop the cursor to restart from the top
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    # --- cursor helpers --------------------------------------------------
+
+    @staticmethod
+    def flip(field):
+        return field[1:] if field.startswith('-') else f'-{field}'
+
+    def keyset_filter(self, position, reverse):
+        """
+        Rows strictly after `position` in the (possibly reversed) ordering.
+        The leading bound is kept sargable (`a <= x AND (a < x OR id < y)`)
+        so the database can range-scan the composite index.
+        """
+        lookups = []
+        for spec in self.ordering:
+            descending = spec.startswith('-') != reverse
+            lookups.append((spec.lstrip('-'), 'lt' if descending else 'gt'))
+
+        strictly_after = Q()
+        equal_so_far = Q()
+        for (name, op), value in zip(lookups, position):
+            strictly_after |= equal_so_far & Q(**{f'{name}__{op}': value})
+            equal_so_far &= Q(**{name: value})
+
+        lead, op = lookups[0]
+        return Q(**{f'{lead}__{op}e': position[0]}) & strictly_after
+
+    def encode_cursor(self, obj, reverse):
+        position = [field.value_to_string(obj) for field in self.fields]
+        raw = json.dumps({'p': position, 'r': int(reverse)}, separators=(',', ':'))
+        token = base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+        return replace_query_param(self.base_url, self.cursor_query_param, token)
+
+    def decode_cursor(self, request):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None
+        try:
+            padded = token + '=' * (-len(token) % 4)
+            data = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+            position = [
+                field.to_python(value)
+                for field, value in zip(self.fields, data['p'], strict=True)
+            ]
+            return {'p': position, 'r': bool(data.get('r'))}
+        except (TypeError, ValueError, KeyError, binascii.Error, DjangoValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+
+class MessageCursorPagination(KeysetCursorPagination):
+    """
+    Newest first; `next` walks back through the history and, past the
+    oldest message still in api_message, on into the group's archive
+    (see api/archive.py), which the view hands over through
+    `archived_messages(position, descending, limit)`.
+    """
+    ordering = ('-ts', '-id')
+
+    def fetch(self, queryset, position, reverse):
+        rows  = super().fetch(queryset, position, reverse)
+        limit = self.page_size + 1
+        archived = getattr(self.view, 'archived_messages', None)
+        # archived messages are all older than the hot ones, so walking
+        # back they're only needed once the table runs out
+        if archived is None or (not reverse and len(rows) >= limit):
+            return rows
+        older = archived(position, not reverse, limit)
+        if not older:
+            return rows
+        merged = sorted(rows + older, key=lambda m: (m.ts, m.id), reverse=not reverse)
+        return merged[:limit]
+
+
+class ExpenseCursorPagination(KeysetCursorPagination):
+    ordering = ('-created', '-id')
@@ -0,0 +1,38 @@
+# api/query_count.py
+"""
+X-Query-Count: the number of SQL statements a request ran, across every
+database alias, so load tests and the browser's network tab can spot
+endpoints whose query count grows with the data.
+
+On when settings.QUERY_COUNT_HEADER is true (DEBUG by default). Queries a
+streaming response runs while it streams happen after the header is sent
+and aren't counted.
+"""
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+
+class QueryCountMiddleware:
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'QUERY_COUNT_HEADER', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        count = 0
+
+        def counter(execute, sql, params, many, context):
+            nonlocal count
+            count += 1
+            return execute(sql, params, many, context)
+
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(counter))
+            response = self.get_response(request)
+        response['X-Query-Count'] = str(count)
+        return response
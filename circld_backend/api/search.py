@@ -0,0 +1,93 @@
+# api/search.py
+"""
+Message search backed by the api_message_fts FTS5 index (see
+api/message_fts.py), which triggers keep in step with api_message. Other databases fall
+back to an unranked `icontains` filter.
+"""
+import html
+import re
+
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from .models import Message
+
+# sentinels for snippet(); swapped for <mark> after the text is escaped
+_OPEN, _CLOSE = '\x02', '\x03'
+SNIPPET_TOKENS = 12
+MAX_TERMS      = 12
+
+
+def search_terms(q):
+    return re.findall(r'\w+', q or '', re.UNICODE)[:MAX_TERMS]
+
+
+def fts_query(terms, group_id=None):
+    """
+    An FTS5 MATCH expression that can't be broken by user input: every
+    term is quoted, all must match, and the last one also matches as a
+    prefix so results show up while the user is still typing.
+    """
+    quoted = [f'"{term}"' for term in terms]
+    quoted[-1] += '*'
+    expression = f"text : ({' '.join(quoted)})"
+    if group_id is not None:
+        expression = f"grp : g{int(group_id)} AND {expression}"
+    return expression
+
+
+def uses_fts():
+    return connection.vendor == 'sqlite'
+
+
+def search_group_messages(group_id, q, limit, offset=0):
+    """
+    [(message id, snippet HTML)] best match first. Snippets are escaped,
+    with matches wrapped in <mark>.
+    """
+    terms = search_terms(q)
+    if not terms:
+        return []
+
+    if not uses_fts():
+        ids = (
+            Message.objects
+                   .filter(group_id=group_id, text__icontains=' '.join(terms))
+                   .order_by('-ts', '-id')
+                   .values_list('id', flat=True)[offset:offset + limit]
+        )
+        return [(pk, None) for pk in ids]
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT rowid, snippet(api_message_fts, 0, %s, %s, '…', %s)
+              FROM api_message_fts
+             WHERE api_message_fts MATCH %s
+             ORDER BY bm25(api_message_fts, 1.0, 0.0), rowid DESC
+             LIMIT %s OFFSET %s
+            """,
+            [_OPEN, _CLOSE, SNIPPET_TOKENS, fts_query(terms, group_id), limit, offset],
+        )
+        return [(pk, highlight(snippet)) for pk, snippet in cursor.fetchall()]
+
+
+def text_match(q):
+    """
+    A Q() matching messages whose text matches `q`, resolved by the index
+    in a subquery (None if `q` has nothing to search for).
+    """
+    terms = search_terms(q)
+    if not terms:
+        return None
+    return Q(pk__in=RawSQL(
+        "SELECT rowid FROM api_message_fts WHERE api_message_fts MATCH %s",
+        [fts_query(terms)],
+    ))
+
+
+def highlight(snippet):
+    if snippet is None:
+        return None
+    return html.escape(snippet).replace(_OPEN, '<mark>').replace(_CLOSE, '</mark>')
@@ -1,12 +1,17 @@
 # api/serializers.py
 from django.contrib.auth import get_user_model
 from rest_framework import serializers
-from .models import Group, Expense, Message, Profile #(last one TEMP)
+from rest_framework.relations import MANY_RELATION_KWARGS
+from .models import Group, Expense, ExpenseShare, Message, Profile #(last one TEMP)
+from .authentication import TOKEN_VERSION_CLAIM
+from .avatars import SIZES as AVATAR_SIZES, avatar_url, schedule_variants
+from .balances import record_expense
+from .mail import queue_mail
 import random
 from django.utils.crypto import get_random_string
 from django.conf import settings
-from django.core.mail import send_mail
 from rest_framework.validators import UniqueValidator
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 
 User = get_user_model()
 
@@ -16,6 +21,38 @@ from rest_framework import serializers
 
 # from .serializers import ProfileSerializer
 
+class _BulkManyRelatedField(serializers.ManyRelatedField):
+    # ManyRelatedField asks the child for each id, i.e. one query per id
+    def to_internal_value(self, data):
+        if isinstance(data, str) or not hasattr(data, '__iter__'):
+            self.fail('not_a_list', input_type=type(data).__name__)
+        if not self.allow_empty and len(data) == 0:
+            self.fail('empty')
+        child = self.child_relation
+        pks = []
+        for value in data:
+            if isinstance(value, bool):
+                child.fail('incorrect_type', data_type=type(value).__name__)
+            try:
+                pks.append(int(value))
+            except (TypeError, ValueError):
+                child.fail('incorrect_type', data_type=type(value).__name__)
+        found = child.get_queryset().in_bulk(pks)
+        for pk in pks:
+            if pk not in found:
+                child.fail('does_not_exist', pk_value=pk)
+        return [found[pk] for pk in pks]
+
+
+class BulkPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """PrimaryKeyRelatedField whose many=True form looks every id up at once."""
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        list_kwargs = {key: value for key, value in kwargs.items() if key in MANY_RELATION_KWARGS}
+        return _BulkManyRelatedField(child_relation=cls(*args, **kwargs), **list_kwargs)
+
+
 class UserSerializer(serializers.ModelSerializer):
     avatar   = serializers.SerializerMethodField()
     is_admin = serializers.SerializerMethodField()
@@ -31,33 +68,53 @@ class UserSerializer(serializers.ModelSerializer):
         except ObjectDoesNotExist:
             return None
 
-        # if you still have the ProfileSerializer, you could do:
-        if not profile.avatar:
-            return None
-
-        request = self.context.get("request", None)
-        url     = profile.avatar.url
-        return request.build_absolute_uri(url) if request else url
+        # member lists show mid-sized avatars unless the caller says otherwise
+        size = self.context.get("avatar_size", "md")
+        return avatar_url(profile, size, self.context.get("request"))
 
     def get_is_admin(self, user):
-        # try to pull group_id from the context; if it's missing, just return False
+        owner_id = self._group_owner_id()
+        return owner_id is not None and owner_id == user.id
+
+    def _group_owner_id(self):
+        # callers that already have the group pass `group_owner_id`;
+        # otherwise resolve `group_id` once per response, not once per user
+        if 'group_owner_id' in self.context:
+            return self.context['group_owner_id']
+
         group_id = self.context.get('group_id')
         if not group_id:
-            return False
+            return None
 
-        try:
-            group = Group.objects.get(pk=group_id)
-        except Group.DoesNotExist:
-            return False
+        # with many=True this child serializer is shared by every row
+        if '_owner_id' not in self.__dict__:
+            self._owner_id = (
+                Group.objects.filter(pk=group_id)
+                             .values_list('owner_id', flat=True)
+                             .first()
+            )
+        return self._owner_id
+
+
+class VersionedTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """
+    Stamp issued tokens with the user's token_version so they can be
+    revoked (see CachedJWTAuthentication); access tokens minted from the
+    refresh token inherit the claim.
+    """
 
-        return group.owner_id == user.id
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        token[TOKEN_VERSION_CLAIM] = user.token_version
+        return token
 
 
 class GroupSerializer(serializers.ModelSerializer):
     owner_id       = serializers.ReadOnlyField(source='owner.id')
     owner_username = serializers.ReadOnlyField(source='owner.username')
 
-    members = serializers.PrimaryKeyRelatedField(
+    members = BulkPrimaryKeyRelatedField(
         many=True,
         queryset=User.objects.all(),
         required=False,        # <— allow POST data without "members"
@@ -68,8 +125,61 @@ class GroupSerializer(serializers.ModelSerializer):
         model = Group
         fields = ['id', 'name', 'members', 'invite_code', 'owner_id', 'owner_username']
 
+class GroupSummarySerializer(serializers.ModelSerializer):
+    """
+    Group list rows. Everything comes from annotations on the list
+    queryset (see GroupViewSet.get_queryset), so there are no per-group
+    follow-up queries; fetch groups/{id}/ for the member ids.
+    """
+    owner_id            = serializers.ReadOnlyField()
+    owner_username      = serializers.ReadOnlyField(source='owner.username')
+    member_count        = serializers.IntegerField(read_only=True)
+    last_message_text   = serializers.CharField(read_only=True)
+    last_message_sender = serializers.CharField(read_only=True)
+    last_message_ts     = serializers.DateTimeField(format='%Y-%m-%dT%H:%M:%SZ', read_only=True)
+    total_spend         = serializers.DecimalField(max_digits=12, decimal_places=2, read_only=True)
+
+    class Meta:
+        model = Group
+        fields = [
+            'id', 'name', 'invite_code', 'owner_id', 'owner_username',
+            'member_count', 'last_message_text', 'last_message_sender',
+            'last_message_ts', 'total_spend',
+        ]
+
+
+class ReadMarkerInputSerializer(serializers.Serializer):
+    group      = serializers.IntegerField()
+    # omit to mark everything currently in the group as read
+    message_id = serializers.IntegerField(required=False, min_value=0)
+
+
+class MarkReadSerializer(serializers.Serializer):
+    markers = ReadMarkerInputSerializer(many=True, allow_empty=False)
+
+
+class UnreadCountSerializer(serializers.Serializer):
+    group                = serializers.IntegerField(source='id')
+    unread               = serializers.IntegerField()
+    last_read_message_id = serializers.IntegerField()
+
+
+class ExpenseShareSerializer(serializers.ModelSerializer):
+    class Meta:
+        model  = ExpenseShare
+        fields = ['user', 'amount']
+
+
 class ExpenseSerializer(serializers.ModelSerializer):
     paid_by_username = serializers.CharField(source='paid_by.username', read_only=True)
+    # who the expense is split between; defaults to every group member
+    split_between = BulkPrimaryKeyRelatedField(
+        many=True,
+        queryset=User.objects.all(),
+        required=False,
+        write_only=True,
+    )
+    shares = ExpenseShareSerializer(many=True, read_only=True)
 
     class Meta:
         model = Expense
@@ -80,10 +190,90 @@ class ExpenseSerializer(serializers.ModelSerializer):
             'paid_by_username',  # read-only in response
             'amount',
             'note',
+            'category',
             'created',
+            'split_between',     # write-only list of user ids
+            'shares',            # read-only per-member split
         ]
         read_only_fields = ['created', 'paid_by_username']
 
+    def validate_amount(self, value):
+        if value <= 0:
+            raise serializers.ValidationError("Amount must be greater than zero.")
+        return value
+
+    def validate_category(self, value):
+        return value.strip() or 'General'
+
+    def validate(self, data):
+        if self.instance is not None and 'group' in data and data['group'].pk != self.instance.group_id:
+            # the shares and balances belong to the old group's members
+            raise serializers.ValidationError(
+                {"group": "An expense can't be moved to another group."}
+            )
+        group = data.get('group') or getattr(self.instance, 'group', None)
+        split = data.get('split_between')
+        payer = data.get('paid_by')
+        if group is None or (split is None and payer is None):
+            return data
+
+        member_ids = set(group.members.values_list('id', flat=True))
+        if payer is not None and payer.pk not in member_ids:
+            raise serializers.ValidationError(
+                {"paid_by": "Not a member of this group."}
+            )
+        if split is not None:
+            if not split:
+                raise serializers.ValidationError(
+                    {"split_between": "Select at least one member."}
+                )
+            outsiders = [u.pk for u in split if u.pk not in member_ids]
+            if outsiders:
+                raise serializers.ValidationError(
+                    {"split_between": f"Not members of this group: {outsiders}"}
+                )
+        return data
+
+    def create(self, validated_data):
+        split = validated_data.pop('split_between', None)
+        return record_expense(Expense(**validated_data), split)
+
+    def update(self, instance, validated_data):
+        split = validated_data.pop('split_between', None)
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+        # split=None keeps the same people and re-splits the (new) amount
+        return record_expense(instance, split)
+
+
+class BalanceSerializer(serializers.Serializer):
+    user_id  = serializers.IntegerField()
+    username = serializers.CharField()
+    name     = serializers.CharField()
+    # False for someone who left the group with a balance still open
+    member   = serializers.BooleanField()
+    paid     = serializers.DecimalField(max_digits=12, decimal_places=2)
+    owed     = serializers.DecimalField(max_digits=12, decimal_places=2)
+    balance  = serializers.DecimalField(max_digits=12, decimal_places=2)
+
+
+class SpendBucketSerializer(serializers.Serializer):
+    # only the dimensions the caller grouped by are present
+    month          = serializers.DateField(format='%Y-%m', required=False)
+    category       = serializers.CharField(required=False)
+    payer_id       = serializers.IntegerField(required=False)
+    payer_username = serializers.CharField(required=False)
+    total          = serializers.DecimalField(max_digits=14, decimal_places=2)
+    count          = serializers.IntegerField()
+
+
+class TransferSerializer(serializers.Serializer):
+    from_user     = serializers.IntegerField()
+    from_username = serializers.CharField()
+    to_user       = serializers.IntegerField()
+    to_username   = serializers.CharField()
+    amount        = serializers.DecimalField(max_digits=12, decimal_places=2)
+
 
 from rest_framework import serializers
 from .models import Message
@@ -112,21 +302,40 @@ class MessageSerializer(serializers.ModelSerializer):
         Look up the sender’s profile.avatar and prepend
         the full URL if we have a request in context.
         """
-        try:
-            profile = message.sender.profile
-        except Exception:
-            return None
+        return self._sender_display(message)[1]
 
-        if not getattr(profile, 'avatar', None):
-            return None
+    def get_sender_name(self, message):
+        return self._sender_display(message)[0]
 
-        avatar_url = profile.avatar.url
-        request    = self.context.get('request')
-        return request.build_absolute_uri(avatar_url) if request else avatar_url
+    def _sender_display(self, message):
+        """
+        (display name, avatar URL) for the message's sender, computed once
+        per sender per response — a page of chat is mostly the same few
+        people, and the viewset select_related()s sender + profile.
+        """
+        # with many=True this child serializer is shared by every row
+        cache = self.__dict__.setdefault('_sender_cache', {})
+        if message.sender_id in cache:
+            return cache[message.sender_id]
 
-    def get_sender_name(self, message):
         user = message.sender
-        return f"{user.first_name} {user.last_name}".strip() or user.username
+        if user is None:
+            display = (None, None)
+        else:
+            name = f"{user.first_name} {user.last_name}".strip() or user.username
+            display = (name, self._avatar_url(user))
+        cache[message.sender_id] = display
+        return display
+
+    def _avatar_url(self, user):
+        try:
+            profile = user.profile
+        except ObjectDoesNotExist:
+            return None
+
+        # chat bubbles are tiny
+        size = self.context.get('avatar_size', 'sm')
+        return avatar_url(profile, size, self.context.get('request'))
 
 
 class SignupSerializer(serializers.ModelSerializer):
@@ -208,8 +417,8 @@ class SignupSerializer(serializers.ModelSerializer):
         user.profile.email_token = code
         user.profile.save()
 
-        # send verification email
-        send_mail(
+        # queue the verification email (delivered by send_queued_mail)
+        queue_mail(
             subject    = "Welcome to Circld! Here's your verification code",
             message    = (
                 f"Hi {user.first_name},\n\n"
@@ -221,7 +430,6 @@ class SignupSerializer(serializers.ModelSerializer):
             ),
             from_email = settings.DEFAULT_FROM_EMAIL,
             recipient_list=[user.email],
-            fail_silently=False,
         )
 
         return user
@@ -240,6 +448,8 @@ class ProfileSerializer(serializers.ModelSerializer):
     )
     # Allow uploading/updating avatar image
     avatar = serializers.ImageField(required=False)
+    # resized variants by size (original upload until they're built)
+    avatars = serializers.SerializerMethodField()
 
     class Meta:
         model = Profile
@@ -249,8 +459,15 @@ class ProfileSerializer(serializers.ModelSerializer):
             'last_name',
             'email',
             'avatar',
+            'avatars',
         ]
 
+    def get_avatars(self, profile):
+        if not profile.avatar:
+            return None
+        request = self.context.get('request')
+        return {size: avatar_url(profile, size, request) for size in AVATAR_SIZES}
+
     def update(self, instance, validated_data):
         # 1) Pop off any nested 'user' data
         user_data = validated_data.pop('user', {})
@@ -259,7 +476,15 @@ class ProfileSerializer(serializers.ModelSerializer):
             setattr(instance.user, attr, value)
         instance.user.save()
         # 3) Let ModelSerializer handle the rest (i.e. avatar)
-        return super().update(instance, validated_data)
+        new_avatar = 'avatar' in validated_data
+        if new_avatar:
+            # the old variants no longer match; serve the upload until
+            # the new ones are built
+            validated_data['avatar_variants'] = {}
+        profile = super().update(instance, validated_data)
+        if new_avatar and profile.avatar:
+            schedule_variants(profile)
+        return profile
 
 class RequestEmailChangeSerializer(serializers.Serializer):
     email = serializers.EmailField(
@@ -0,0 +1,131 @@
+"""
+Logging in by username or email, and the cached JWT user lookup.
+"""
+import os
+import subprocess
+import sys
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import authenticate
+from django.core.cache import cache
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from .authentication import CachedJWTAuthentication, EmailOrUsernameBackend, user_cache_key
+from .db_router import PrimaryReplicaRouter
+from .models import User
+from .testing import access_token
+
+
+class LoginLookupTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.olaf  = User.objects.create_user('Ölaf', 'Olaf.Sen@Example.com', 'pw-12345678')
+        self.emile = User.objects.create_user('Émile', 'emile@example.com', 'pw-12345678')
+        self.backend = EmailOrUsernameBackend()
+
+    def test_usernames_match_in_any_case(self):
+        for ident in ('Ölaf', 'ölaf', 'ÖLAF', '  ölaf '):
+            with self.subTest(ident):
+                self.assertEqual(self.backend.get_user_by_identifier(ident), self.olaf)
+        self.assertEqual(self.backend.get_user_by_identifier('ÉMILE'), self.emile)
+
+    def test_emails_match_in_any_case(self):
+        self.assertEqual(self.backend.get_user_by_identifier('olaf.sen@example.com'), self.olaf)
+        self.assertEqual(self.backend.get_user_by_identifier('EMILE@EXAMPLE.COM'), self.emile)
+
+    def test_a_username_beats_someone_elses_email(self):
+        squatter = User.objects.create_user('emile@example.com', 'other@example.com', 'pw-12345678')
+        self.assertEqual(self.backend.get_user_by_identifier('Emile@Example.com'), squatter)
+
+    def test_keys_follow_renames(self):
+        self.olaf.username = 'Ødegaard'
+        self.olaf.save(update_fields=['username'])
+        self.assertIsNone(self.backend.get_user_by_identifier('ölaf'))
+        self.assertEqual(self.backend.get_user_by_identifier('ødegaard'), self.olaf)
+
+    def test_one_query(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.backend.get_user_by_identifier('ölaf')
+        self.assertEqual(len(ctx), 1)
+        self.assertIn('username_key', ctx.captured_queries[0]['sql'])
+
+    def test_authenticate_and_token_endpoint(self):
+        self.assertEqual(authenticate(username='ÖLAF', password='pw-12345678'), self.olaf)
+        self.assertIsNone(authenticate(username='ÖLAF', password='wrong'))
+        self.assertIsNone(authenticate(username='nobody', password='pw-12345678'))
+        response = APIClient().post('/api/token/', {'username': 'émile', 'password': 'pw-12345678'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('access', response.data)
+
+
+class CachedJWTTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.alice = User.objects.create_user('alice', 'alice@example.com', 'pw-12345678')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {access_token(self.alice)}')
+
+    def user_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(self.client.get('/api/profile/').status_code, 200)
+        return [q['sql'] for q in ctx.captured_queries if 'FROM "api_user"' in q['sql']]
+
+    def test_the_user_is_looked_up_once(self):
+        self.assertTrue(self.user_queries())
+        self.assertEqual(self.user_queries(), [])
+
+    def test_password_reset_revokes_cached_tokens(self):
+        self.user_queries()
+        self.alice.profile.email_token = '123456'
+        self.alice.profile.save()
+        response = APIClient().post('/api/auth/password-reset/confirm/', {
+            'email': 'alice@example.com', 'token': '123456',
+            'new_password': 'another-pw-987', 'new_password2': 'another-pw-987',
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        # DRF answers 403 rather than 401 because session auth comes first
+        self.assertEqual(self.client.get('/api/profile/').status_code, 403)
+
+    def test_deactivation_reaches_the_cache(self):
+        self.user_queries()
+        self.alice.is_active = False
+        self.alice.save()
+        self.assertEqual(self.client.get('/api/profile/').status_code, 403)
+
+    def test_cache_misses_ignore_the_replicas(self):
+        token = CachedJWTAuthentication().get_validated_token(access_token(self.alice))
+        # a replica alias that doesn't even exist would blow up any read sent there
+        with mock.patch.object(PrimaryReplicaRouter, 'db_for_read', return_value='lagging-replica'):
+            self.assertEqual(CachedJWTAuthentication().get_user(token), self.alice)
+
+    def test_the_cached_user_is_forgotten_again_on_commit(self):
+        key = user_cache_key(self.alice.pk, self.alice.token_version)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.alice.is_active = False
+            self.alice.save()
+            # a request in between re-caches the row from before the commit
+            cache.set(key, self.alice)
+        self.assertIsNone(cache.get(key))
+
+    def test_a_cache_outage_falls_back_to_the_database(self):
+        with mock.patch('api.authentication.cache') as broken:
+            broken.get.side_effect = broken.set.side_effect = ConnectionError("no redis")
+            self.assertEqual(self.client.get('/api/profile/').status_code, 200)
+
+
+class CacheSettingsTests(SimpleTestCase):
+
+    def test_tests_use_local_memory_and_everything_else_redis(self):
+        self.assertEqual(settings.CACHES['default']['BACKEND'], 'django.core.cache.backends.locmem.LocMemCache')
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': 'circld_backend.settings'}
+        env.pop('LOCAL_CACHE', None)
+        code = "from django.conf import settings; print(settings.CACHES['default']['BACKEND'])"
+        result = subprocess.run([sys.executable, '-c', code], env=env, capture_output=True, text=True,
+                                cwd=settings.BASE_DIR)
+        self.assertEqual(result.stdout.strip(), 'django.core.cache.backends.redis.RedisCache')
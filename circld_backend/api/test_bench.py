@@ -0,0 +1,122 @@
+"""
+Benchmark tooling: the seed_bench_data command and the X-Query-Count
+header (api/query_count.py).
+"""
+import io
+from decimal import Decimal
+
+from django.contrib.auth import authenticate
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.models import Sum
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from .balances import rebuild_expense_rollups, rebuild_group_balances
+from .models import Expense, ExpenseRollup, ExpenseShare, Group, GroupBalance, Message, Profile, User
+from .testing import api_client
+
+
+class SeedBenchDataTests(TestCase):
+
+    def seed(self, **opts):
+        options = dict(users=6, groups=3, members=3, expenses=40, messages=30, batch_size=7, password='pw-bench')
+        options.update(opts)
+        out = io.StringIO()
+        call_command('seed_bench_data', stdout=out, **options)
+        return out.getvalue()
+
+    def snapshot(self, model, *fields):
+        return sorted(model.objects.values_list(*fields))
+
+    def test_fills_every_table_consistently(self):
+        out = self.seed()
+        for label in ('users', 'groups', 'expenses', 'messages'):
+            self.assertIn(label, out)
+        self.assertEqual(User.objects.filter(username__startswith='bench').count(), 6)
+        self.assertEqual(Profile.objects.count(), 6)
+        self.assertEqual(Group.objects.count(), 3)
+        self.assertEqual((Expense.objects.count(), Message.objects.count()), (40, 30))
+        for group in Group.objects.prefetch_related('members'):
+            members = {user.pk for user in group.members.all()}
+            self.assertIn(group.owner_id, members)
+            self.assertTrue(set(Message.objects.filter(group=group).values_list('sender_id', flat=True)) <= members)
+
+        # every expense is split to the cent
+        for expense in Expense.objects.annotate(split=Sum('shares__amount')):
+            self.assertEqual(expense.split, expense.amount)
+        # the running balances and rollups match a rebuild from scratch
+        balances = self.snapshot(GroupBalance, 'group_id', 'user_id', 'paid', 'owed')
+        rollups  = self.snapshot(ExpenseRollup, 'group_id', 'month', 'category', 'payer_id', 'total', 'count')
+        rebuild_group_balances()
+        rebuild_expense_rollups()
+        self.assertEqual(self.snapshot(GroupBalance, 'group_id', 'user_id', 'paid', 'owed'), balances)
+        self.assertEqual(
+            self.snapshot(ExpenseRollup, 'group_id', 'month', 'category', 'payer_id', 'total', 'count'), rollups,
+        )
+        self.assertEqual(ExpenseShare.objects.aggregate(total=Sum('amount'))['total'],
+                         Expense.objects.aggregate(total=Sum('amount'))['total'])
+        self.assertEqual(sum(b.balance for b in GroupBalance.objects.all()), Decimal('0'))
+
+    def test_seeded_users_can_log_in(self):
+        self.seed()
+        user = User.objects.get(username='bench3')
+        self.assertEqual(authenticate(username='BENCH3', password='pw-bench'), user)
+        self.assertEqual(authenticate(username='bench3@example.com', password='pw-bench'), user)
+
+    def test_the_same_seed_gives_the_same_data(self):
+        self.seed(prefix='a')
+        first = self.snapshot(Expense, 'amount', 'category', 'note')
+        Expense.objects.all().delete()
+        self.seed(prefix='b')
+        self.assertEqual(self.snapshot(Expense, 'amount', 'category', 'note'), first)
+
+    def test_refuses_to_seed_twice_or_too_little(self):
+        self.seed()
+        with self.assertRaisesMessage(CommandError, 'already exist'):
+            self.seed()
+        with self.assertRaises(CommandError):
+            self.seed(prefix='other', users=1)
+
+
+class QueryCountHeaderTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.alice = User.objects.create_user('alice', 'alice@example.com', 'pw-12345678')
+
+    # middleware is loaded by each client's handler, after the override
+    client_for = staticmethod(api_client)
+
+    @override_settings(QUERY_COUNT_HEADER=True)
+    def test_counts_the_queries_each_request_ran(self):
+        client = self.client_for(self.alice)
+        for method, path, data in (
+            ('post', '/api/groups/', {'name': 'flat'}),
+            ('get', '/api/groups/', None),
+        ):
+            with self.subTest(method):
+                with CaptureQueriesContext(connection) as ctx:
+                    response = getattr(client, method)(path, data, format='json')
+                self.assertLess(response.status_code, 300)
+                # the count starts again from zero for every request
+                self.assertGreater(len(ctx), 0)
+                self.assertEqual(response['X-Query-Count'], str(len(ctx)))
+
+    @override_settings(QUERY_COUNT_HEADER=False)
+    def test_off_unless_enabled(self):
+        self.assertFalse(self.client_for(self.alice).get('/api/groups/').has_header('X-Query-Count'))
+
+
+class BenchLoginTests(TestCase):
+
+    def test_explains_the_lookup_the_backend_runs(self):
+        out = io.StringIO()
+        call_command('bench_login', users=30, lookups=10, logins=1, batch_size=7, cleanup=True, stdout=out)
+        plan = out.getvalue().split('query plan:')[1].split('lookups:')[0]
+        self.assertIn('api_user_username_key', plan)
+        self.assertIn('api_user_email_key', plan)
+        self.assertNotIn('SCAN api_user', plan)
+        self.assertIn('(0 misses)', out.getvalue())
+        self.assertIn('removed 30 seeded users', out.getvalue())
@@ -0,0 +1,130 @@
+"""
+The group chat socket (api/consumers.py) and the broadcast that REST
+writes fan out through it.
+"""
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.testing import WebsocketCommunicator
+from django.test import TransactionTestCase
+
+from circld_backend.asgi import application
+
+from .models import Message
+from .testing import FlatFixture, FlatTestCase, access_token
+
+
+class GroupChatConsumerTests(FlatFixture, TransactionTestCase):
+    # the consumer's database calls run in worker threads, which can't see
+    # a TestCase's open transaction
+
+    def socket(self, user=None):
+        path = f'/ws/groups/{self.group.pk}/chat/'
+        if user is not None:
+            path += f'?token={access_token(user)}'
+        return WebsocketCommunicator(application, path, headers=[(b'host', b'testserver')])
+
+    def test_rejects_anonymous_and_outsiders(self):
+        async def run():
+            anonymous = self.socket()
+            connected, code = await anonymous.connect()
+            self.assertFalse(connected)
+            self.assertEqual(code, 4401)
+
+            outsider = self.socket(self.carol)
+            connected, code = await outsider.connect()
+            self.assertFalse(connected)
+            self.assertEqual(code, 4403)
+        async_to_sync(run)()
+
+    def test_socket_messages_are_saved_and_broadcast(self):
+        async def run():
+            alice, bob = self.socket(self.alice), self.socket(self.bob)
+            self.assertTrue((await alice.connect())[0])
+            self.assertTrue((await bob.connect())[0])
+
+            await alice.send_json_to({'text': 'pizza tonight?'})
+            for socket in (alice, bob):
+                message = await socket.receive_json_from(timeout=3)
+                self.assertEqual(message['text'], 'pizza tonight?')
+                self.assertEqual(message['sender_username'], 'alice')
+
+            await bob.send_json_to({'text': '   '})
+            self.assertEqual(
+                await bob.receive_json_from(timeout=3),
+                {'error': {'text': ['This field is required.']}},
+            )
+            self.assertTrue(await alice.receive_nothing())
+            await alice.disconnect()
+            await bob.disconnect()
+        async_to_sync(run)()
+        self.assertEqual(list(Message.objects.values_list('text', flat=True)), ['pizza tonight?'])
+
+    def test_rest_posts_reach_open_sockets(self):
+        @database_sync_to_async
+        def post(text):
+            return self.client_for(self.bob).post('/api/messages/', {'group': self.group.pk, 'text': text}, format='json')
+
+        async def run():
+            alice = self.socket(self.alice)
+            await alice.connect()
+            response = await post('on my way')
+            self.assertEqual(response.status_code, 201)
+            message = await alice.receive_json_from(timeout=3)
+            self.assertEqual(message['id'], response.data['id'])
+            self.assertEqual(message['text'], 'on my way')
+            await alice.disconnect()
+        async_to_sync(run)()
+
+    def test_removed_member_can_no_longer_post(self):
+        remove_bob = database_sync_to_async(lambda: self.group.members.remove(self.bob))
+
+        async def run():
+            bob = self.socket(self.bob)
+            self.assertTrue((await bob.connect())[0])
+            await remove_bob()
+            await bob.send_json_to({'text': 'still here'})
+            self.assertEqual(await bob.receive_output(timeout=3), {'type': 'websocket.close', 'code': 4403})
+        async_to_sync(run)()
+        self.assertFalse(Message.objects.exists())
+
+    def test_removed_member_stops_receiving(self):
+        remove_bob = database_sync_to_async(lambda: self.group.members.remove(self.bob))
+
+        async def run():
+            alice, bob = self.socket(self.alice), self.socket(self.bob)
+            await alice.connect()
+            await bob.connect()
+            await remove_bob()
+            await alice.send_json_to({'text': 'bob left'})
+            self.assertEqual((await alice.receive_json_from(timeout=3))['text'], 'bob left')
+            self.assertEqual(await bob.receive_output(timeout=3), {'type': 'websocket.close', 'code': 4403})
+
+            # nothing is relayed to the closed socket afterwards
+            await alice.send_json_to({'text': 'just us'})
+            await alice.receive_json_from(timeout=3)
+            self.assertTrue(await bob.receive_nothing())
+            await alice.disconnect()
+        async_to_sync(run)()
+
+
+class BroadcastFallbackTests(FlatTestCase):
+    """A missing or broken channel layer must never fail the REST write."""
+
+    def post(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post('/api/messages/', {'group': self.group.pk, 'text': 'hi'}, format='json')
+
+    def test_no_channel_layer(self):
+        with mock.patch('api.consumers.get_channel_layer', return_value=None):
+            self.assertEqual(self.post().status_code, 201)
+        self.assertEqual(Message.objects.count(), 1)
+
+    def test_unreachable_channel_layer(self):
+        layer = mock.Mock()
+        layer.group_send = mock.AsyncMock(side_effect=ConnectionError("no redis"))
+        with mock.patch('api.consumers.get_channel_layer', return_value=layer), \
+             self.assertLogs('api.consumers', level='ERROR'):
+            self.assertEqual(self.post().status_code, 201)
+        self.assertEqual(Message.objects.count(), 1)
@@ -0,0 +1,85 @@
+"""
+Read/write splitting (api/db_router.py) against two real SQLite
+databases: each holds a different outbox row, so a read shows which
+side it went to.
+"""
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, TransactionTestCase, override_settings
+
+from .db_router import PrimaryReplicaRouter, ReplicaRoutingMiddleware
+from .models import OutboxEmail
+
+
+def subjects():
+    return ','.join(OutboxEmail.objects.order_by('id').values_list('subject', flat=True))
+
+
+def view(request):
+    """Reads, optionally writes (?write=1), then reads again."""
+    before = subjects()
+    if request.GET.get('write'):
+        OutboxEmail.objects.create(subject='new', body='', from_email='x@example.com')
+    return HttpResponse(f"{before}|{subjects()}")
+
+
+@override_settings(DATABASE_REPLICAS=['replica_test'])
+class ReplicaRoutingTests(TransactionTestCase):
+    databases = {'default', 'replica_test'}
+
+    def setUp(self):
+        cache.clear()
+        # the flush between tests skips databases allow_migrate rules out
+        OutboxEmail.objects.using('replica_test').all().delete()
+        OutboxEmail.objects.using('default').create(subject='primary', body='', from_email='x@example.com')
+        OutboxEmail.objects.using('replica_test').create(subject='replica', body='', from_email='x@example.com')
+        self.middleware = ReplicaRoutingMiddleware(view)
+        self.factory = RequestFactory()
+
+    def request(self, method='get', credential='Bearer alice', **params):
+        headers = {'HTTP_AUTHORIZATION': credential} if credential else {}
+        request = getattr(self.factory, method)('/', params, **headers)
+        request.COOKIES = {}
+        return self.middleware(request).content.decode()
+
+    def test_outside_a_request_everything_uses_the_primary(self):
+        self.assertEqual(subjects(), 'primary')
+
+    def test_safe_requests_read_from_a_replica(self):
+        self.assertEqual(self.request(), 'replica|replica')
+        self.assertEqual(self.request(credential=None), 'replica|replica')
+
+    def test_unsafe_requests_read_from_the_primary(self):
+        self.assertEqual(self.request('post'), 'primary|primary')
+
+    def test_a_request_reads_its_own_writes(self):
+        self.assertEqual(self.request(write=1), 'replica|primary,new')
+
+    def test_the_writer_stays_on_the_primary_for_a_while(self):
+        self.request(write=1)
+        self.assertEqual(self.request(), 'primary,new|primary,new')
+        # other clients aren't affected
+        self.assertEqual(self.request(credential='Bearer bob'), 'replica|replica')
+        # once the pin expires
+        cache.clear()
+        self.assertEqual(self.request(), 'replica|replica')
+
+    def test_reads_inside_a_transaction_use_the_primary(self):
+        def atomic_view(request):
+            with transaction.atomic():
+                return HttpResponse(subjects())
+        self.middleware = ReplicaRoutingMiddleware(atomic_view)
+        self.assertEqual(self.request(), 'primary')
+
+    def test_a_cache_outage_reads_from_the_primary(self):
+        with mock.patch('api.db_router.cache') as broken:
+            broken.get.side_effect = ConnectionError("no redis")
+            self.assertEqual(self.request(), 'primary|primary')
+
+    def test_replicas_are_never_migrated(self):
+        router = PrimaryReplicaRouter()
+        self.assertTrue(router.allow_migrate('default', 'api'))
+        self.assertFalse(router.allow_migrate('replica_test', 'api'))
@@ -0,0 +1,187 @@
+"""
+Importing and exporting a group's expenses (api/expense_io.py).
+"""
+import csv
+import io
+import json
+import warnings
+from decimal import Decimal
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+from django.core.files.uploadedfile import SimpleUploadedFile
+
+from .expense_io import escape_cell, stream_async, unescape_cell
+from .models import Expense, Group
+from .test_expenses import ExpenseTestCase
+from .testing import access_token
+
+
+class ExpenseImportTests(ExpenseTestCase):
+
+    def upload(self, content, name='expenses.csv', group=None, **params):
+        if isinstance(content, str):
+            content = content.encode()
+        return self.client.post(
+            '/api/expenses/import/?' + '&'.join(f'{k}={v}' for k, v in {'group': (group or self.group).pk, **params}.items()),
+            {'file': SimpleUploadedFile(name, content)},
+            format='multipart',
+        )
+
+    def test_csv_rows_are_imported_and_balanced(self):
+        response = self.upload(
+            "Date,Amount,Note,Category,Paid_By,Split_Between\n"
+            "2024-03-01,30.00,rent,Home,bob,\n"
+            "2024-03-02,10,pizza,,BOB@example.com,alice;carol\n"
+            ",4.50,,,,\n"
+        )
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(response.data, {'imported': 3})
+        rent, pizza, coffee = Expense.objects.filter(group=self.group).order_by('amount').reverse()
+        self.assertEqual((rent.paid_by, rent.category, rent.created.date().isoformat()), (self.bob, 'Home', '2024-03-01'))
+        self.assertEqual(sorted(pizza.shares.values_list('user__username', flat=True)), ['alice', 'carol'])
+        self.assertEqual((coffee.paid_by, coffee.category, coffee.shares.count()), (self.alice, 'General', 3))
+        self.assertLedgerAddsUp()
+
+    def test_jsonl_rows(self):
+        lines = [
+            {'amount': '12.00', 'paid_by': self.carol.pk, 'split_between': ['alice', 'bob']},
+            {'amount': 3, 'note': 'tip', 'split_between': 'carol'},
+        ]
+        response = self.upload('\n'.join(json.dumps(line) for line in lines) + '\n\n', name='e.jsonl')
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(Expense.objects.filter(group=self.group).count(), 2)
+        self.assertLedgerAddsUp()
+
+    def test_bad_rows_are_reported_and_nothing_is_kept(self):
+        response = self.upload(
+            "date,amount,paid_by,split_between,note\n"
+            "2024-03-01,10,bob,,fine\n"
+            "yesterday,0,mallory,alice;eve,\n"
+            "2024-03-03,1.234,,,\n"
+            "2024-03-04,12,,,\n"
+            "2024-03-05,abc,,," + 'x' * 256 + "\n"
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['error_count'], 3)
+        errors = {entry['row']: entry['errors'] for entry in response.data['errors']}
+        self.assertEqual(set(errors), {3, 4, 6})
+        self.assertEqual(set(errors[3]), {'date', 'amount', 'paid_by', 'split_between'})
+        self.assertIn('eve', errors[3]['split_between'])
+        self.assertEqual(errors[4], {'amount': "At most 2 decimal places."})
+        self.assertEqual(set(errors[6]), {'amount', 'note'})
+        self.assertFalse(Expense.objects.filter(group=self.group).exists())
+        self.assertEqual(self.balances(), {})
+
+    def test_a_chunk_written_before_the_bad_row_is_rolled_back(self):
+        with mock.patch('api.expense_io.CHUNK_SIZE', 2):
+            response = self.upload("amount\n1\n2\n3\n-4\n")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['errors'], [{'row': 5, 'errors': {'amount': "Must be greater than zero."}}])
+        self.assertFalse(Expense.objects.filter(group=self.group).exists())
+
+    def test_invalid_json_lines(self):
+        response = self.upload('{"amount": "1"}\nnot json\n[1, 2]\n', name='e.jsonl')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([entry['row'] for entry in response.data['errors']], [2, 3])
+        self.assertIn('Invalid JSON', response.data['errors'][0]['errors']['row'])
+
+    def test_only_the_first_errors_are_listed(self):
+        with mock.patch('api.expense_io.MAX_REPORTED_ERRORS', 2):
+            response = self.upload("amount\n" + "x\n" * 5)
+        self.assertEqual(response.data['error_count'], 5)
+        self.assertEqual([entry['row'] for entry in response.data['errors']], [2, 3])
+
+    def test_too_many_rows(self):
+        with mock.patch('api.expense_io.MAX_ROWS', 2):
+            response = self.upload("amount\n1\n2\n3\n")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('file', response.data['errors'][0]['errors'])
+
+    def test_format_and_encoding(self):
+        self.assertEqual(self.upload("amount\n1\n", name='e.txt').status_code, 400)
+        self.assertEqual(self.upload("amount\n1\n", name='e.txt', fmt='csv').status_code, 201)
+        self.assertIn('fmt', self.upload("amount\n1\n", fmt='xlsx').data)
+        response = self.upload('amount,note\n1,caf\xe9\n'.encode('latin-1'))
+        self.assertEqual(response.data, {'file': ['The file must be UTF-8 text.']})
+
+
+class ExpenseExportTests(ExpenseTestCase):
+
+    def export(self, fmt='csv'):
+        response = self.client.get(f'/api/expenses/export/?group={self.group.pk}&fmt={fmt}')
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    def test_csv_cells_never_start_a_formula(self):
+        self.expense('9.99', self.bob, note='=HYPERLINK("http://evil.example","x")', category='@SUM(A1)')
+        self.expense('1.00', note='+1', category='-1')
+        rows = list(csv.DictReader(io.StringIO(self.export())))
+        self.assertEqual(rows[0]['note'], '\'=HYPERLINK("http://evil.example","x")')
+        self.assertEqual(rows[0]['category'], "'@SUM(A1)")
+        self.assertEqual((rows[1]['note'], rows[1]['category']), ("'+1", "'-1"))
+        self.assertEqual(rows[1]['amount'], '1.00')
+
+    def test_escaping_is_undone_on_the_way_back_in_only_where_added(self):
+        for value in ('=1+1', '+44 20', '-x', '@me', '\tx', 'plain', "'quoted", "'"):
+            with self.subTest(value):
+                self.assertEqual(unescape_cell(escape_cell(value)), value)
+
+    def test_csv_round_trip(self):
+        self.expense('12.00', self.bob, note='=cmd|calc', category='Food', split=[self.alice, self.bob])
+        self.expense('5.01', self.carol, note='taxi')
+        exported = self.export()
+        target = Group.objects.create(name='copy', owner=self.alice)
+        target.members.add(self.alice, self.bob, self.carol)
+        response = self.client.post(
+            f'/api/expenses/import/?group={target.pk}',
+            {'file': SimpleUploadedFile('copy.csv', exported.encode())},
+            format='multipart',
+        )
+        self.assertEqual(response.status_code, 201, response.data)
+        copied = list(Expense.objects.filter(group=target).order_by('created', 'id')
+                                     .values_list('amount', 'note', 'category', 'paid_by__username'))
+        self.assertEqual(copied, [
+            (Decimal('12.00'), '=cmd|calc', 'Food', 'bob'),
+            (Decimal('5.01'), 'taxi', 'General', 'carol'),
+        ])
+        self.assertEqual(self.balances(target), self.balances())
+
+    def test_jsonl_is_not_escaped(self):
+        self.expense('2.00', note='=1+1', split=[self.alice])
+        row, = [json.loads(line) for line in self.export('jsonl').splitlines()]
+        self.assertEqual(row['note'], '=1+1')
+        self.assertEqual(row['shares'], {'alice': '2.00'})
+
+    async def test_streams_asynchronously_under_asgi(self):
+        await sync_to_async(self.expense)('12.00', self.bob, note='=1+1')
+        await sync_to_async(self.expense)('3.00', note='taxi')
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            response = await self.async_client.get(
+                f'/api/expenses/export/?group={self.group.pk}&fmt=csv',
+                headers={'Authorization': f'Bearer {access_token(self.alice)}'},
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response.is_async)
+            body = b''.join([chunk async for chunk in response.streaming_content]).decode()
+        # Django warns when it has to buffer a sync iterator for ASGI
+        self.assertEqual([str(w.message) for w in caught if 'iterator' in str(w.message)], [])
+        self.assertEqual(body, await sync_to_async(self.export)())
+
+    async def test_async_stream_pulls_a_chunk_at_a_time(self):
+        pulled = []
+
+        def lines():
+            for i in range(5):
+                pulled.append(i)
+                yield f'{i}\n'
+
+        stream = stream_async(lines(), chunk_size=2)
+        self.assertEqual(await anext(stream), '0\n1\n')
+        self.assertEqual(pulled, [0, 1])
+        self.assertEqual([piece async for piece in stream], ['2\n3\n', '4\n'])
+
+    def test_unknown_format(self):
+        response = self.client.get(f'/api/expenses/export/?group={self.group.pk}&fmt=xlsx')
+        self.assertEqual(response.status_code, 400)
@@ -0,0 +1,459 @@
+"""
+Expense writes and the balances they maintain.
+"""
+import datetime
+import io
+from decimal import Decimal
+
+from django.contrib.admin.sites import site
+from django.core.management import call_command
+from django.db.models import Sum
+from django.test import RequestFactory, override_settings
+from django.utils import timezone
+
+from .admin import ExpenseAdminForm
+from .balances import (
+    EXACT_SETTLE_LIMIT, rebuild_expense_rollups, rebuild_group_balances, record_expense,
+    record_expenses_bulk, remove_expense, settle_up, split_amount,
+)
+from .models import Expense, ExpenseRollup, ExpenseShare, Group, GroupBalance, User
+from .testing import FlatTestCase
+
+
+class ExpenseTestCase(FlatTestCase):
+    flat_members = ('alice', 'bob', 'carol')
+
+    def expense(self, amount, payer=None, split=None, group=None, **fields):
+        return record_expense(
+            Expense(group=group or self.group, paid_by=payer or self.alice, amount=Decimal(amount), **fields),
+            split,
+        )
+
+    def balances(self, group=None):
+        return {
+            row.user.username: row.balance
+            for row in GroupBalance.objects.filter(group=group or self.group).select_related('user')
+        }
+
+    def assertLedgerAddsUp(self, group=None):
+        group = group or self.group
+        for expense in Expense.objects.filter(group=group):
+            self.assertEqual(expense.shares.aggregate(total=Sum('amount'))['total'], expense.amount)
+        self.assertEqual(sum(self.balances(group).values(), Decimal('0')), 0)
+
+
+class BalanceTests(ExpenseTestCase):
+
+    def test_split_is_cent_exact(self):
+        parts = split_amount(Decimal('10.00'), 3)
+        self.assertEqual(parts, [Decimal('3.34'), Decimal('3.33'), Decimal('3.33')])
+        self.assertEqual(sum(parts), Decimal('10.00'))
+        with self.assertRaises(ValueError):
+            split_amount(Decimal('1.00'), 0)
+
+    def test_new_expense_is_split_between_every_member(self):
+        self.expense('10.00')
+        self.assertEqual(self.balances(), {
+            'alice': Decimal('6.66'), 'bob': Decimal('-3.33'), 'carol': Decimal('-3.33'),
+        })
+        self.assertLedgerAddsUp()
+
+    def test_edits_move_the_balances_by_the_difference(self):
+        dinner = self.expense('30.00', split=[self.alice, self.bob])
+        dinner.amount = Decimal('40.00')
+        record_expense(dinner)
+        self.assertEqual(self.balances()['bob'], Decimal('-20.00'))
+
+        dinner.paid_by = self.carol
+        record_expense(dinner, [self.bob, self.carol])
+        self.assertEqual(self.balances(), {'alice': 0, 'bob': Decimal('-20.00'), 'carol': Decimal('20.00')})
+        self.assertLedgerAddsUp()
+
+    def test_removing_an_expense_undoes_it(self):
+        keep = self.expense('12.00', payer=self.bob)
+        drop = self.expense('99.99', payer=self.carol, split=[self.alice])
+        remove_expense(drop)
+        self.assertEqual(self.balances(), {'alice': Decimal('-4.00'), 'bob': Decimal('8.00'), 'carol': Decimal('-4.00')})
+        self.assertEqual(list(Expense.objects.values_list('pk', flat=True)), [keep.pk])
+
+    def test_balances_endpoint(self):
+        self.expense('9.00', payer=self.bob)
+        response = self.client.get(f'/api/groups/{self.group.pk}/balances/')
+        self.assertEqual(response.status_code, 200)
+        rows = {row['username']: row for row in response.data}
+        self.assertEqual(Decimal(rows['bob']['balance']), Decimal('6.00'))
+        self.assertEqual(Decimal(rows['carol']['owed']), Decimal('3.00'))
+        self.assertEqual(sum(Decimal(row['balance']) for row in response.data), 0)
+
+    def test_api_writes_keep_the_ledger(self):
+        response = self.client.post('/api/expenses/', {
+            'group': self.group.pk, 'amount': '20.00', 'split_between': [self.alice.pk, self.carol.pk],
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.balances()['carol'], Decimal('-10.00'))
+        self.assertEqual(self.client.delete(f"/api/expenses/{response.data['id']}/").status_code, 204)
+        self.assertEqual(set(self.balances().values()), {0})
+
+
+class SettleUpTests(ExpenseTestCase):
+
+    def assertSettles(self, balances, plan):
+        left = {uid: Decimal(b) for uid, b in balances.items()}
+        for debtor, creditor, amount in plan:
+            self.assertGreater(amount, 0)
+            left[debtor]   += amount
+            left[creditor] -= amount
+        self.assertEqual(set(left.values()), {0})
+
+    def test_greedy_needs_at_most_n_minus_one_transfers(self):
+        balances = {1: '10.00', 2: '-3.50', 3: '-3.25', 4: '-3.25', 5: '0.00'}
+        plan = settle_up(balances)
+        self.assertSettles(balances, plan)
+        self.assertLessEqual(len(plan), 3)
+
+    def test_exact_finds_the_fewest_transfers(self):
+        # {3, -3} and {4, -2, -2} settle in 1 + 2 transfers; greedy needs 4
+        balances = {1: '4.00', 2: '3.00', 3: '-3.00', 4: '-2.00', 5: '-2.00'}
+        greedy, exact = settle_up(balances), settle_up(balances, exact=True)
+        self.assertSettles(balances, greedy)
+        self.assertSettles(balances, exact)
+        self.assertEqual(len(greedy), 4)
+        self.assertEqual(len(exact), 3)
+
+    def test_everyone_square_needs_nothing(self):
+        self.assertEqual(settle_up({1: '0.00', 2: 0}, exact=True), [])
+
+    def test_endpoint(self):
+        self.expense('30.00', payer=self.alice)
+        response = self.client.get(f'/api/groups/{self.group.pk}/settle-up/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['method'], 'greedy')
+        self.assertEqual(
+            sorted((t['from_username'], t['to_username'], Decimal(t['amount'])) for t in response.data['transfers']),
+            [('bob', 'alice', Decimal('10.00')), ('carol', 'alice', Decimal('10.00'))],
+        )
+        self.assertEqual(self.client.get(f'/api/groups/{self.group.pk}/settle-up/?exact=1').data['method'], 'exact')
+
+    def test_departed_debtors_are_still_asked_to_pay(self):
+        self.expense('100.00', payer=self.alice, split=[self.alice, self.bob])
+        self.group.members.remove(self.bob)
+        for query in ('', '?exact=1'):
+            with self.subTest(query):
+                response = self.client.get(f'/api/groups/{self.group.pk}/settle-up/{query}')
+                self.assertEqual(
+                    [(t['from_username'], t['to_username'], Decimal(t['amount'])) for t in response.data['transfers']],
+                    [('bob', 'alice', Decimal('50.00'))],
+                )
+
+    def test_large_groups_fall_back_to_greedy(self):
+        members = [
+            User.objects.create_user(f'member{i}', f'member{i}@example.com', 'pw-12345678')
+            for i in range(EXACT_SETTLE_LIMIT)
+        ]
+        self.group.members.add(*members)
+        self.expense('100.00', payer=self.alice)
+        response = self.client.get(f'/api/groups/{self.group.pk}/settle-up/?exact=1')
+        self.assertEqual(response.data['method'], 'greedy')
+
+
+class RunningBalanceTests(ExpenseTestCase):
+    """The running balance table always equals a rebuild from scratch."""
+
+    def running(self):
+        return set(GroupBalance.objects.exclude(paid=0, owed=0).values_list('group_id', 'user_id', 'paid', 'owed'))
+
+    def assertMatchesRebuild(self):
+        incremental = self.running()
+        rebuild_group_balances()
+        self.assertEqual(self.running(), incremental)
+
+    def test_after_creates_edits_and_deletes(self):
+        a = self.expense('10.00')
+        b = self.expense('7.31', payer=self.bob, split=[self.bob, self.carol])
+        self.expense('0.01', payer=self.carol, split=[self.alice])
+        a.amount = Decimal('11.11')
+        record_expense(a, [self.alice, self.carol])
+        remove_expense(b)
+        self.assertMatchesRebuild()
+
+    def test_after_a_bulk_insert(self):
+        ids = [self.alice.pk, self.bob.pk, self.carol.pk]
+        record_expenses_bulk([
+            (Expense(group=self.group, paid_by_id=ids[i % 3], amount=Decimal(f'{i}.{i:02d}')), ids[:1 + i % 3])
+            for i in range(1, 20)
+        ])
+        self.assertLedgerAddsUp()
+        self.assertMatchesRebuild()
+
+    def test_rebuild_can_be_limited_to_one_group(self):
+        other = Group.objects.create(name='trip', owner=self.alice)
+        other.members.add(self.alice, self.bob)
+        self.expense('8.00', group=other)
+        self.expense('9.00')
+        GroupBalance.objects.update(paid=0, owed=0)
+        call_command('rebuild_balances', '--group', str(other.pk), stdout=io.StringIO())
+        self.assertEqual(self.balances(other), {'alice': Decimal('4.00'), 'bob': Decimal('-4.00')})
+        self.assertEqual(set(self.balances().values()), {0})
+
+
+class UnknownPayerTests(ExpenseTestCase):
+    """Expenses nobody is recorded as paying still count as spend."""
+
+    def buckets(self):
+        return set(ExpenseRollup.objects.values_list('payer_id', 'total', 'count'))
+
+    def test_rolled_up_under_a_null_payer(self):
+        self.expense('10.00', payer=self.bob)
+        orphan = record_expense(Expense(group=self.group, paid_by=None, amount=Decimal('5.00')))
+        record_expense(Expense(group=self.group, paid_by=None, amount=Decimal('2.50')))
+        self.assertEqual(self.buckets(), {(self.bob.pk, Decimal('10.00'), 1), (None, Decimal('7.50'), 2)})
+
+        incremental = self.buckets()
+        rebuild_expense_rollups()
+        self.assertEqual(self.buckets(), incremental)
+
+        orphan.paid_by = self.carol
+        record_expense(orphan)
+        self.assertIn((None, Decimal('2.50'), 1), self.buckets())
+        self.assertIn((self.carol.pk, Decimal('5.00'), 1), self.buckets())
+
+    def test_analytics_by_payer(self):
+        self.expense('10.00', payer=self.bob)
+        record_expense(Expense(group=self.group, paid_by=None, amount=Decimal('5.00')))
+        response = self.client.get(f'/api/groups/{self.group.pk}/analytics/', {'by': 'payer'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Decimal(response.data['total']), Decimal('15.00'))
+        by_payer = {b['payer_id']: (b['payer_username'], Decimal(b['total'])) for b in response.data['buckets']}
+        self.assertEqual(by_payer, {self.bob.pk: ('bob', Decimal('10.00')), None: (None, Decimal('5.00'))})
+
+
+class RollupTests(ExpenseTestCase):
+    """The monthly spend rollups and the analytics endpoint reading them."""
+
+    def at(self, year, month, day=15, hour=12):
+        return timezone.make_aware(datetime.datetime(year, month, day, hour))
+
+    def buckets(self):
+        return {
+            (row.month.strftime('%Y-%m'), row.category, row.payer_id): (row.total, row.count)
+            for row in ExpenseRollup.objects.filter(group=self.group)
+        }
+
+    def analytics(self, **params):
+        return self.client.get(f'/api/groups/{self.group.pk}/analytics/', params)
+
+    def test_writes_keep_the_buckets_in_step(self):
+        rent = self.expense('900.00', category='Home', created=self.at(2024, 1))
+        self.expense('30.00', self.bob, category='Food', created=self.at(2024, 1))
+        self.expense('20.00', self.bob, category='Food', created=self.at(2024, 1, 31, 23))
+        self.assertEqual(self.buckets(), {
+            ('2024-01', 'Home', self.alice.pk): (Decimal('900.00'), 1),
+            ('2024-01', 'Food', self.bob.pk):   (Decimal('50.00'), 2),
+        })
+
+        rent.amount, rent.created = Decimal('950.00'), self.at(2024, 2)
+        record_expense(rent)
+        self.assertNotIn(('2024-01', 'Home', self.alice.pk), self.buckets())
+        self.assertEqual(self.buckets()[('2024-02', 'Home', self.alice.pk)], (Decimal('950.00'), 1))
+
+        remove_expense(rent)
+        self.assertEqual(set(self.buckets()), {('2024-01', 'Food', self.bob.pk)})
+
+    @override_settings(TIME_ZONE='Pacific/Auckland')
+    def test_months_follow_the_site_timezone_and_rebuild_agrees(self):
+        # 11:00 UTC on 31 January is already February in Auckland
+        self.expense('10.00', created=datetime.datetime(2024, 1, 31, 11, tzinfo=datetime.timezone.utc))
+        self.expense('5.00', created=datetime.datetime(2024, 1, 31, 10, tzinfo=datetime.timezone.utc))
+        incremental = self.buckets()
+        self.assertEqual(sorted(month for month, *_ in incremental), ['2024-01', '2024-02'])
+        rebuild_expense_rollups()
+        self.assertEqual(self.buckets(), incremental)
+
+    def test_rebuild_command_repairs_drift(self):
+        self.expense('12.00', category='Food', created=self.at(2024, 3))
+        other = Group.objects.create(name='trip', owner=self.alice)
+        other.members.add(self.alice)
+        self.expense('7.00', group=other, split=[self.alice])
+        expected = self.buckets()
+
+        ExpenseRollup.objects.update(total=Decimal('1.00'), count=9)
+        out = io.StringIO()
+        call_command('rebuild_rollups', '--group', str(self.group.pk), stdout=out)
+        self.assertIn('Rebuilt 1 rollup rows.', out.getvalue())
+        self.assertEqual(self.buckets(), expected)
+        # only the named group was touched
+        self.assertEqual(ExpenseRollup.objects.get(group=other).total, Decimal('1.00'))
+
+        call_command('rebuild_rollups', stdout=io.StringIO())
+        self.assertEqual(ExpenseRollup.objects.get(group=other).total, Decimal('7.00'))
+
+    def test_analytics_by_month_and_category(self):
+        self.expense('100.00', category='Home', created=self.at(2024, 1))
+        self.expense('10.00', self.bob, category='Food', created=self.at(2024, 1))
+        self.expense('15.00', self.carol, category='Food', created=self.at(2024, 2))
+        response = self.analytics()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['by'], ['month', 'category'])
+        self.assertEqual(response.data['total'], '125.00')
+        self.assertEqual(
+            [(b['month'], b['category'], b['total'], b['count']) for b in response.data['buckets']],
+            [('2024-01', 'Food', '10.00', 1), ('2024-01', 'Home', '100.00', 1), ('2024-02', 'Food', '15.00', 1)],
+        )
+
+        response = self.analytics(by='category')
+        self.assertEqual(
+            [(b['category'], b['total'], b['count']) for b in response.data['buckets']],
+            [('Food', '25.00', 2), ('Home', '100.00', 1)],
+        )
+        self.assertNotIn('month', response.data['buckets'][0])
+
+    def test_analytics_date_range(self):
+        for month in (1, 2, 3, 4):
+            self.expense(f'{month}.00', created=self.at(2024, month))
+        response = self.analytics(by='month', **{'from': '2024-02', 'to': '2024-03'})
+        self.assertEqual((response.data['from'], response.data['to']), ('2024-02', '2024-03'))
+        self.assertEqual([b['month'] for b in response.data['buckets']], ['2024-02', '2024-03'])
+        self.assertEqual(response.data['total'], '5.00')
+        self.assertEqual(self.analytics(**{'from': '2025-01'}).data['buckets'], [])
+
+    def test_analytics_rejects_bad_parameters(self):
+        for params, field in (
+            ({'by': 'weekday'}, 'by'),
+            ({'by': ','}, 'by'),
+            ({'from': '2024-13'}, 'from'),
+            ({'to': 'March'}, 'to'),
+        ):
+            with self.subTest(params):
+                response = self.analytics(**params)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn(field, response.data)
+
+    def test_analytics_is_for_members_and_revalidates(self):
+        self.expense('10.00')
+        first = self.analytics()
+        self.assertEqual(self.client.get(f'/api/groups/{self.group.pk}/analytics/',
+                                         HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+        # another query string is another representation
+        self.assertNotEqual(self.analytics(by='payer')['ETag'], first['ETag'])
+
+        outsider = User.objects.create_user('mallory', 'm@example.com', 'pw-12345678')
+        self.client.force_authenticate(outsider)
+        self.assertEqual(self.analytics().status_code, 404)
+
+
+class ExpenseGroupTests(ExpenseTestCase):
+    """An expense stays in the group its shares and balances belong to."""
+
+    def setUp(self):
+        super().setUp()
+        self.other = Group.objects.create(name='trip', owner=self.alice)
+        self.other.members.add(self.alice)
+        self.dinner = self.expense('30.00')
+
+    def test_moving_an_expense_to_another_group_is_rejected(self):
+        response = self.client.patch(f'/api/expenses/{self.dinner.pk}/', {'group': self.other.pk}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('group', response.data)
+        self.dinner.refresh_from_db()
+        self.assertEqual(self.dinner.group, self.group)
+        self.assertFalse(GroupBalance.objects.filter(group=self.other).exists())
+        self.assertLedgerAddsUp()
+
+    def test_naming_the_same_group_is_fine(self):
+        response = self.client.patch(
+            f'/api/expenses/{self.dinner.pk}/', {'group': self.group.pk, 'amount': '45.00'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertLedgerAddsUp()
+
+    def test_payer_must_be_a_member(self):
+        outsider = User.objects.create_user('dave', 'dave@example.com', 'pw-12345678')
+        response = self.client.patch(f'/api/expenses/{self.dinner.pk}/', {'paid_by': outsider.pk}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('paid_by', response.data)
+        self.assertFalse(GroupBalance.objects.filter(user=outsider).exists())
+
+    def test_admin_keeps_the_group_read_only_on_change(self):
+        admin = site._registry[Expense]
+        request = RequestFactory().get('/')
+        self.assertIn('group', admin.get_readonly_fields(request, self.dinner))
+        self.assertNotIn('group', admin.get_readonly_fields(request, None))
+
+    def test_admin_form_rejects_a_payer_from_outside_the_group(self):
+        outsider = User.objects.create_user('dave', 'dave@example.com', 'pw-12345678')
+        form = ExpenseAdminForm(data={
+            'group': self.group.pk, 'paid_by': outsider.pk, 'amount': '12.00', 'category': 'General',
+        })
+        self.assertFalse(form.is_valid())
+        self.assertIn('paid_by', form.errors)
+
+
+class DepartedMemberTests(ExpenseTestCase):
+    """Leaving a group doesn't take an open balance with you."""
+
+    def setUp(self):
+        super().setUp()
+        self.expense('100.00', payer=self.alice, split=[self.alice, self.bob])
+
+    def balance_rows(self):
+        response = self.client.get(f'/api/groups/{self.group.pk}/balances/')
+        self.assertEqual(response.status_code, 200)
+        return {row['username']: (row['member'], Decimal(row['balance'])) for row in response.data}
+
+    def assertBobStillOwes(self):
+        rows = self.balance_rows()
+        self.assertEqual(rows['bob'], (False, Decimal('-50.00')))
+        self.assertEqual(rows['alice'], (True, Decimal('50.00')))
+        self.assertEqual(sum(balance for _, balance in rows.values()), 0)
+
+    def test_leaving_with_a_debt(self):
+        self.assertEqual(self.client_for(self.bob).post(f'/api/groups/{self.group.pk}/leave/').status_code, 200)
+        self.assertBobStillOwes()
+
+    def test_being_removed_with_a_debt(self):
+        response = self.client.post(f'/api/groups/{self.group.pk}/remove_member/', {'user_id': self.bob.pk},
+                                    format='json')
+        self.assertEqual(response.status_code, 204)
+        self.assertBobStillOwes()
+
+    def test_settled_leavers_drop_out(self):
+        self.expense('50.00', payer=self.bob, split=[self.alice])
+        self.group.members.remove(self.bob, self.carol)
+        self.assertEqual(self.balance_rows(), {'alice': (True, Decimal('0.00'))})
+
+
+class DeleteAccountTests(ExpenseTestCase):
+    """Closing an account never takes other members' ledgers with it."""
+
+    def delete_account(self, user):
+        return self.client_for(user).delete('/api/profile/delete/')
+
+    def test_open_balance_blocks_deletion(self):
+        self.expense('30.00', payer=self.alice)
+        response = self.delete_account(self.bob)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['groups'], ['flat'])
+        self.assertTrue(User.objects.filter(pk=self.bob.pk, is_active=True).exists())
+
+    def test_user_without_history_is_deleted(self):
+        self.assertEqual(self.delete_account(self.carol).status_code, 204)
+        self.assertFalse(User.objects.filter(pk=self.carol.pk).exists())
+
+    def test_settled_user_with_history_is_retired(self):
+        self.expense('30.00', payer=self.alice, split=[self.alice, self.bob])
+        self.expense('15.00', payer=self.bob, split=[self.alice])
+        self.assertEqual(self.balances()['bob'], 0)
+
+        self.assertEqual(self.delete_account(self.bob).status_code, 204)
+        bob = User.objects.get(pk=self.bob.pk)
+        self.assertEqual((bob.username, bob.email, bob.is_active), (f'deleted-{bob.pk}', '', False))
+        self.assertFalse(bob.has_usable_password())
+        self.assertNotIn(bob, self.group.members.all())
+        self.assertEqual(ExpenseShare.objects.filter(user=bob).count(), 1)
+        self.assertLedgerAddsUp()
+
+    def test_owner_takes_their_groups_along(self):
+        self.expense('30.00', payer=self.bob, split=[self.bob])
+        self.assertEqual(self.delete_account(self.alice).status_code, 204)
+        self.assertFalse(User.objects.filter(pk=self.alice.pk).exists())
+        self.assertFalse(Group.objects.filter(pk=self.group.pk).exists())
+        self.assertFalse(Expense.objects.exists())
@@ -0,0 +1,278 @@
+"""
+Group endpoints: members, the list summaries, read markers and
+conditional GETs.
+"""
+import datetime
+from unittest import mock
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.http import http_date
+
+from .balances import record_expense
+from .db_router import PrimaryReplicaRouter
+from .membership import group_ids_for
+from .models import Expense, Group, Message, Profile, User
+from .testing import FlatTestCase
+
+
+class MembersEndpointTests(FlatTestCase):
+
+    def members(self, client=None):
+        return (client or self.client).get(f'/api/groups/{self.group.pk}/members/')
+
+    def test_lists_members_with_the_owner_marked(self):
+        response = self.members()
+        self.assertEqual(response.status_code, 200)
+        rows = {row['username']: row for row in response.data}
+        self.assertEqual(set(rows), {'alice', 'bob'})
+        self.assertTrue(rows['alice']['is_admin'])
+        self.assertFalse(rows['bob']['is_admin'])
+
+    def test_avatars_are_the_medium_variant(self):
+        Profile.objects.filter(user=self.bob).update(
+            avatar='avatars/bob.png',
+            avatar_variants={'md': {'webp': 'avatars/v/abc-md.webp'}},
+        )
+        Profile.objects.filter(user=self.alice).delete()
+        rows = {row['username']: row for row in self.members().data}
+        self.assertEqual(rows['bob']['avatar'], 'http://testserver/media/avatars/v/abc-md.webp')
+        self.assertIsNone(rows['alice']['avatar'])
+
+    def test_outsiders_get_a_404(self):
+        self.assertEqual(self.members(self.client_for(self.carol)).status_code, 404)
+
+    def test_queries_do_not_grow_with_the_group(self):
+        def count():
+            cache.clear()
+            with CaptureQueriesContext(connection) as ctx:
+                self.assertEqual(self.members().status_code, 200)
+            return len(ctx)
+
+        small = count()
+        self.group.members.add(*[
+            User.objects.create_user(f'member{i}', f'member{i}@example.com', 'pw-12345678')
+            for i in range(10)
+        ])
+        self.assertEqual(count(), small)
+
+
+class ConditionalGetTests(FlatTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.url = f'/api/groups/{self.group.pk}/'
+
+    def age_group(self, **delta):
+        Group.objects.filter(pk=self.group.pk).update(updated=timezone.now() - datetime.timedelta(**delta))
+
+    def post_message(self, text='hi'):
+        return self.client.post('/api/messages/', {'group': self.group.pk, 'text': text}, format='json')
+
+    def test_etag_revalidates_until_something_changes(self):
+        first = self.client.get(self.url)
+        self.assertEqual(first.status_code, 200)
+        etag = first['ETag']
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.assertEqual(self.post_message().status_code, 201)
+        again = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(again.status_code, 200)
+        self.assertNotEqual(again['ETag'], etag)
+
+    def test_etags_are_per_user(self):
+        etag = self.client.get(self.url)['ETag']
+        self.assertEqual(self.client_for(self.bob).get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_outsiders_get_a_404_not_a_304(self):
+        etag = self.client.get(self.url)['ETag']
+        response = self.client_for(self.carol).get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 404)
+
+    def test_if_modified_since_once_the_second_is_over(self):
+        self.age_group(minutes=5)
+        last_modified = self.client.get(self.url)['Last-Modified']
+        self.assertEqual(self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+        self.post_message()
+        self.assertEqual(self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 200)
+
+    def test_no_false_304_within_the_same_second(self):
+        # a frozen clock, a third of the way into a second, so the writes
+        # and the client's guess can't straddle a second boundary
+        now = datetime.datetime(2026, 1, 1, 12, 0, 0, 300_000, tzinfo=datetime.timezone.utc)
+        with mock.patch('django.utils.timezone.now', return_value=now), \
+             mock.patch('api.conditional.time') as clock:
+            clock.time.return_value = now.timestamp()
+            self.post_message()
+            response = self.client.get(self.url)
+            self.assertNotIn('Last-Modified', response)
+            # a client guessing the current second must not be told "unchanged"
+            self.post_message('second one')
+            stamp = http_date(now.timestamp())
+            self.assertEqual(self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=stamp).status_code, 200)
+
+    def test_group_list_revalidates_by_etag(self):
+        self.age_group(minutes=5)
+        first = self.client.get('/api/groups/')
+        self.assertNotIn('Last-Modified', first)
+        self.assertEqual(self.client.get('/api/groups/', HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+
+        other = Group.objects.create(name='trip', owner=self.bob)
+        other.members.add(self.bob, self.alice)
+        self.assertEqual(self.client.get('/api/groups/', HTTP_IF_NONE_MATCH=first['ETag']).status_code, 200)
+
+    def test_message_list_revalidates(self):
+        first = self.client.get('/api/messages/', {'group': self.group.pk})
+        response = self.client.get('/api/messages/', {'group': self.group.pk}, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.post_message()
+        response = self.client.get('/api/messages/', {'group': self.group.pk}, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(len(response.data), 1)
+
+
+class GroupListTests(FlatTestCase):
+
+    def groups(self, **params):
+        response = self.client.get('/api/groups/', params)
+        self.assertEqual(response.status_code, 200)
+        rows = response.data['results'] if isinstance(response.data, dict) else response.data
+        return rows
+
+    def test_summary_columns(self):
+        Message.objects.create(group=self.group, sender=self.bob, text='x' * 200)
+        record_expense(Expense(group=self.group, paid_by=self.bob, amount=Decimal('12.50')))
+        row, = self.groups()
+        self.assertEqual(row['member_count'], 2)
+        self.assertEqual(row['last_message_sender'], 'bob')
+        self.assertEqual(len(row['last_message_text']), 120)
+        self.assertEqual(Decimal(row['total_spend']), Decimal('12.50'))
+
+    def test_total_spend_counts_expenses_without_a_payer(self):
+        record_expense(Expense(group=self.group, paid_by=self.bob, amount=Decimal('10.00')))
+        record_expense(Expense(group=self.group, paid_by=None, amount=Decimal('5.00')))
+        row, = self.groups()
+        self.assertEqual(Decimal(row['total_spend']), Decimal('15.00'))
+
+    def test_activity_ordering_puts_quiet_groups_last(self):
+        quiet = Group.objects.create(name='quiet', owner=self.alice)
+        quiet.members.add(self.alice)
+        busy = Group.objects.create(name='busy', owner=self.alice)
+        busy.members.add(self.alice)
+        now = timezone.now()
+        Message.objects.create(group=self.group, sender=self.alice, text='old', ts=now - datetime.timedelta(hours=1))
+        Message.objects.create(group=busy, sender=self.alice, text='new', ts=now)
+        self.assertEqual([row['name'] for row in self.groups(ordering='activity')], ['busy', 'flat', 'quiet'])
+        self.assertEqual([row['name'] for row in self.groups()], ['flat', 'quiet', 'busy'])
+
+    def test_only_my_groups_in_one_query(self):
+        mine = {row['id'] for row in self.groups()}
+        self.assertEqual(mine, {self.group.pk})
+        for i in range(5):
+            Group.objects.create(name=f'extra {i}', owner=self.alice).members.add(self.alice, self.bob)
+        cache.clear()
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(len(self.groups()), 6)
+        many = len(ctx)
+        Group.objects.filter(name__startswith='extra').delete()
+        cache.clear()
+        with CaptureQueriesContext(connection) as ctx:
+            self.groups()
+        self.assertEqual(len(ctx), many)
+
+
+class ReadMarkerTests(FlatTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.other = Group.objects.create(name='trip', owner=self.bob)
+        self.other.members.add(self.alice, self.bob)
+        self.flat = [Message.objects.create(group=self.group, sender=self.bob, text=str(i)) for i in range(3)]
+        Message.objects.create(group=self.group, sender=self.alice, text='mine')
+        self.trip = [Message.objects.create(group=self.other, sender=self.bob, text=str(i)) for i in range(2)]
+
+    def unread(self):
+        response = self.client.get('/api/groups/unread/')
+        self.assertEqual(response.status_code, 200)
+        return {row['group']: row['unread'] for row in response.data}
+
+    def mark(self, *markers):
+        return self.client.post('/api/groups/mark-read/', {'markers': list(markers)}, format='json')
+
+    def test_counts_everyone_elses_messages(self):
+        self.assertEqual(self.unread(), {self.group.pk: 3, self.other.pk: 2})
+
+    def test_marking_up_to_a_message(self):
+        response = self.mark({'group': self.group.pk, 'message_id': self.flat[1].pk})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, [{'group': self.group.pk, 'last_read_message_id': self.flat[1].pk}])
+        self.assertEqual(self.unread(), {self.group.pk: 1, self.other.pk: 2})
+
+    def test_marking_whole_groups_read(self):
+        self.mark({'group': self.group.pk}, {'group': self.other.pk})
+        self.assertEqual(self.unread(), {self.group.pk: 0, self.other.pk: 0})
+        Message.objects.create(group=self.other, sender=self.bob, text='new')
+        self.assertEqual(self.unread(), {self.group.pk: 0, self.other.pk: 1})
+
+    def test_markers_never_move_back(self):
+        self.mark({'group': self.group.pk})
+        self.mark({'group': self.group.pk, 'message_id': self.flat[0].pk})
+        self.assertEqual(self.unread()[self.group.pk], 0)
+
+    def test_markers_are_capped_at_the_newest_message(self):
+        self.mark({'group': self.other.pk, 'message_id': 10 ** 9})
+        Message.objects.create(group=self.other, sender=self.bob, text='new')
+        self.assertEqual(self.unread()[self.other.pk], 1)
+
+    def test_unknown_groups_are_rejected(self):
+        outsiders = Group.objects.create(name='private', owner=self.carol)
+        response = self.mark({'group': self.group.pk}, {'group': outsiders.pk})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.unread()[self.group.pk], 3)
+
+    def test_markers_are_per_user(self):
+        self.mark({'group': self.group.pk})
+        response = self.client_for(self.bob).get('/api/groups/unread/')
+        self.assertEqual({row['group']: row['unread'] for row in response.data}, {self.group.pk: 1, self.other.pk: 0})
+
+
+class MembershipCacheTests(FlatTestCase):
+
+    def test_the_set_is_cached(self):
+        self.assertEqual(group_ids_for(self.bob), {self.group.pk})
+        with self.assertNumQueries(0):
+            self.assertEqual(group_ids_for(self.bob), {self.group.pk})
+
+    def test_membership_changes_drop_the_cached_set(self):
+        trip = Group.objects.create(name='trip', owner=self.alice)
+        self.assertEqual(group_ids_for(self.carol), frozenset())
+        trip.members.add(self.carol)
+        self.assertEqual(group_ids_for(self.carol), {trip.pk})
+        self.carol.circld_groups.remove(trip)
+        self.assertEqual(group_ids_for(self.carol), frozenset())
+
+    def test_owner_changes_and_deletes_drop_the_cached_set(self):
+        self.assertEqual(group_ids_for(self.alice), {self.group.pk})
+        self.group.members.remove(self.alice)
+        self.group.owner = self.carol
+        self.group.save()
+        self.assertEqual(group_ids_for(self.alice), frozenset())
+        self.assertEqual(group_ids_for(self.carol), {self.group.pk})
+        self.group.delete()
+        self.assertEqual(group_ids_for(self.bob), frozenset())
+
+    def test_removed_members_lose_access_straight_away(self):
+        bob = self.client_for(self.bob)
+        self.assertEqual(bob.get('/api/messages/', {'group': self.group.pk}).status_code, 200)
+        self.group.members.remove(self.bob)
+        self.assertEqual(bob.get('/api/messages/', {'group': self.group.pk}).status_code, 403)
+
+    def test_reloads_ignore_the_replicas(self):
+        # a replica alias that doesn't even exist would blow up any read sent there
+        with mock.patch.object(PrimaryReplicaRouter, 'db_for_read', return_value='lagging-replica'):
+            self.assertEqual(group_ids_for(self.bob), {self.group.pk})
+            self.group.members.add(self.carol)
+            self.group.delete()
+        self.assertEqual(group_ids_for(self.carol), frozenset())
@@ -0,0 +1,98 @@
+"""
+The email outbox (api/mail.py) and its worker command, against Django's
+locmem email backend.
+"""
+import datetime
+import io
+
+from django.core import mail
+from django.core.mail.backends.locmem import EmailBackend
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from .mail import CLAIM_LEASE, claim_batch, deliver_pending, purge_outbox, queue_mail
+from .models import OutboxEmail, User
+
+
+class FlakyBackend(EmailBackend):
+    """Locmem backend that refuses mail to anyone in `refuse`."""
+    refuse = ()
+
+    def send_messages(self, messages):
+        for message in messages:
+            if set(message.to) & set(self.refuse):
+                raise ConnectionError("mailbox unavailable")
+        return super().send_messages(messages)
+
+
+class OutboxTests(TestCase):
+
+    def queue(self, to='alice@example.com', body='Your code is 123456'):
+        return queue_mail("Circld", body, None, [to])
+
+    def test_requests_only_queue(self):
+        user = User.objects.create_user('alice', 'alice@example.com', 'pw-12345678')
+        client = APIClient()
+        client.force_authenticate(user)
+        response = client.post('/api/profile/request-email-change/', {'email': 'new@example.com'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(mail.outbox, [])
+        self.assertEqual(list(OutboxEmail.objects.values_list('recipients', flat=True)), [['new@example.com']])
+
+    def test_delivery_sends_and_forgets_the_body(self):
+        first, second = self.queue(), self.queue('bob@example.com')
+        self.assertEqual(deliver_pending(), (2, 0))
+        self.assertEqual([m.to for m in mail.outbox], [['alice@example.com'], ['bob@example.com']])
+        self.assertEqual(mail.outbox[0].body, 'Your code is 123456')
+        for email in (first, second):
+            email.refresh_from_db()
+            self.assertEqual((email.status, email.attempts, email.body), (OutboxEmail.SENT, 1, ''))
+            self.assertIsNotNone(email.sent_at)
+        self.assertEqual(deliver_pending(), (0, 0))
+
+    def test_failures_back_off_and_eventually_give_up(self):
+        bad, good = self.queue('bounce@example.com'), self.queue()
+        backend = FlakyBackend()
+        backend.refuse = ('bounce@example.com',)
+        with self.assertLogs('api.mail', level='WARNING'):
+            self.assertEqual(deliver_pending(connection=backend), (1, 1))
+        bad.refresh_from_db()
+        self.assertEqual((bad.status, bad.attempts), (OutboxEmail.PENDING, 1))
+        self.assertGreater(bad.next_attempt_at, timezone.now())
+        self.assertIn('mailbox unavailable', bad.last_error)
+        self.assertEqual(OutboxEmail.objects.get(pk=good.pk).status, OutboxEmail.SENT)
+
+        # not due yet
+        self.assertEqual(deliver_pending(connection=backend), (0, 0))
+        OutboxEmail.objects.filter(pk=bad.pk).update(next_attempt_at=timezone.now())
+        with self.assertLogs('api.mail', level='ERROR'):
+            self.assertEqual(deliver_pending(max_attempts=2, connection=backend), (0, 1))
+        self.assertEqual(OutboxEmail.objects.get(pk=bad.pk).status, OutboxEmail.FAILED)
+
+    def test_a_claimed_email_is_not_claimed_again(self):
+        email = self.queue()
+        self.assertEqual([e.pk for e in claim_batch(10)], [email.pk])
+        self.assertEqual(claim_batch(10), [])
+        # until the lease runs out
+        OutboxEmail.objects.filter(pk=email.pk).update(next_attempt_at=timezone.now() - CLAIM_LEASE)
+        self.assertEqual([e.pk for e in claim_batch(10)], [email.pk])
+
+    def test_purge_drops_old_sent_and_failed_emails(self):
+        old = timezone.now() - datetime.timedelta(days=30)
+        sent, failed, recent, pending = self.queue(), self.queue(), self.queue(), self.queue()
+        OutboxEmail.objects.filter(pk=sent.pk).update(status=OutboxEmail.SENT, sent_at=old)
+        OutboxEmail.objects.filter(pk=failed.pk).update(status=OutboxEmail.FAILED, created=old)
+        OutboxEmail.objects.filter(pk=recent.pk).update(status=OutboxEmail.SENT, sent_at=timezone.now())
+        OutboxEmail.objects.filter(pk=pending.pk).update(created=old)
+        self.assertEqual(purge_outbox(), 2)
+        self.assertEqual(set(OutboxEmail.objects.values_list('pk', flat=True)), {recent.pk, pending.pk})
+
+    def test_command_delivers_the_queue(self):
+        for i in range(3):
+            self.queue(f'user{i}@example.com')
+        out = io.StringIO()
+        call_command('send_queued_mail', '--batch-size', '2', stdout=out)
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertIn('Done: 3 sent, 0 failed.', out.getvalue())
@@ -0,0 +1,213 @@
+"""
+Avatar variants (api/avatars.py) and serving MEDIA_ROOT (api/media.py).
+"""
+import io
+import shutil
+import tempfile
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from PIL import Image
+from rest_framework.test import APIClient
+
+from .avatars import FORMATS, SIZES, build_variants, render_variants, schedule_variants
+from .models import Profile, User
+
+
+def image_bytes(colour='red', size=(300, 200), fmt='PNG', mode='RGB'):
+    out = io.BytesIO()
+    Image.new(mode, size, colour).save(out, fmt)
+    return out.getvalue()
+
+
+class MediaTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.alice = User.objects.create_user('alice', 'alice@example.com', 'pw-12345678')
+
+    def upload(self, profile, data, name='me.png'):
+        profile.avatar.save(name, SimpleUploadedFile(name, data), save=True)
+        return profile
+
+
+class SyncThread:
+    """Stands in for threading.Thread: runs the target on start()."""
+    created = []
+
+    def __init__(self, target, name=None, daemon=None):
+        self.target, self.name, self.daemon = target, name, daemon
+        SyncThread.created.append(self)
+
+    def start(self):
+        self.target()
+
+
+class AvatarVariantTests(MediaTestCase):
+
+    def test_every_size_in_every_format(self):
+        rendered = render_variants(io.BytesIO(image_bytes()))
+        self.assertEqual(set(rendered), set(SIZES))
+        for size, edge in SIZES.items():
+            self.assertEqual(set(rendered[size]), set(FORMATS))
+            for data in rendered[size].values():
+                self.assertEqual(Image.open(io.BytesIO(data)).size, (edge, edge))
+
+    def test_transparent_uploads_become_jpeg_on_white(self):
+        rendered = render_variants(io.BytesIO(image_bytes((0, 0, 0, 0), mode='RGBA')))
+        jpeg = Image.open(io.BytesIO(rendered['sm']['jpeg']))
+        self.assertEqual(jpeg.mode, 'RGB')
+        self.assertEqual(jpeg.getpixel((10, 10)), (255, 255, 255))
+
+    def test_variants_are_named_after_the_content(self):
+        profile = self.upload(self.alice.profile, image_bytes())
+        self.assertTrue(build_variants(profile))
+        profile.refresh_from_db()
+        path = profile.avatar_variants['md']['webp']
+        self.assertEqual(path, f'avatars/v/{profile.avatar_hash}-md.webp')
+        self.assertTrue(default_storage.exists(path))
+
+        bob = User.objects.create_user('bob', 'bob@example.com', 'pw-12345678')
+        twin = self.upload(bob.profile, image_bytes(), 'twin.png')
+        build_variants(twin)
+        self.assertEqual(Profile.objects.get(pk=twin.pk).avatar_variants, profile.avatar_variants)
+
+    def test_replaced_variants_are_deleted_once_unused(self):
+        profile = self.upload(self.alice.profile, image_bytes('red'))
+        build_variants(profile)
+        old = profile.avatar_variants['lg']['jpeg']
+        self.upload(profile, image_bytes('blue'), 'new.png')
+        build_variants(profile)
+        self.assertFalse(default_storage.exists(old))
+        self.assertTrue(default_storage.exists(profile.avatar_variants['lg']['jpeg']))
+
+    def test_a_stale_build_records_nothing(self):
+        profile = self.upload(self.alice.profile, image_bytes())
+        Profile.objects.filter(pk=profile.pk).update(avatar='avatars/other.png')
+        self.assertFalse(build_variants(profile))
+        self.assertEqual(Profile.objects.get(pk=profile.pk).avatar_variants, {})
+
+    def test_scheduled_after_commit_in_a_thread_that_cleans_up(self):
+        profile = self.upload(self.alice.profile, image_bytes())
+        SyncThread.created = []
+        with mock.patch('api.avatars.threading.Thread', SyncThread), \
+             mock.patch('api.avatars.connection') as connection:
+            with self.captureOnCommitCallbacks(execute=True) as callbacks:
+                schedule_variants(profile)
+                self.assertEqual(SyncThread.created, [])
+        self.assertEqual(len(callbacks), 1)
+        thread, = SyncThread.created
+        self.assertFalse(thread.daemon)
+        connection.close.assert_called_once_with()
+        self.assertEqual(set(Profile.objects.get(pk=profile.pk).avatar_variants), set(SIZES))
+
+    def test_a_failed_build_still_closes_the_connection(self):
+        profile = self.upload(self.alice.profile, b'not an image')
+        with mock.patch('api.avatars.threading.Thread', SyncThread), \
+             mock.patch('api.avatars.connection') as connection, \
+             self.assertLogs('api.avatars', level='ERROR'):
+            with self.captureOnCommitCallbacks(execute=True):
+                schedule_variants(profile)
+        connection.close.assert_called_once_with()
+
+    def test_profile_upload_builds_the_variants(self):
+        client = APIClient()
+        client.force_authenticate(self.alice)
+        with mock.patch('api.avatars.threading.Thread', SyncThread), \
+             mock.patch('api.avatars.connection'):
+            with self.captureOnCommitCallbacks(execute=True):
+                response = client.put('/api/profile/', {
+                    'avatar': SimpleUploadedFile('me.png', image_bytes(), content_type='image/png'),
+                }, format='multipart')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(Profile.objects.get(user=self.alice).avatar_variants), set(SIZES))
+
+
+class MediaServingTests(MediaTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.body = bytes(range(256)) * 4
+        default_storage.save('avatars/file.bin', io.BytesIO(self.body))
+        default_storage.save('avatars/v/abc-sm.webp', io.BytesIO(b'variant'))
+        self.url = '/media/avatars/file.bin'
+
+    def get(self, url=None, **headers):
+        return self.client.get(url or self.url, **headers)
+
+    def content(self, response):
+        return b''.join(response.streaming_content) if response.streaming else response.content
+
+    def test_whole_file_with_validators(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.content(response), self.body)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(response['X-Content-Type-Options'], 'nosniff')
+        self.assertIn('max-age=3600', response['Cache-Control'])
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    def test_variants_are_immutable(self):
+        response = self.get('/media/avatars/v/abc-sm.webp')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertIn('max-age=31536000', response['Cache-Control'])
+
+    def test_byte_ranges(self):
+        cases = {
+            'bytes=0-9':     (0, 9),
+            'bytes=1000-':   (1000, 1023),
+            'bytes=-24':     (1000, 1023),
+            'bytes=-5000':   (0, 1023),
+            'bytes=10-5000': (10, 1023),
+        }
+        for header, (start, end) in cases.items():
+            with self.subTest(header):
+                response = self.get(HTTP_RANGE=header)
+                self.assertEqual(response.status_code, 206)
+                self.assertEqual(response['Content-Range'], f'bytes {start}-{end}/1024')
+                self.assertEqual(response['Content-Length'], str(end - start + 1))
+                self.assertEqual(self.content(response), self.body[start:end + 1])
+
+    def test_unsatisfiable_ranges(self):
+        for header in ('bytes=1024-', 'bytes=5000-6000', 'bytes=-0'):
+            with self.subTest(header):
+                response = self.get(HTTP_RANGE=header)
+                self.assertEqual(response.status_code, 416)
+                self.assertEqual(response['Content-Range'], 'bytes */1024')
+
+    def test_ranges_that_are_ignored(self):
+        for header in ('bytes=9-3', 'bytes=0-1,5-6', 'items=0-1', 'bytes=-'):
+            with self.subTest(header):
+                response = self.get(HTTP_RANGE=header)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(self.content(response), self.body)
+
+    def test_if_range(self):
+        etag = self.get()['ETag']
+        self.assertEqual(self.get(HTTP_RANGE='bytes=0-1', HTTP_IF_RANGE=etag).status_code, 206)
+        self.assertEqual(self.get(HTTP_RANGE='bytes=0-1', HTTP_IF_RANGE='"stale"').status_code, 200)
+
+    def test_missing_and_escaping_paths(self):
+        for url in ('/media/avatars/nope.png', '/media/../manage.py', '/media/avatars/'):
+            with self.subTest(url):
+                self.assertEqual(self.get(url).status_code, 404)
+        self.assertEqual(self.client.post(self.url).status_code, 405)
+
+    @override_settings(MEDIA_ACCEL='nginx', MEDIA_ACCEL_PREFIX='/protected-media/')
+    def test_nginx_sends_the_body(self):
+        response = self.get()
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/avatars/file.bin')
+        self.assertEqual(response.content, b'')
+
+    @override_settings(MEDIA_ACCEL='apache')
+    def test_apache_sends_the_body(self):
+        response = self.get()
+        self.assertTrue(response['X-Sendfile'].endswith('avatars/file.bin'))
@@ -0,0 +1,292 @@
+"""
+The message list: its polling sync modes, keyset history pages and the
+rows it renders.
+"""
+import datetime
+import io
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from .archive import archive_messages, unpack
+from .balances import record_expense
+from .models import Expense, Group, Message, MessageArchive, Profile
+from .search import search_group_messages
+from .testing import FlatTestCase
+from .views import MessageViewSet
+
+
+class MessageListTestCase(FlatTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.start = timezone.now() - datetime.timedelta(days=1)
+
+    def post_messages(self, count, group=None, start=None):
+        """`count` messages a minute apart, alternating senders."""
+        start = start or self.start
+        return [
+            Message.objects.create(
+                group=group or self.group,
+                sender=(self.alice, self.bob)[i % 2],
+                text=f"message {i}",
+                ts=start + datetime.timedelta(minutes=i),
+            )
+            for i in range(count)
+        ]
+
+    def get(self, **params):
+        return self.client.get('/api/messages/', {'group': self.group.pk, **params})
+
+    def ids(self, response):
+        rows = response.data['results'] if isinstance(response.data, dict) else response.data
+        return [row['id'] for row in rows]
+
+    def walk(self, response, link):
+        """Follow `link` ('next' or 'previous') to the end; ids page by page."""
+        pages = [self.ids(response)]
+        while response.data[link]:
+            response = self.client.get(response.data[link])
+            self.assertEqual(response.status_code, 200)
+            pages.append(self.ids(response))
+        return pages
+
+
+class SyncModeTests(MessageListTestCase):
+
+    def test_plain_list_is_the_whole_history_oldest_first(self):
+        messages = self.post_messages(5)
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.ids(response), [m.pk for m in messages])
+
+    def test_after_id_returns_only_newer_messages(self):
+        messages = self.post_messages(5)
+        self.assertEqual(self.ids(self.get(after_id=messages[2].pk)), [m.pk for m in messages[3:]])
+        self.assertEqual(self.ids(self.get(after_id=messages[-1].pk)), [])
+        # 0 means "from the very start"
+        self.assertEqual(len(self.ids(self.get(after_id=0))), 5)
+
+    def test_since_is_an_alias_for_after_id(self):
+        messages = self.post_messages(3)
+        self.assertEqual(self.ids(self.get(since=messages[0].pk)), [m.pk for m in messages[1:]])
+
+    def test_latest_returns_the_newest_n_oldest_first(self):
+        messages = self.post_messages(6)
+        self.assertEqual(self.ids(self.get(latest=2)), [m.pk for m in messages[-2:]])
+
+    def test_latest_is_capped(self):
+        self.post_messages(3)
+        with mock.patch.object(MessageViewSet, 'max_latest', 2):
+            self.assertEqual(len(self.ids(self.get(latest=50))), 2)
+
+    def test_other_groups_do_not_leak_in(self):
+        other = Group.objects.create(name='other', owner=self.alice)
+        other.members.add(self.alice)
+        self.post_messages(2, group=other)
+        mine = self.post_messages(2)
+        self.assertEqual(self.ids(self.get(after_id=0)), [m.pk for m in mine])
+
+    def test_malformed_group_ids_are_no_group(self):
+        self.post_messages(2)
+        for group in ('²', 'abc', ''):
+            with self.subTest(group):
+                response = self.client.get('/api/messages/', {'group': group})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(self.ids(response), [])
+
+    def test_bad_cursors_are_rejected(self):
+        for params in ({'after_id': 'abc'}, {'after_id': -1}, {'latest': 0}, {'latest': 'x'}):
+            with self.subTest(params):
+                self.assertEqual(self.get(**params).status_code, 400)
+
+
+class KeysetPageTests(MessageListTestCase):
+
+    def test_pages_walk_back_through_the_history(self):
+        messages = self.post_messages(5)
+        newest_first = [m.pk for m in reversed(messages)]
+        first = self.get(page_size=2)
+        self.assertIsNone(first.data['previous'])
+        pages = self.walk(first, 'next')
+        self.assertEqual(pages, [newest_first[0:2], newest_first[2:4], newest_first[4:5]])
+
+    def test_previous_walks_forward_again(self):
+        messages = self.post_messages(5)
+        newest_first = [m.pk for m in reversed(messages)]
+        page = self.get(page_size=2)
+        page = self.client.get(page.data['next'])
+        page = self.client.get(page.data['next'])
+        self.assertEqual(self.ids(page), newest_first[4:5])
+
+        back = self.client.get(page.data['previous'])
+        self.assertEqual(self.ids(back), newest_first[2:4])
+        back = self.client.get(back.data['previous'])
+        self.assertEqual(self.ids(back), newest_first[0:2])
+
+    def test_messages_sharing_a_timestamp_are_neither_skipped_nor_repeated(self):
+        same = self.start
+        messages = [
+            Message.objects.create(group=self.group, sender=self.bob, text=str(i), ts=same)
+            for i in range(5)
+        ]
+        pages = self.walk(self.get(page_size=2), 'next')
+        self.assertEqual(sum(pages, []), sorted((m.pk for m in messages), reverse=True))
+
+    def test_page_size_is_capped(self):
+        self.post_messages(3)
+        with mock.patch.object(MessageViewSet.pagination_class, 'max_page_size', 2):
+            self.assertEqual(len(self.ids(self.get(page_size=100))), 2)
+
+    def test_garbage_cursor_is_a_404(self):
+        self.post_messages(2)
+        for cursor in ('not-base64!', 'eyJ4IjoxfQ', 'W10'):
+            with self.subTest(cursor):
+                self.assertEqual(self.get(cursor=cursor).status_code, 404)
+
+    def test_expense_pages_are_newest_first(self):
+        expenses = []
+        for i in range(3):
+            expense = record_expense(Expense(group=self.group, paid_by=self.alice, amount=10 + i))
+            Expense.objects.filter(pk=expense.pk).update(created=self.start + datetime.timedelta(hours=i))
+            expenses.append(expense)
+        response = self.client.get('/api/expenses/', {'group': self.group.pk, 'page_size': 2})
+        pages = self.walk(response, 'next')
+        self.assertEqual(pages, [[expenses[2].pk, expenses[1].pk], [expenses[0].pk]])
+
+
+class MessageRowTests(MessageListTestCase):
+
+    def row(self, response, message):
+        return next(row for row in response.data if row['id'] == message.pk)
+
+    def test_sender_display_name_falls_back_to_username(self):
+        mine, bobs = self.post_messages(2)
+        response = self.get()
+        self.assertEqual(self.row(response, mine)['sender_name'], 'Alice Liddell')
+        self.assertEqual(self.row(response, mine)['sender_username'], 'alice')
+        self.assertEqual(self.row(response, bobs)['sender_name'], 'bob')
+
+    def test_avatar_is_the_small_variant(self):
+        Profile.objects.filter(user=self.bob).update(
+            avatar='avatars/bob.png',
+            avatar_variants={'sm': {'webp': 'avatars/v/abc-sm.webp', 'jpeg': 'avatars/v/abc-sm.jpeg'}},
+        )
+        _, bobs = self.post_messages(2)
+        self.assertEqual(self.row(self.get(), bobs)['avatar'], 'http://testserver/media/avatars/v/abc-sm.webp')
+        self.assertEqual(
+            self.row(self.get(avatar_format='jpeg'), bobs)['avatar'],
+            'http://testserver/media/avatars/v/abc-sm.jpeg',
+        )
+
+    def test_avatarless_and_deleted_senders(self):
+        mine, = self.post_messages(1)
+        orphan = Message.objects.create(group=self.group, sender=None, text="from a deleted account")
+        response = self.get()
+        self.assertIsNone(self.row(response, mine)['avatar'])
+        row = self.row(response, orphan)
+        self.assertEqual((row['sender'], row['sender_name'], row['avatar']), (None, None, None))
+
+    def test_queries_do_not_grow_with_the_page(self):
+        def count(n):
+            Message.objects.all().delete()
+            self.post_messages(n)
+            cache.clear()
+            with CaptureQueriesContext(connection) as ctx:
+                self.assertEqual(len(self.get().data), n)
+            return len(ctx)
+        self.assertEqual(count(2), count(20))
+
+
+class ArchiveTests(MessageListTestCase):
+
+    def setUp(self):
+        super().setUp()
+        # two messages a day from 1 January to 9 March
+        self.old = [
+            Message.objects.create(
+                group=self.group, sender=(self.alice, self.bob)[i % 2], text=f"old {i}",
+                ts=timezone.make_aware(datetime.datetime(2024, 1, 1, 9)) + datetime.timedelta(hours=12 * i),
+            )
+            for i in range(136)
+        ]
+        self.recent = self.post_messages(3)
+        self.cutoff = timezone.make_aware(datetime.datetime(2024, 6, 1))
+
+    def test_old_messages_move_into_monthly_chunks(self):
+        before = Group.objects.get(pk=self.group.pk).updated
+        self.assertEqual(archive_messages(self.cutoff), (136, 3))
+        self.assertEqual(list(Message.objects.values_list('pk', flat=True).order_by('pk')),
+                         [m.pk for m in self.recent])
+        chunks = MessageArchive.objects.filter(group=self.group).order_by('month')
+        self.assertEqual([(c.month.isoformat(), c.count) for c in chunks],
+                         [('2024-01-01', 62), ('2024-02-01', 58), ('2024-03-01', 16)])
+        self.assertEqual(chunks[0].first_ts, self.old[0].ts)
+        self.assertEqual([row[2] for row in unpack(chunks[2].data)][-1], 'old 135')
+        # the search index saw the deletes, and cached pages were invalidated
+        self.assertEqual(search_group_messages(self.group.pk, 'old', limit=5), [])
+        self.assertGreater(Group.objects.get(pk=self.group.pk).updated, before)
+
+    def test_a_later_run_merges_into_a_partly_archived_month(self):
+        archive_messages(self.old[40].ts)
+        self.assertEqual(MessageArchive.objects.get(month='2024-01-01').count, 40)
+        self.assertEqual(archive_messages(self.cutoff), (96, 3))
+        january = MessageArchive.objects.get(month='2024-01-01')
+        self.assertEqual(january.count, 62)
+        self.assertEqual([row[0] for row in unpack(january.data)], [m.pk for m in self.old[:62]])
+
+    def test_history_pages_walk_on_into_the_archive(self):
+        archive_messages(self.cutoff)
+        newest_first = [m.pk for m in reversed(self.old + self.recent)]
+        pages = self.walk(self.get(page_size=25), 'next')
+        # the first page straddles the table and the archive, later ones cross months
+        self.assertEqual(pages[0], newest_first[:25])
+        self.assertEqual(sum(pages, []), newest_first)
+        self.assertTrue(all(len(page) == 25 for page in pages[:-1]))
+
+    def test_previous_walks_back_out_of_the_archive(self):
+        archive_messages(self.cutoff)
+        newest_first = [m.pk for m in reversed(self.old + self.recent)]
+        page = self.get(page_size=30)
+        for _ in range(4):
+            page = self.client.get(page.data['next'])
+        self.assertEqual(self.ids(page), newest_first[120:139])
+        pages = self.walk(page, 'previous')
+        self.assertEqual(sum(reversed(pages), []), newest_first)
+
+    def test_the_plain_list_still_has_the_whole_history(self):
+        archive_messages(self.cutoff)
+        response = self.get()
+        self.assertEqual(self.ids(response), [m.pk for m in self.old + self.recent])
+        self.assertEqual(response.data[0]['sender_name'], 'Alice Liddell')
+        # the sync modes stay on recent messages
+        self.assertEqual(self.ids(self.get(after_id=0)), [m.pk for m in self.recent])
+        self.assertEqual(self.ids(self.get(latest=200)), [m.pk for m in self.recent])
+
+    def test_archived_rows_render_like_hot_ones(self):
+        archive_messages(self.cutoff)
+        self.bob.delete()
+        rows = self.client.get(self.get(page_size=3).data['next']).data['results']
+        by_text = {row['text']: row for row in rows}
+        # a deleted sender shows as unknown, as it does for hot rows
+        self.assertEqual((by_text['old 135']['sender'], by_text['old 135']['sender_name']), (None, None))
+        self.assertEqual(by_text['old 134']['sender_name'], 'Alice Liddell')
+        self.assertEqual(by_text['old 134']['ts'], self.old[134].ts.strftime('%Y-%m-%dT%H:%M:%SZ'))
+
+    def test_command(self):
+        out = io.StringIO()
+        call_command('archive_messages', '--days', '30', '--dry-run', stdout=out)
+        self.assertIn('Would archive 136 messages', out.getvalue())
+        self.assertFalse(MessageArchive.objects.exists())
+
+        other = Group.objects.create(name='other', owner=self.alice)
+        self.post_messages(1, group=other, start=self.cutoff)
+        call_command('archive_messages', '--days', '30', '--group', str(other.pk), stdout=out)
+        self.assertEqual(list(MessageArchive.objects.values_list('group', flat=True)), [other.pk])
+
+        with self.assertRaises(CommandError):
+            call_command('archive_messages', '--days', '0')
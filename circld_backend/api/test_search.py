@@ -0,0 +1,111 @@
+"""
+The full-text index over messages (api/message_fts.py) and search over it.
+"""
+from django.db import OperationalError, connection, migrations, models
+from django.db.migrations.loader import MigrationLoader
+from django.test import TestCase, TransactionTestCase
+
+from .message_fts import rebuilding_message_table
+from .models import Group, Message
+from .search import search_group_messages
+from .testing import FlatFixture
+
+
+def indexed(q, group=None):
+    """Ids of the messages the index matches for `q`."""
+    with connection.cursor() as cursor:
+        expression = f'text : "{q}"' if group is None else f'grp : g{group.pk} AND text : "{q}"'
+        cursor.execute("SELECT rowid FROM api_message_fts WHERE api_message_fts MATCH %s ORDER BY rowid",
+                       [expression])
+        return [row[0] for row in cursor.fetchall()]
+
+
+class SearchTestCase(FlatFixture):
+
+    def setUp(self):
+        super().setUp()
+        self.other = Group.objects.create(name='trip', owner=self.alice)
+
+    def say(self, text, group=None):
+        return Message.objects.create(group=group or self.group, sender=self.alice, text=text)
+
+
+class IndexSyncTests(SearchTestCase, TestCase):
+
+    def test_inserts_are_indexed_per_group(self):
+        here, there = self.say('dinner at eight'), self.say('dinner tomorrow', self.other)
+        self.assertEqual(indexed('dinner'), [here.pk, there.pk])
+        self.assertEqual(indexed('dinner', self.group), [here.pk])
+        self.assertEqual(indexed('eight'), [here.pk])
+
+    def test_edits_replace_the_old_text(self):
+        message = self.say('dinner at eight')
+        message.text = 'lunch at noon'
+        message.save()
+        self.assertEqual(indexed('dinner'), [])
+        self.assertEqual(indexed('lunch'), [message.pk])
+
+    def test_moving_a_message_moves_its_group_token(self):
+        message = self.say('dinner')
+        Message.objects.filter(pk=message.pk).update(group=self.other)
+        self.assertEqual(indexed('dinner', self.group), [])
+        self.assertEqual(indexed('dinner', self.other), [message.pk])
+
+    def test_deletes_and_bulk_writes(self):
+        keep, drop = self.say('dinner one'), self.say('dinner two')
+        drop.delete()
+        bulk = Message.objects.bulk_create([Message(group=self.group, text=f'dinner {i}') for i in range(3)])
+        self.assertEqual(indexed('dinner'), [keep.pk] + [m.pk for m in bulk])
+        self.group.delete()
+        self.assertEqual(indexed('dinner'), [])
+
+    def test_search_ranks_escapes_and_highlights(self):
+        marked = self.say('<b>dinner</b> is at eight')
+        short  = self.say('dinner')
+        self.say('dinner elsewhere', self.other)
+        results = dict(search_group_messages(self.group.pk, 'dinn', limit=10))
+        # bm25: the same match in a shorter message ranks higher
+        self.assertEqual(list(results), [short.pk, marked.pk])
+        self.assertEqual(results[marked.pk], '&lt;b&gt;<mark>dinner</mark>&lt;/b&gt; is at eight')
+        self.assertEqual(search_group_messages(self.group.pk, '"*:)', limit=10), [])
+
+
+class MessageTableRebuildTests(SearchTestCase, TransactionTestCase):
+    """Schema changes that make SQLite copy api_message to a new table."""
+
+    def setUp(self):
+        super().setUp()
+        self.old = Message._meta.get_field('text')
+        # a column type change always rebuilds the table
+        self.new = models.CharField(max_length=5000)
+        self.new.set_attributes_from_name('text')
+        self.new.model = Message
+
+    def test_an_unwrapped_rebuild_fails_and_changes_nothing(self):
+        message = self.say('dinner')
+        with self.assertRaisesMessage(OperationalError, 'api_message_fts_source'):
+            with connection.schema_editor() as editor:
+                editor.alter_field(Message, self.old, self.new)
+        self.assertEqual(indexed('dinner'), [message.pk])
+
+    def test_wrapped_alter_field_keeps_search_in_step(self):
+        before = self.say('dinner before')
+        migration = migrations.Migration('0999_rebuild', 'api')
+        migration.operations = rebuilding_message_table(
+            migrations.AlterField(model_name='message', name='text', field=models.CharField(max_length=5000)),
+        )
+        state = MigrationLoader(connection).project_state()
+        with connection.schema_editor() as editor:
+            migration.apply(state.clone(), editor)
+        try:
+            after = self.say('dinner after')
+            self.assertEqual(indexed('dinner'), [before.pk, after.pk])
+            after.text = 'lunch'
+            after.save()
+            self.assertEqual(indexed('dinner'), [before.pk])
+        finally:
+            with connection.schema_editor() as editor:
+                migration.unapply(state.clone(), editor)
+        self.assertEqual(indexed('lunch'), [after.pk])
+        self.say('dinner again')
+        self.assertEqual(len(indexed('dinner')), 2)
@@ -0,0 +1,63 @@
+"""
+Deployment settings: the opt-in SQLite production profile.
+"""
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from django.conf import settings
+from django.db.utils import ConnectionHandler
+from django.test import SimpleTestCase
+
+
+def settings_value(expression, **env):
+    """`expression` evaluated against a fresh settings import outside the test runner."""
+    environ = {**os.environ, 'DJANGO_SETTINGS_MODULE': 'circld_backend.settings'}
+    for name in ('SQLITE_PROFILE', 'DB_CONN_MAX_AGE'):
+        environ.pop(name, None)
+    environ.update(env)
+    code = f"from django.conf import settings; print(repr({expression}))"
+    result = subprocess.run([sys.executable, '-c', code], env=environ, capture_output=True, text=True,
+                            cwd=settings.BASE_DIR, check=True)
+    return result.stdout.strip()
+
+
+class SQLiteProfileTests(SimpleTestCase):
+    # the pragma test opens its own 'default' on a scratch file
+    databases = {'default'}
+
+    def test_off_by_default(self):
+        self.assertEqual(settings_value("settings.DATABASES['default'].get('OPTIONS', {})"), '{}')
+
+    def test_opt_in_keeps_per_request_connections(self):
+        self.assertEqual(
+            settings_value("settings.DATABASES['default']['CONN_MAX_AGE']", SQLITE_PROFILE='production'),
+            '0',
+        )
+
+    def test_pragmas_apply_to_every_connection(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        handler = ConnectionHandler({
+            'default': {
+                'ENGINE': 'django.db.backends.sqlite3',
+                'NAME': os.path.join(directory, 'profile.sqlite3'),
+                'OPTIONS': dict(settings.SQLITE_PRODUCTION_OPTIONS),
+            },
+        })
+        connection = handler['default']
+        self.addCleanup(connection.close)
+        with connection.cursor() as cursor:
+            pragmas = {}
+            for name in ('journal_mode', 'synchronous', 'busy_timeout', 'temp_store'):
+                cursor.execute(f'PRAGMA {name}')
+                pragmas[name] = cursor.fetchone()[0]
+        self.assertEqual(pragmas, {
+            'journal_mode': 'wal',
+            'synchronous':  1,   # NORMAL
+            'busy_timeout': settings.SQLITE_PRAGMAS['busy_timeout'],
+            'temp_store':   2,   # MEMORY
+        })
+        self.assertEqual(connection.transaction_mode, 'IMMEDIATE')
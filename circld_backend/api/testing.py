@@ -0,0 +1,49 @@
+# api/testing.py
+"""
+Fixtures shared by the api test modules: three users, a group called
+'flat' and an APIClient already logged in as alice.
+"""
+from django.core.cache import cache
+from django.test import TestCase
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .models import Group, User
+
+PASSWORD = 'pw-12345678'
+
+
+def access_token(user):
+    return str(RefreshToken.for_user(user).access_token)
+
+
+def api_client(user):
+    client = APIClient()
+    client.force_authenticate(user)
+    return client
+
+
+class FlatFixture:
+    """
+    setUp for TestCase or TransactionTestCase: alice (Alice Liddell), bob
+    and carol, the group 'flat' owned by alice with `flat_members` in it,
+    and self.client authenticated as alice. The caches start empty.
+    """
+    flat_members = ('alice', 'bob')
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.alice = User.objects.create_user('alice', 'alice@example.com', PASSWORD,
+                                              first_name='Alice', last_name='Liddell')
+        self.bob   = User.objects.create_user('bob', 'bob@example.com', PASSWORD)
+        self.carol = User.objects.create_user('carol', 'carol@example.com', PASSWORD)
+        self.group = Group.objects.create(name='flat', owner=self.alice)
+        self.group.members.add(*(getattr(self, name) for name in self.flat_members))
+        self.client = api_client(self.alice)
+
+    client_for = staticmethod(api_client)
+
+
+class FlatTestCase(FlatFixture, TestCase):
+    pass
@@ -1,3 +1,365 @@
+"""
+Query budgets for every endpoint in api/urls.py.
+
+Each test calls one endpoint against data sets of several sizes (members,
+groups, expenses and messages all grow together) and checks that the
+number of SQL queries
+
+  - stays within the endpoint's budget, and
+  - doesn't grow with the size of the data.
+
+A failure lists the count at each size and the query shapes (SQL with
+the literals replaced by ?) that repeat, which usually points straight
+at the serializer field or loop running one query per row.
+
+Requests are authenticated with force_authenticate, so the counts leave
+out the JWT user lookup, and the cache is cleared before each request so
+the membership and auth caches start cold.
+"""
+import itertools
+import re
+from collections import Counter
+from decimal import Decimal
+from types import SimpleNamespace
+
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.db.models import F
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from .balances import record_expense
+from .models import Expense, Group, GroupBalance, Message, Profile, User
+
+SIZES = (1, 4, 12)
+CATEGORIES = ('General', 'Food', 'Travel')
+
+
+def query_shape(sql):
+    """`sql` with literals and IN lists collapsed, so per-row queries look alike."""
+    sql = re.sub(r"'(?:[^']|'')*'", '?', sql)
+    sql = re.sub(r'(?<![\w"])-?\d+(?:\.\d+)?\b', '?', sql)
+    sql = re.sub(r'\(\s*\?(?:\s*,\s*\?)*\s*\)', '(…)', sql)
+    return re.sub(r'\s+', ' ', sql).strip()
+
+
+def budget_report(name, budget, runs):
+    """
+    Readable failure message from {size: [sql, …]}: counts per size, then
+    the query shapes that repeat at the largest size (marking the ones
+    that grew), or every query when the count is flat but over budget.
+    """
+    sizes  = sorted(runs)
+    small, large = sizes[0], sizes[-1]
+    counts = ', '.join(f"{size}→{len(runs[size])}" for size in sizes)
+    lines  = [f"{name}: {len(runs[large])} queries at size {large} (budget {budget}); by size: {counts}"]
+
+    before = Counter(query_shape(sql) for sql in runs[small])
+    after  = Counter(query_shape(sql) for sql in runs[large])
+    repeated = [(n, shape) for shape, n in after.most_common() if n > 1]
+    if repeated:
+        lines.append(f"repeated query shapes at size {large}:")
+        for n, shape in repeated:
+            grew = f"  (×{before[shape]} at size {small})" if n > before[shape] else ''
+            lines.append(f"  {n:>3}× {shape}{grew}")
+    if len(runs[large]) == len(runs[small]):
+        lines.append(f"queries at size {large}:")
+        lines.extend(f"  {i:>3}. {sql}" for i, sql in enumerate(runs[large], start=1))
+    return '\n'.join(lines)
+
+
+class QueryBudgetTestCase(TestCase):
+    sizes = SIZES
+    _worlds = itertools.count(1)
+
+    def build_world(self, n):
+        """
+        Me, n other people and a group we're all in, plus a side group
+        with each of them (theirs, with a message in it), n expenses split
+        between everyone in the main group and n messages there from
+        rotating senders. Everybody has an avatar.
+        """
+        tag = next(self._worlds)
+
+        def person(name):
+            return User.objects.create_user(
+                f"{name}{tag}", f"{name}{tag}@example.com", 'pw-12345678',
+                first_name=name.title(), last_name=f"W{tag}",
+            )
+
+        me = person('me')
+        others = [person(f"m{i}x") for i in range(n)]
+        people = [me, *others]
+        Profile.objects.filter(user__in=people).update(avatar='avatars/test.png')
+
+        group = Group.objects.create(name=f"group {tag}", owner=me)
+        group.members.add(*people)
+        groups = [group]
+        for other in others:
+            side = Group.objects.create(name=f"side {tag}/{other.pk}", owner=other)
+            side.members.add(me, other)
+            Message.objects.create(group=side, sender=other, text="hello")
+            groups.append(side)
+
+        expenses = [
+            record_expense(
+                Expense(
+                    group=group,
+                    paid_by=people[i % len(people)],
+                    amount=Decimal('10.00') + i,
+                    note=f"expense {i}",
+                    category=CATEGORIES[i % len(CATEGORIES)],
+                ),
+                [p.pk for p in people],
+            )
+            for i in range(n)
+        ]
+        messages = [
+            Message.objects.create(group=group, sender=people[i % len(people)], text=f"dinner plans {i}")
+            for i in range(n)
+        ]
+        return SimpleNamespace(
+            n=n, tag=tag, me=me, others=others, people=people,
+            group=group, groups=groups, expenses=expenses, messages=messages,
+            outsider=person('out'),
+        )
+
+    def assertQueryBudget(self, budget, call, status=200, user='me', prepare=None):
+        """
+        Run `call(client, world)` once per size, authenticated as
+        world.<user> (None for anonymous), and check its query count.
+        `prepare(world)` runs first and isn't counted.
+        """
+        runs = {}
+        for size in self.sizes:
+            world = self.build_world(size)
+            if prepare is not None:
+                prepare(world)
+            client = APIClient()
+            if user is not None:
+                # a fresh row, as token auth would hand the view, not one
+                # with build_world's profile cached on it
+                client.force_authenticate(User.objects.get(pk=getattr(world, user).pk))
+            cache.clear()
+            with CaptureQueriesContext(connection) as ctx:
+                response = call(client, world)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+            self.assertEqual(
+                response.status_code, status,
+                f"size {size}: {getattr(response, 'data', response)}",
+            )
+            runs[size] = [q['sql'] for q in ctx.captured_queries]
+
+        counts = {len(sqls) for sqls in runs.values()}
+        if len(counts) > 1 or max(counts) > budget:
+            self.fail(budget_report(self.id(), budget, runs))
+
+
+class UserEndpointTests(QueryBudgetTestCase):
+
+    def test_list(self):
+        self.assertQueryBudget(1, lambda c, w: c.get('/api/users/'))
+
+    def test_retrieve(self):
+        self.assertQueryBudget(1, lambda c, w: c.get(f'/api/users/{w.others[0].pk}/'))
+
+
+class GroupEndpointTests(QueryBudgetTestCase):
+
+    def test_list(self):
+        self.assertQueryBudget(2, lambda c, w: c.get('/api/groups/'))
+
+    def test_list_by_activity(self):
+        self.assertQueryBudget(2, lambda c, w: c.get('/api/groups/?ordering=activity'))
+
+    def test_create(self):
+        self.assertQueryBudget(9, lambda c, w: c.post('/api/groups/', {
+            'name': 'new', 'members': [p.pk for p in w.people],
+        }, format='json'), status=201)
+
+    def test_retrieve(self):
+        self.assertQueryBudget(4, lambda c, w: c.get(f'/api/groups/{w.group.pk}/'))
+
+    def test_partial_update(self):
+        self.assertQueryBudget(6, lambda c, w: c.patch(
+            f'/api/groups/{w.group.pk}/', {'name': 'renamed'}, format='json'))
+
+    def test_destroy(self):
+        self.assertQueryBudget(14, lambda c, w: c.delete(f'/api/groups/{w.group.pk}/'), status=204)
+
+    def test_members(self):
+        self.assertQueryBudget(4, lambda c, w: c.get(f'/api/groups/{w.group.pk}/members/'))
+
+    def test_balances(self):
+        self.assertQueryBudget(3, lambda c, w: c.get(f'/api/groups/{w.group.pk}/balances/'))
+
+    def test_analytics(self):
+        self.assertQueryBudget(4, lambda c, w: c.get(
+            f'/api/groups/{w.group.pk}/analytics/?by=month,category,payer'))
+
+    def test_settle_up(self):
+        self.assertQueryBudget(3, lambda c, w: c.get(f'/api/groups/{w.group.pk}/settle-up/'))
+
+    def test_unread(self):
+        self.assertQueryBudget(1, lambda c, w: c.get('/api/groups/unread/'))
+
+    def test_mark_read(self):
+        self.assertQueryBudget(4, lambda c, w: c.post('/api/groups/mark-read/', {
+            'markers': [{'group': g.pk} for g in w.groups],
+        }, format='json'))
+
+    def test_join(self):
+        self.assertQueryBudget(6, lambda c, w: c.post(
+            '/api/groups/join/', {'invite_code': w.group.invite_code}, format='json'), user='outsider')
+
+    def test_leave(self):
+        self.assertQueryBudget(9, lambda c, w: c.post(f'/api/groups/{w.group.pk}/leave/'))
+
+    def test_remove_member(self):
+        self.assertQueryBudget(5, lambda c, w: c.post(
+            f'/api/groups/{w.group.pk}/remove_member/', {'user_id': w.others[0].pk}, format='json'), status=204)
+
+    def test_rename(self):
+        self.assertQueryBudget(5, lambda c, w: c.patch(
+            f'/api/groups/{w.group.pk}/rename/', {'name': 'renamed'}, format='json'))
+
+
+class ExpenseEndpointTests(QueryBudgetTestCase):
+
+    def test_list(self):
+        self.assertQueryBudget(3, lambda c, w: c.get(f'/api/expenses/?group={w.group.pk}'))
+
+    def test_list_page(self):
+        self.assertQueryBudget(3, lambda c, w: c.get(f'/api/expenses/?group={w.group.pk}&page_size=50'))
+
+    def test_create(self):
+        self.assertQueryBudget(19, lambda c, w: c.post('/api/expenses/', {
+            'group': w.group.pk, 'amount': '30.00', 'note': 'taxi',
+            'split_between': [p.pk for p in w.people],
+        }, format='json'), status=201)
+
+    def test_retrieve(self):
+        self.assertQueryBudget(3, lambda c, w: c.get(f'/api/expenses/{w.expenses[0].pk}/'))
+
+    def test_partial_update(self):
+        self.assertQueryBudget(22, lambda c, w: c.patch(
+            f'/api/expenses/{w.expenses[0].pk}/', {'amount': '99.00'}, format='json'))
+
+    def test_destroy(self):
+        self.assertQueryBudget(15, lambda c, w: c.delete(f'/api/expenses/{w.expenses[0].pk}/'), status=204)
+
+    def test_import(self):
+        def upload(c, w):
+            rows = ["date,amount,category,paid_by,split_between"]
+            names = ';'.join(p.username for p in w.people)
+            rows += [f"2024-0{1 + i % 9}-10,{5 + i}.50,Food,{w.people[i % len(w.people)].username},{names}"
+                     for i in range(w.n)]
+            file = SimpleUploadedFile('expenses.csv', "\n".join(rows).encode())
+            return c.post(f'/api/expenses/import/?group={w.group.pk}', {'file': file}, format='multipart')
+        self.assertQueryBudget(12, upload, status=201)
+
+    def test_export(self):
+        self.assertQueryBudget(5, lambda c, w: c.get(f'/api/expenses/export/?group={w.group.pk}&fmt=jsonl'))
+
+
+class MessageEndpointTests(QueryBudgetTestCase):
+
+    def test_list(self):
+        # + the group's archive chunks, which the full history includes
+        self.assertQueryBudget(4, lambda c, w: c.get(f'/api/messages/?group={w.group.pk}'))
+
+    def test_list_after_id(self):
+        self.assertQueryBudget(3, lambda c, w: c.get(f'/api/messages/?group={w.group.pk}&after_id=0'))
+
+    def test_list_latest(self):
+        self.assertQueryBudget(3, lambda c, w: c.get(f'/api/messages/?group={w.group.pk}&latest=50'))
+
+    def test_list_page(self):
+        self.assertQueryBudget(4, lambda c, w: c.get(f'/api/messages/?group={w.group.pk}&page_size=50'))
+
+    def test_search(self):
+        self.assertQueryBudget(3, lambda c, w: c.get(f'/api/messages/search/?group={w.group.pk}&q=dinner'))
+
+    def test_create(self):
+        self.assertQueryBudget(6, lambda c, w: c.post(
+            '/api/messages/', {'group': w.group.pk, 'text': 'on my way'}, format='json'), status=201)
+
+    def test_retrieve(self):
+        self.assertQueryBudget(2, lambda c, w: c.get(f'/api/messages/{w.messages[0].pk}/'))
+
+    def test_partial_update(self):
+        self.assertQueryBudget(4, lambda c, w: c.patch(
+            f'/api/messages/{w.messages[0].pk}/', {'text': 'edited'}, format='json'))
+
+    def test_destroy(self):
+        self.assertQueryBudget(4, lambda c, w: c.delete(f'/api/messages/{w.messages[0].pk}/'), status=204)
+
+
+class AccountEndpointTests(QueryBudgetTestCase):
+
+    def test_register(self):
+        self.assertQueryBudget(9, lambda c, w: c.post('/api/register/', {
+            'first_name': 'New', 'last_name': 'Person', 'username': f"new{w.tag}",
+            'email': f"new{w.tag}@example.com", 'password': 'pw-12345678', 'password2': 'pw-12345678',
+        }, format='json'), status=201, user=None)
+
+    def test_verify_code(self):
+        self.assertQueryBudget(
+            6,
+            lambda c, w: c.post('/api/verify-code/', {'email': w.outsider.email, 'code': '123456'}, format='json'),
+            user=None,
+            prepare=lambda w: Profile.objects.filter(user=w.outsider).update(email_token='123456'),
+        )
+
+    def test_resend_code(self):
+        self.assertQueryBudget(
+            5,
+            lambda c, w: c.post('/api/resend-code/', {'email': w.outsider.email}, format='json'),
+            user=None,
+            prepare=lambda w: User.objects.filter(pk=w.outsider.pk).update(is_active=False),
+        )
+
+    def test_profile(self):
+        self.assertQueryBudget(1, lambda c, w: c.get('/api/profile/'))
+
+    def test_profile_update(self):
+        self.assertQueryBudget(5, lambda c, w: c.put('/api/profile/', {'first_name': 'Renamed'}, format='multipart'))
+
+    def test_delete_account(self):
+        # only a settled-up account can be closed
+        self.assertQueryBudget(
+            32,
+            lambda c, w: c.delete('/api/profile/delete/'),
+            status=204,
+            prepare=lambda w: GroupBalance.objects.filter(user=w.me).update(owed=F('paid')),
+        )
+
+    def test_request_email_change(self):
+        self.assertQueryBudget(5, lambda c, w: c.post(
+            '/api/profile/request-email-change/', {'email': f"fresh{w.tag}@example.com"}, format='json'))
+
+    def test_verify_email_change(self):
+        self.assertQueryBudget(
+            5,
+            lambda c, w: c.post('/api/profile/verify-email-change/', {'code': '654321'}, format='json'),
+            prepare=lambda w: Profile.objects.filter(user=w.me).update(
+                email_token='654321', pending_email=f"fresh{w.tag}@example.com"),
+        )
+
+    def test_password_reset_request(self):
+        self.assertQueryBudget(6, lambda c, w: c.post(
+            '/api/auth/password-reset/request/', {'email': w.me.email}, format='json'), user=None)
 
-# Create your tests here.
+    def test_password_reset_confirm(self):
+        self.assertQueryBudget(
+            6,
+            lambda c, w: c.post('/api/auth/password-reset/confirm/', {
+                'email': w.me.email, 'token': '111111',
+                'new_password': 'another-pw-123', 'new_password2': 'another-pw-123',
+            }, format='json'),
+            user=None,
+            prepare=lambda w: Profile.objects.filter(user=w.me).update(email_token='111111'),
+        )
@@ -1,31 +1,63 @@
+import datetime
+from decimal import Decimal
+
 from django.shortcuts import render
-from django.db.models import Q
+from django.db.models import Count, DecimalField, F, Max, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Substr
 from rest_framework.response import Response
 from django.contrib.auth import get_user_model
 from rest_framework import viewsets, permissions, status, generics
 from django.shortcuts import get_object_or_404
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
 from rest_framework.decorators import action
-from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework.exceptions import ValidationError
+from rest_framework.utils.urls import replace_query_param
 
 from .permissions import IsGroupOwner
-from .models import Group, Expense, Message, Profile
+from .membership import GroupScopedMixin, IsGroupMember
+from .accounts import OpenBalance, delete_account
+from .archive import archived_page
+from .balances import EXACT_SETTLE_LIMIT, group_balances, remove_expense, settle_up
+from .conditional import ConditionalGetMixin, make_etag
+from .expense_io import (
+    FORMATS as EXPENSE_FORMATS,
+    ImportFailed,
+    detect_format,
+    export_rows,
+    import_expenses,
+    stream_async,
+    stream_csv,
+    stream_jsonl,
+)
+from .consumers import broadcast_message
+from .mail import queue_mail
+from .pagination import ExpenseCursorPagination, MessageCursorPagination
+from .search import search_group_messages, search_terms
+from .models import Group, Expense, ExpenseRollup, Message, Profile, ReadMarker
 from .serializers import (
     UserSerializer, 
     GroupSerializer, 
+    GroupSummarySerializer,
+    MarkReadSerializer,
+    UnreadCountSerializer,
     ExpenseSerializer, 
+    BalanceSerializer,
+    SpendBucketSerializer,
+    TransferSerializer,
     MessageSerializer, 
     SignupSerializer, 
     ProfileSerializer, 
     RequestEmailChangeSerializer,
     VerifyEmailChangeSerializer,
     RequestPasswordResetSerializer,
-    ConfirmPasswordResetSerializer
+    ConfirmPasswordResetSerializer,
+    VersionedTokenObtainPairSerializer,
     )
 from rest_framework.views import APIView
 import random
 from rest_framework import generics
 from django.conf import settings
-from django.core.mail import send_mail
 
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.parsers import MultiPartParser, FormParser
@@ -33,25 +65,100 @@ from rest_framework.parsers import MultiPartParser, FormParser
 User = get_user_model()
 
 class UserViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = User.objects.all()
+    queryset = User.objects.select_related('profile')
     serializer_class = UserSerializer
     permission_classes = [permissions.IsAuthenticated]
 
-class GroupViewSet(viewsets.ModelViewSet):
+class GroupViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     serializer_class    = GroupSerializer
     permission_classes  = [permissions.IsAuthenticated]
 
-    def get_queryset(self):
+    def visible_groups(self):
         me = self.request.user
-        return (
-            Group.objects
-                 .filter(
-                   Q(members=me)    # any group you’re a member of
-                   | Q(owner=me)    # or any group you created
+        # membership as an IN over the through table, so no join + DISTINCT
+        my_groups = Group.members.through.objects.filter(user=me).values('group')
+        return Group.objects.filter(
+            Q(pk__in=my_groups)   # any group you’re a member of
+            | Q(owner=me)         # or any group you created
+        )
+
+    def get_queryset(self):
+        if self.action == 'list':
+            return self.summary_queryset()
+        return self.visible_groups().prefetch_related('members')
+
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return GroupSummarySerializer
+        return super().get_serializer_class()
+
+    def summary_queryset(self):
+        """
+        The group list in a single query: the per-group summary columns
+        are correlated subqueries on top of visible_groups().
+
+        ?ordering=activity puts the groups with the newest messages first.
+        """
+        memberships = Group.members.through.objects
+        money = DecimalField(max_digits=12, decimal_places=2)
+
+        member_count = (
+            memberships.filter(group=OuterRef('pk'))
+                       .values('group')
+                       .annotate(n=Count('*'))
+                       .values('n')
+        )
+        last_message = Message.objects.filter(group=OuterRef('pk')).order_by('-ts', '-id')
+        # from the rollups rather than the balances, so expenses without a
+        # recorded payer still count
+        total_spend = (
+            ExpenseRollup.objects.filter(group=OuterRef('pk'))
+                                 .values('group')
+                                 .annotate(total=Sum('total'))
+                                 .values('total')
+        )
+
+        qs = (
+            self.visible_groups()
+                 .select_related('owner')
+                 .annotate(
+                   member_count=Coalesce(Subquery(member_count), Value(0)),
+                   last_message_text=Substr(Subquery(last_message.values('text')[:1]), 1, 120),
+                   last_message_sender=Subquery(last_message.values('sender__username')[:1]),
+                   last_message_ts=Subquery(last_message.values('ts')[:1]),
+                   total_spend=Coalesce(Subquery(total_spend, output_field=money), Value(0), output_field=money),
                  )
-                 .distinct()
-                 .prefetch_related('members')
         )
+        if self.request.query_params.get('ordering') == 'activity':
+            return qs.order_by(F('last_message_ts').desc(nulls_last=True), '-id')
+        return qs.order_by('id')
+
+    def list(self, request, *args, **kwargs):
+        """
+        GET /api/groups/  → 304 while none of my groups changed
+        """
+        stamps = list(self.visible_groups().order_by('pk').values_list('pk', 'updated'))
+        etag = make_etag('groups', request.user.pk, request.query_params.urlencode(), stamps)
+        # ETag only: leaving a group changes the list without moving any
+        # remaining group's `updated`, so a Last-Modified would go stale
+        return self.conditional_response(
+            request, etag, None,
+            lambda: super(GroupViewSet, self).list(request, *args, **kwargs),
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._conditional_detail(
+            request, kwargs['pk'],
+            lambda: super(GroupViewSet, self).retrieve(request, *args, **kwargs),
+        )
+
+    def _conditional_detail(self, request, pk, build):
+        updated = self.visible_groups().filter(pk=pk).values_list('updated', flat=True).first()
+        if updated is None:
+            # unknown / not mine: let the normal path produce the 404
+            return build()
+        etag = make_etag(self.action, request.user.pk, pk, updated)
+        return self.conditional_response(request, etag, updated, build)
 
     def perform_create(self, serializer):
         # pass the logged-in user in as owner
@@ -64,21 +171,207 @@ class GroupViewSet(viewsets.ModelViewSet):
         GET /api/groups/{pk}/members/
         returns all users in this group, including avatar & is_admin
         """
+        def build():
+            group = self.get_object()
+            # profiles come along in the same query for the avatar field
+            users = group.members.select_related('profile')
+
+            serializer = UserSerializer(
+                users,
+                many=True,
+                context={
+                  "request": request,
+                  # we already have the group, so hand over its owner directly
+                  "group_owner_id": group.owner_id,
+                }
+            )
+            return Response(serializer.data)
+
+        return self._conditional_detail(request, pk, build)
+
+    @action(detail=True, methods=['get'], url_path='balances')
+    def balances(self, request, pk=None):
+        """
+        GET /api/groups/{pk}/balances/
+        net balance per member: what they paid minus their shares
+        (positive → the group owes them); people who left with a balance
+        still open are listed too, with member false
+        """
         group = self.get_object()
-        users = group.members.all()
-
-        # pass both `request` (for URL-building) and `group_id`
-        ctx = {'request': request, 'group_id': group.id}
-        serializer = UserSerializer(
-            users,
-            many=True,
-            context={
-              "request": request,
-              # pass the group so the serializer knows who the owner is
-              "group_id": group.pk,
+        return Response(BalanceSerializer(group_balances(group), many=True).data)
+
+    ANALYTICS_DIMENSIONS = {
+        'month':    ('month',),
+        'category': ('category',),
+        'payer':    ('payer_id', 'payer__username'),
+    }
+
+    @action(detail=True, methods=['get'], url_path='analytics')
+    def analytics(self, request, pk=None):
+        """
+        GET /api/groups/{pk}/analytics/[?by=month,category,payer&from=YYYY-MM&to=YYYY-MM]
+        spend per bucket for charts (default by=month,category), summed
+        from the monthly rollups, so the cost follows the number of
+        buckets rather than the number of expenses; expenses without a
+        recorded payer come out under payer_id null
+        """
+        params = request.query_params
+        by = [d for d in params.get('by', 'month,category').split(',') if d]
+        unknown = [d for d in by if d not in self.ANALYTICS_DIMENSIONS]
+        if unknown or not by:
+            raise ValidationError({'by': [f"Choose from: {', '.join(self.ANALYTICS_DIMENSIONS)}."]})
+        start = self._month_param('from')
+        end   = self._month_param('to')
+
+        def build():
+            group  = self.get_object()
+            fields = [f for d in by for f in self.ANALYTICS_DIMENSIONS[d]]
+            rollups = ExpenseRollup.objects.filter(group=group)
+            if start:
+                rollups = rollups.filter(month__gte=start)
+            if end:
+                rollups = rollups.filter(month__lte=end)
+            buckets = list(
+                rollups.values(*fields)
+                       .annotate(total=Sum('total'), count=Sum('count'))
+                       .order_by(*fields)
+            )
+            for bucket in buckets:
+                if 'payer__username' in bucket:
+                    bucket['payer_username'] = bucket.pop('payer__username')
+            return Response({
+                'by':      by,
+                'from':    start.strftime('%Y-%m') if start else None,
+                'to':      end.strftime('%Y-%m') if end else None,
+                'total':   str(sum((b['total'] for b in buckets), Decimal('0.00'))),
+                'buckets': SpendBucketSerializer(buckets, many=True).data,
+            })
+
+        updated = self.visible_groups().filter(pk=pk).values_list('updated', flat=True).first()
+        if updated is None:
+            return build()
+        etag = make_etag('analytics', request.user.pk, pk, params.urlencode(), updated)
+        return self.conditional_response(request, etag, updated, build)
+
+    def _month_param(self, name):
+        value = self.request.query_params.get(name)
+        if not value:
+            return None
+        try:
+            return datetime.datetime.strptime(value, '%Y-%m').date()
+        except ValueError:
+            raise ValidationError({name: ["Use YYYY-MM."]})
+
+    @action(detail=True, methods=['get'], url_path='settle-up')
+    def settle(self, request, pk=None):
+        """
+        GET /api/groups/{pk}/settle-up/[?exact=1]
+        a short list of payer → payee transfers that zeroes every balance,
+        including those of people who left with one still open;
+        `exact=1` asks for the minimum number of transfers (small groups only)
+        """
+        group = self.get_object()
+        rows  = group_balances(group)
+        names = {row['user_id']: row['username'] for row in rows}
+
+        want_exact = request.query_params.get('exact', '').lower() in ('1', 'true', 'yes')
+        nonzero    = sum(1 for row in rows if row['balance'])
+        exact      = want_exact and nonzero <= EXACT_SETTLE_LIMIT
+
+        plan = settle_up(
+            {row['user_id']: row['balance'] for row in rows},
+            exact=exact,
+        )
+        transfers = [
+            {
+                'from_user':     debtor,
+                'from_username': names[debtor],
+                'to_user':       creditor,
+                'to_username':   names[creditor],
+                'amount':        amount,
             }
+            for debtor, creditor, amount in plan
+        ]
+        return Response({
+            'method':    'exact' if exact else 'greedy',
+            'transfers': TransferSerializer(transfers, many=True).data,
+        })
+
+    @action(detail=False, methods=['get'], url_path='unread')
+    def unread(self, request):
+        """
+        GET /api/groups/unread/
+        unread message counts (excluding my own messages) for all my
+        groups, in one query
+        """
+        me = request.user
+        marker = ReadMarker.objects.filter(group=OuterRef('pk'), user=me)
+        unread = (
+            Message.objects
+                   .filter(group=OuterRef('pk'), id__gt=OuterRef('last_read_message_id'))
+                   .exclude(sender=me)
+                   .values('group')
+                   .annotate(n=Count('*'))
+                   .values('n')
         )
-        return Response(serializer.data)
+        groups = (
+            self.visible_groups()
+                .annotate(last_read_message_id=Coalesce(
+                    Subquery(marker.values('last_read_message_id')[:1]), Value(0)))
+                .annotate(unread=Coalesce(Subquery(unread), Value(0)))
+                .order_by('id')
+                .values('id', 'unread', 'last_read_message_id')
+        )
+        return Response(UnreadCountSerializer(groups, many=True).data)
+
+    @action(detail=False, methods=['post'], url_path='mark-read')
+    def mark_read(self, request):
+        """
+        POST /api/groups/mark-read/
+             { "markers": [ { "group": 3, "message_id": 812 }, { "group": 5 } ] }
+        Moves my read markers forward (never back); a marker without a
+        message_id marks the whole group read.
+        """
+        serializer = MarkReadSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        wanted = {m['group']: m.get('message_id') for m in serializer.validated_data['markers']}
+
+        group_ids = set(self.visible_groups().filter(pk__in=wanted).values_list('pk', flat=True))
+        unknown = sorted(set(wanted) - group_ids)
+        if unknown:
+            return Response({'markers': [f"Unknown groups: {unknown}"]},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        newest = dict(
+            Message.objects.filter(group_id__in=group_ids)
+                           .values('group_id')
+                           .annotate(newest=Max('id'))
+                           .values_list('group_id', 'newest')
+        )
+        current = dict(
+            ReadMarker.objects.filter(user=request.user, group_id__in=group_ids)
+                              .values_list('group_id', 'last_read_message_id')
+        )
+        markers = []
+        for gid in group_ids:
+            target = newest.get(gid, 0)
+            if wanted[gid] is not None:
+                target = min(wanted[gid], target)
+            markers.append(ReadMarker(
+                group_id=gid,
+                user=request.user,
+                last_read_message_id=max(target, current.get(gid, 0)),
+            ))
+        ReadMarker.objects.bulk_create(
+            markers,
+            update_conflicts=True,
+            unique_fields=['group', 'user'],
+            update_fields=['last_read_message_id', 'updated'],
+        )
+        return Response([
+            {'group': m.group_id, 'last_read_message_id': m.last_read_message_id}
+            for m in sorted(markers, key=lambda m: m.group_id)
+        ])
 
     @action(detail=False, methods=['post'], url_path='join')
     def join_group(self, request):
@@ -107,6 +400,7 @@ class GroupViewSet(viewsets.ModelViewSet):
           auto-promote the next member as owner.
         - If they were the last member, delete the group.
         - Otherwise just remove them from members.
+        An open balance stays on the group's ledger (see group_balances).
         """
         group = self.get_object()
         me    = request.user
@@ -137,7 +431,7 @@ class GroupViewSet(viewsets.ModelViewSet):
     def remove_member(self, request, pk=None):
         """
         POST /api/groups/{pk}/remove_member/   { "user_id": 42 }
-        Owner-only!
+        Owner-only! Their open balance stays on the group's ledger.
         """
         group = self.get_object()
         uid   = request.data.get('user_id')
@@ -169,34 +463,228 @@ class GroupViewSet(viewsets.ModelViewSet):
         group.save()
         return Response(self.get_serializer(group).data)
 
-class ExpenseViewSet(viewsets.ModelViewSet):
+class ExpenseViewSet(GroupScopedMixin, viewsets.ModelViewSet):
     serializer_class = ExpenseSerializer
-    permission_classes = [permissions.IsAuthenticated]
+    permission_classes = [permissions.IsAuthenticated, IsGroupMember]
+    pagination_class = ExpenseCursorPagination
 
     def get_queryset(self):
-        group_id = self.request.query_params.get('group')
         # only fetch expenses for that group
-        return Expense.objects.filter(group_id=group_id).order_by('-created')
+        return (
+            self.scope_to_group(Expense.objects.all())
+                   .select_related('paid_by')
+                   .prefetch_related('shares')
+                   .order_by('-created')
+        )
 
     def perform_create(self, serializer):
         # automatically set paid_by to the authenticated user
         serializer.save(paid_by=self.request.user)
 
+    def perform_destroy(self, instance):
+        # keeps the group's running balances in step
+        remove_expense(instance)
+
+    @action(detail=False, methods=['post'], url_path='import')
+    def import_expenses(self, request):
+        """
+        POST /api/expenses/import/?group=<id>   multipart `file` (.csv or .jsonl)
+        → 201 {"imported": n}, or 400 with the bad rows and nothing imported
+        """
+        group  = get_object_or_404(Group, pk=self.group_param())
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({'file': ['This field is required.']},
+                            status=status.HTTP_400_BAD_REQUEST)
+        # ?fmt= overrides the extension (DRF reserves ?format= for renderers)
+        fmt = detect_format(upload.name, request.query_params.get('fmt'))
+        if fmt is None:
+            return Response({'fmt': [f"Use one of: {', '.join(EXPENSE_FORMATS)}."]},
+                            status=status.HTTP_400_BAD_REQUEST)
+        try:
+            imported = import_expenses(group, upload, fmt, request.user)
+        except UnicodeDecodeError:
+            return Response({'file': ['The file must be UTF-8 text.']},
+                            status=status.HTTP_400_BAD_REQUEST)
+        except ImportFailed as exc:
+            return Response({'error_count': exc.error_count, 'errors': exc.errors},
+                            status=status.HTTP_400_BAD_REQUEST)
+        return Response({'imported': imported}, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=['get'], url_path='export')
+    def export_expenses(self, request):
+        """
+        GET /api/expenses/export/?group=<id>&fmt=csv|jsonl
+        Streams every expense, oldest first, as a download, a chunk of
+        rows at a time under both WSGI and ASGI.
+        """
+        group = get_object_or_404(Group, pk=self.group_param())
+        fmt   = request.query_params.get('fmt', 'csv')
+        if fmt not in EXPENSE_FORMATS:
+            return Response({'fmt': [f"Use one of: {', '.join(EXPENSE_FORMATS)}."]},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if fmt == 'csv':
+            lines, content_type = stream_csv(export_rows(group)), 'text/csv; charset=utf-8'
+        else:
+            lines, content_type = stream_jsonl(export_rows(group)), 'application/x-ndjson'
+        # under ASGI a sync iterator would be read into memory whole first
+        if isinstance(request._request, ASGIRequest):
+            lines = stream_async(lines)
+        response = StreamingHttpResponse(lines, content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="group-{group.pk}-expenses.{fmt}"'
+        return response
 
-class MessageViewSet(viewsets.ModelViewSet):
+
+class MessageViewSet(GroupScopedMixin, ConditionalGetMixin, viewsets.ModelViewSet):
     serializer_class   = MessageSerializer
-    permission_classes = [permissions.IsAuthenticated]
+    permission_classes = [permissions.IsAuthenticated, IsGroupMember]
+    pagination_class   = MessageCursorPagination
+
+    # upper bound for ?latest=N so a bootstrap can't pull the whole history
+    max_latest = 500
+    SYNC_PARAMS = ('after_id', 'since', 'latest')
 
     def get_queryset(self):
-        group_id = self.request.query_params.get('group')
-        if not group_id:
-            # you might want to raise an error here instead
-            return Message.objects.none()
+        """
+        GET /api/messages/?group=<id>                 → full history (legacy), archived
+                                                        months included (see full_history)
+        GET /api/messages/?group=<id>&after_id=<id>   → only messages newer than <id>
+                                                        (`since` is accepted as an alias)
+        GET /api/messages/?group=<id>&latest=<n>      → the newest <n> messages
+
+        Results are always oldest → newest, so a polling client can append
+        them and remember the last id it saw as its next cursor.
+
+        Passing `cursor`/`page_size` switches to keyset pages instead,
+        newest → oldest, with `next` walking back through the history,
+        archived months included (see archived_messages).
+        """
+        qs = self.scope_to_group(Message.objects.all())
+
+        # only the list endpoint understands the sync cursors
+        if self.action != 'list':
+            return qs.select_related('sender__profile').order_by('ts', 'id')
+
+        params   = self.request.query_params
+        after_id = params.get('after_id') or params.get('since')
+        latest   = params.get('latest')
+
+        if after_id:
+            qs = qs.filter(id__gt=self._positive_int('after_id', after_id, allow_zero=True))
+        if latest:
+            n = min(self._positive_int('latest', latest), self.max_latest)
+            newest = qs.order_by('-ts', '-id').values('id')[:n]
+            qs = Message.objects.filter(id__in=newest)
+
+        return qs.select_related('sender__profile').order_by('ts', 'id')
+
+    def list(self, request, *args, **kwargs):
+        """
+        GET /api/messages/?group=<id>…  → 304 while the group is unchanged
+        """
+        group_id = self.group_param()
+        updated = (
+            Group.objects.filter(pk=group_id).values_list('updated', flat=True).first()
+            if group_id is not None else None
+        )
+        if self.wants_full_history():
+            build = lambda: self.full_history(group_id)
+        else:
+            build = lambda: super(MessageViewSet, self).list(request, *args, **kwargs)
+        if updated is None:
+            return build()
+        etag = make_etag('messages', request.user.pk, request.query_params.urlencode(), updated)
+        return self.conditional_response(request, etag, updated, build)
+
+    def wants_full_history(self):
+        params = self.request.query_params
+        paging = self.paginator
         return (
-            Message.objects
-                   .filter(group_id=group_id)
-                   .order_by('ts')
+            self.group_param() is not None
+            and not any(params.get(name) for name in self.SYNC_PARAMS)
+            and paging.cursor_query_param not in params
+            and paging.page_size_query_param not in params
+        )
+
+    def full_history(self, group_id):
+        """
+        The plain list without sync cursors: every archived month, then the
+        hot table, oldest first. It unpacks the whole archive, so the 304
+        above matters; cursor/page_size pages reach old history a page at
+        a time.
+        """
+        hot = list(self.filter_queryset(self.get_queryset()))
+        # IsGroupMember has already vetted ?group=
+        older = archived_page(group_id, None, False, None)
+        return Response(self.get_serializer(older + hot, many=True).data)
+
+    def archived_messages(self, position, descending, limit):
+        """
+        Archived messages for MessageCursorPagination once a history walk
+        gets past the hot table; the sync modes (after_id, latest) only
+        ever deal in recent messages.
+        """
+        params = self.request.query_params
+        if any(params.get(name) for name in self.SYNC_PARAMS):
+            return []
+        group_id = self.group_param()
+        if group_id is None:
+            return []
+        # IsGroupMember has already vetted ?group=
+        return archived_page(group_id, position, descending, limit)
+
+    search_page_size     = 20
+    search_max_page_size = 50
+
+    @action(detail=False, methods=['get'], url_path='search')
+    def search(self, request):
+        """
+        GET /api/messages/search/?group=<id>&q=<words>[&page=<n>&page_size=<n>]
+
+        Best matches first, each with a `snippet` of escaped text where the
+        matching words are wrapped in <mark>. The last word also matches
+        as a prefix.
+        """
+        group_id = self.group_param()
+        if group_id is None:
+            raise ValidationError({'group': ["This field is required."]})
+        q = request.query_params.get('q', '')
+        if not search_terms(q):
+            raise ValidationError({'q': ["Enter at least one word to search for."]})
+
+        params    = request.query_params
+        page      = self._positive_int('page', params.get('page', 1))
+        page_size = min(
+            self._positive_int('page_size', params.get('page_size', self.search_page_size)),
+            self.search_max_page_size,
         )
+        # one extra row tells us whether there's a next page
+        hits = search_group_messages(group_id, q, page_size + 1, (page - 1) * page_size)
+        has_next, hits = len(hits) > page_size, hits[:page_size]
+
+        messages = Message.objects.select_related('sender__profile').in_bulk([pk for pk, _ in hits])
+        ordered  = [messages[pk] for pk, _ in hits if pk in messages]
+        snippets = dict(hits)
+        results  = self.get_serializer(ordered, many=True).data
+        for row in results:
+            row['snippet'] = snippets[row['id']]
+
+        url = request.build_absolute_uri()
+        return Response({
+            'next':     replace_query_param(url, 'page', page + 1) if has_next else None,
+            'previous': replace_query_param(url, 'page', page - 1) if page > 1 else None,
+            'results':  results,
+        })
+
+    @staticmethod
+    def _positive_int(name, value, allow_zero=False):
+        try:
+            n = int(value)
+        except (TypeError, ValueError):
+            raise ValidationError({name: ["A valid integer is required."]})
+        if n < 0 or (n == 0 and not allow_zero):
+            raise ValidationError({name: ["Must be a positive integer."]})
+        return n
 
     def perform_create(self, serializer):
         # 1) try body first, then fallback to query param
@@ -210,6 +698,8 @@ class MessageViewSet(viewsets.ModelViewSet):
             sender=self.request.user,
             group=group
         )
+        # push it to everyone connected to the group's chat socket
+        broadcast_message(serializer.data, group.pk)
 
 
 class SignupView(generics.GenericAPIView):
@@ -258,7 +748,7 @@ class VerifyCodeView(APIView):
         profile.save()
 
         # generate JWT tokens
-        refresh = RefreshToken.for_user(user)
+        refresh = VersionedTokenObtainPairSerializer.get_token(user)
 
         return Response({
             "message": "Email verified successfully! You can now log in.",
@@ -283,11 +773,11 @@ class ResendCodeView(APIView):
         code = f"{random.randint(0,999999):06d}"
         profile.email_token = code
         profile.save()
-        send_mail(
+        queue_mail(
             subject    = "Your new Circld verification code",
             message    = f"Your new code is {code}",
             from_email = settings.DEFAULT_FROM_EMAIL,
-            recipient_list=[email], fail_silently=False,
+            recipient_list=[email],
         )
         return Response({"message":"New code sent."})
 
@@ -318,7 +808,13 @@ class DeleteAccountView(APIView):
     permission_classes = [IsAuthenticated]
 
     def delete(self, request):
-        request.user.delete()
+        try:
+            delete_account(request.user)
+        except OpenBalance as exc:
+            return Response(
+                {"detail": str(exc), "groups": exc.groups},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 class RequestEmailChangeView(APIView):
@@ -336,12 +832,11 @@ class RequestEmailChangeView(APIView):
         profile.email_token   = code
         profile.save()
 
-        send_mail(
+        queue_mail(
             subject="Verify your new Circld email",
             message=f"Your verification code is {code}",
             from_email=settings.DEFAULT_FROM_EMAIL,
             recipient_list=[new_email],
-            fail_silently=False,
         )
         return Response(
             {"message": "Verification code sent to new address."},
@@ -398,12 +893,11 @@ class RequestPasswordResetView(APIView):
         profile.email_token = code
         profile.save()
 
-        send_mail(
+        queue_mail(
             subject="Your Circld password reset code",
             message=f"Your reset code is {code}",
             from_email=settings.DEFAULT_FROM_EMAIL,
             recipient_list=[email],
-            fail_silently=False,
         )
         return Response({"message": "Password reset code sent."})
 
@@ -431,12 +925,11 @@ class ConfirmPasswordResetView(APIView):
             profile.email_token = new_code
             profile.save()
 
-            send_mail(
+            queue_mail(
                 subject="Your new Circld password reset code",
                 message=f"Your new reset code is {new_code}",
                 from_email=settings.DEFAULT_FROM_EMAIL,
                 recipient_list=[email],
-                fail_silently=False,
             )
 
             return Response(
@@ -444,8 +937,9 @@ class ConfirmPasswordResetView(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        # Everything checks out → reset password
+        # Everything checks out → reset password and revoke old tokens
         user.set_password(pwd)
+        user.token_version += 1
         user.save()
         profile.email_token = ""
         profile.save()
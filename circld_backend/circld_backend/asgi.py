@@ -13,4 +13,18 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'circld_backend.settings')
 
-application = get_asgi_application()
+# Initialize Django before importing anything that touches models.
+django_asgi_app = get_asgi_application()
+
+from channels.routing import ProtocolTypeRouter, URLRouter
+
+from api.authentication import JWTAuthMiddleware
+from api.routing import websocket_urlpatterns
+
+# No origin validation on sockets: the mobile app doesn't send an Origin
+# header and every connection is authenticated by its JWT anyway.
+application = ProtocolTypeRouter({
+    'http': django_asgi_app,
+    'websocket': JWTAuthMiddleware(URLRouter(websocket_urlpatterns)),
+})
+
@@ -12,7 +12,9 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 import datetime
 import os
+import sys
 from pathlib import Path
+from django.core.exceptions import ImproperlyConfigured
 from dotenv import load_dotenv
 
 load_dotenv(Path(__file__).resolve().parent.parent / '.env')
@@ -20,6 +22,9 @@ load_dotenv(Path(__file__).resolve().parent.parent / '.env')
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+# `manage.py test`: no Redis, fast password hashing
+TESTING = 'test' in sys.argv
+
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.2/howto/deployment/checklist/
@@ -51,7 +56,9 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
+    'api.query_count.QueryCountMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'api.db_router.ReplicaRoutingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -65,6 +72,10 @@ MIDDLEWARE = [
 #   "http://localhost:8081",
 # ]
 CORS_ALLOW_ALL_ORIGINS = True
+# let browser clients read the X-Query-Count header (see api/query_count.py)
+CORS_EXPOSE_HEADERS = ['X-Query-Count']
+# per-request SQL statement count in an X-Query-Count header
+QUERY_COUNT_HEADER = os.environ.get('QUERY_COUNT_HEADER', str(DEBUG)).lower() in ('1', 'true', 'yes')
 
 
 CORS_ALLOW_CREDENTIALS = True
@@ -74,17 +85,54 @@ AUTH_USER_MODEL = 'api.User'
 REST_FRAMEWORK = {
   'DEFAULT_AUTHENTICATION_CLASSES': (
     'rest_framework.authentication.SessionAuthentication',
-    'rest_framework_simplejwt.authentication.JWTAuthentication',
+    'api.authentication.CachedJWTAuthentication',
   ),
 }
 
+# Redis carries the chat channel layer and the shared cache
+REDIS_URL = os.environ.get('REDIS_URL', 'redis://127.0.0.1:6379')
+
+# Authenticated users are cached briefly (see CachedJWTAuthentication).
+AUTH_USER_CACHE_TIMEOUT = 60
+# per-user sets of group ids (see api/membership.py)
+MEMBERSHIP_CACHE_TIMEOUT = 300
+# Those two and the replica pins (api/db_router.py) are invalidated by
+# whichever worker handles the write, so every process must share one
+# cache: Redis at REDIS_CACHE_URL, by default database 1 of REDIS_URL.
+# A per-process local-memory cache is only allowed for the test runner,
+# or for a single DEBUG process with LOCAL_CACHE=1.
+LOCAL_CACHE = TESTING or os.environ.get('LOCAL_CACHE') == '1'
+if LOCAL_CACHE and not (TESTING or DEBUG):
+    raise ImproperlyConfigured(
+        "LOCAL_CACHE=1 gives every worker its own cache, so revoked tokens and "
+        "membership changes wouldn't reach the others; it only works with DEBUG."
+    )
+if LOCAL_CACHE:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ.get('REDIS_CACHE_URL', f'{REDIS_URL}/1'),
+        },
+    }
+
 ASGI_APPLICATION = "circld_backend.asgi.application"
 CHANNEL_LAYERS = {
   "default": {
     "BACKEND": "channels_redis.core.RedisChannelLayer",
-    "CONFIG": { "hosts": [("127.0.0.1", 6379)] },
+    "CONFIG": { "hosts": [REDIS_URL] },
   },
 }
+# the test runner shouldn't need a Redis server
+if TESTING:
+    CHANNEL_LAYERS = {
+      "default": { "BACKEND": "channels.layers.InMemoryChannelLayer" },
+    }
 
 ROOT_URLCONF = 'circld_backend.urls'
 
@@ -109,12 +157,75 @@ WSGI_APPLICATION = 'circld_backend.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# SQLite production profile: WAL so polls never wait on a writer,
+# synchronous=NORMAL (safe under WAL), a busy timeout instead of instant
+# "database is locked", mmap'd reads and a bigger page cache, applied on
+# every connection. Write transactions start with BEGIN IMMEDIATE so they
+# take the write lock up front rather than failing to upgrade a read lock
+# halfway through. Opt in with SQLITE_PROFILE=production: WAL sticks to the
+# database file once set and keeps db.sqlite3-wal / -shm next to it, which
+# a development checkout doesn't want.
+SQLITE_PROFILE = os.environ.get('SQLITE_PROFILE', 'default')
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous':  'NORMAL',
+    'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000)),
+    'mmap_size':    int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),
+    # negative → KiB rather than pages
+    'cache_size':   -int(os.environ.get('SQLITE_CACHE_KB', 64 * 1024)),
+    'temp_store':   'MEMORY',
+}
+
+SQLITE_PRODUCTION_OPTIONS = {
+    'init_command': ';'.join(f'PRAGMA {k}={v}' for k, v in SQLITE_PRAGMAS.items()),
+    'transaction_mode': 'IMMEDIATE',
+    # seconds; the Python-level twin of busy_timeout
+    'timeout': SQLITE_PRAGMAS['busy_timeout'] / 1000,
+}
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'NAME': os.environ.get('SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
     }
 }
+if SQLITE_PROFILE == 'production':
+    DATABASES['default'].update({
+        # Under ASGI (daphne) requests run on changing threads, each with its
+        # own connection, so persistent connections pile up rather than get
+        # reused; keep the per-request default there. Raise it only for a
+        # WSGI deployment.
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 0)),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': dict(SQLITE_PRODUCTION_OPTIONS),
+    })
+
+# Read replicas (see api/db_router.py): DB_REPLICAS is a comma-separated
+# list of database files kept in sync with the primary out of band.
+# Tests mirror them onto the primary's test database.
+DATABASE_REPLICAS = []
+for n, path in enumerate(filter(None, os.environ.get('DB_REPLICAS', '').split(',')), start=1):
+    alias = f'replica{n}'
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        'NAME': path.strip(),
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(alias)
+# A second, separate database for the router tests (api/test_db_router.py),
+# so they can tell which side a read went to. Only created for tests
+# that ask for it.
+if TESTING:
+    DATABASES['replica_test'] = {
+        **DATABASES['default'],
+        'NAME': BASE_DIR / 'replica_test.sqlite3',
+    }
+DATABASE_ROUTERS = ['api.db_router.PrimaryReplicaRouter']
+# how long a client that just wrote keeps reading from the primary
+REPLICA_PIN_SECONDS = int(os.environ.get('REPLICA_PIN_SECONDS', 5))
+
+# chat older than this moves to the compressed archive (archive_messages)
+MESSAGE_ARCHIVE_AFTER_DAYS = int(os.environ.get('MESSAGE_ARCHIVE_AFTER_DAYS', 180))
 
 
 # Password validation
@@ -136,6 +247,11 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+# hashing is slow on purpose, and the test suite creates a lot of users
+if TESTING:
+    PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/5.2/topics/i18n/
 
@@ -161,6 +277,7 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': datetime.timedelta(days=15),
     'REFRESH_TOKEN_LIFETIME': datetime.timedelta(days=15),
+    'TOKEN_OBTAIN_SERIALIZER': 'api.serializers.VersionedTokenObtainPairSerializer',
 }
 
 AUTHENTICATION_BACKENDS = [
@@ -184,3 +301,9 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 
 MEDIA_URL  = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
+# Media is served by api.media.serve_media. Behind nginx/apache set
+# MEDIA_ACCEL=nginx|apache so the proxy sends the file bodies, e.g. for nginx:
+#   location /protected-media/ { internal; alias <MEDIA_ROOT>/; }
+MEDIA_ACCEL        = os.environ.get('MEDIA_ACCEL', '')
+MEDIA_ACCEL_PREFIX = os.environ.get('MEDIA_ACCEL_PREFIX', '/protected-media/')